@@ -0,0 +1,94 @@
+"""
+utils.helpers 文本工具基准测试
+
+分别测量(新旧实现输出一致性由 tests/test_helpers.py 覆盖):
+- 旧实现(每次调用编译/查找正则、18 次 replace、每次构造时区)
+- 新实现首次调用(未命中缓存)
+- 新实现重复调用(命中缓存，对应实际中反复出现的制作公司、标签和日期)
+
+    python -m benchmarks.bench_helpers
+"""
+import re
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import bench, load_sample_dict, print_results
+from utils import helpers
+
+
+def legacy_parse_emby_date(date_str):
+    if not date_str:
+        return "未知"
+    tz_utc8 = timezone(timedelta(hours=8))
+    try:
+        if '.' in date_str:
+            main_part, fraction = date_str.split('.')
+            if '+' in fraction:
+                fraction, timezone_str = fraction.split('+')
+                fraction = fraction[:6]
+                date_str = f"{main_part}.{fraction}+{timezone_str}"
+            elif 'Z' in fraction:
+                fraction = fraction.replace('Z', '')
+                fraction = fraction[:6]
+                date_str = f"{main_part}.{fraction}+00:00"
+        utc_time = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        return utc_time.astimezone(tz_utc8).strftime('%Y-%m-%d %H:%M:%S')
+    except Exception:
+        return "未知"
+
+
+def legacy_escape_markdown_v2(text):
+    need_escape = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+    for char in need_escape:
+        text = text.replace(char, f'\\{char}')
+    return text
+
+
+def legacy_format_telegram_hashtag(label):
+    if not label:
+        return ""
+    sanitized = label.strip()
+    if not sanitized:
+        return ""
+    sanitized = sanitized.replace('：', ':')
+    sanitized = re.sub(r'\s*:\s*', '_', sanitized)
+    sanitized = re.sub(r'\s+', '_', sanitized)
+    sanitized = re.sub(r'[^\w\u4e00-\u9fff_]', '', sanitized)
+    sanitized = re.sub(r'_+', '_', sanitized).strip('_')
+    return sanitized
+
+
+def uncached(func, arg):
+    """每次调用前清空缓存，测量未命中缓存时的开销"""
+    def call():
+        func.cache_clear()
+        return func(arg)
+    return call
+
+
+def main():
+    sample = load_sample_dict()
+    item = sample["Item"]
+    tag = item["TagItems"][0]["Name"] if item.get("TagItems") else "Science Fiction"
+    title = item["Name"]
+    date_str = item["DateCreated"]
+
+    print_results("format_telegram_hashtag", [
+        bench("legacy", lambda: legacy_format_telegram_hashtag(tag)),
+        bench("precompiled (cold cache)", uncached(helpers.format_telegram_hashtag, tag)),
+        bench("precompiled (cached)", lambda: helpers.format_telegram_hashtag(tag)),
+    ], baseline="legacy")
+
+    print_results("escape_markdown_v2", [
+        bench("legacy", lambda: legacy_escape_markdown_v2(title)),
+        bench("skip absent chars", lambda: helpers.escape_markdown_v2(title)),
+    ], baseline="legacy")
+
+    print_results("parse_emby_date", [
+        bench("legacy", lambda: legacy_parse_emby_date(date_str)),
+        bench("module tz (cold cache)", uncached(helpers.parse_emby_date, date_str)),
+        bench("module tz (cached)", lambda: helpers.parse_emby_date(date_str)),
+    ], baseline="legacy")
+
+
+if __name__ == "__main__":
+    main()
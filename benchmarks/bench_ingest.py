@@ -0,0 +1,52 @@
+"""
+/webhook 解析路径基准测试
+
+对比旧路径(request.json -> json.dumps 记录日志 -> model_validate -> 队列中再次 model_validate)
+、单次解析路径(model_validate_json 直接解析原始字节)和当前 /webhook 实际使用的
+精简投影路径(WebhookView.parse)的单请求开销。
+
+    python -m benchmarks.bench_ingest
+"""
+import json
+
+from benchmarks.common import bench, load_sample_payload, print_results
+from models.projection import WebhookView
+from models.webhook import EmbyWebhook
+
+
+def legacy_ingest(body: bytes):
+    data = json.loads(body)
+    json.dumps(data, ensure_ascii=False)
+    webhook = EmbyWebhook.model_validate(data)
+    # 队列消费时再次校验
+    EmbyWebhook.model_validate(data)
+    return webhook
+
+
+def single_parse_ingest(body: bytes):
+    return EmbyWebhook.model_validate_json(body)
+
+
+def projection_ingest(body: bytes):
+    # /webhook 热路径只解析精简投影，完整模型按需再解析
+    return WebhookView.parse(body)
+
+
+def main():
+    body = load_sample_payload()
+    webhook = single_parse_ingest(body)
+    assert legacy_ingest(body) == webhook
+    view = projection_ingest(body)
+    assert (view.Event, view.Item.Id) == (webhook.Event, webhook.Item.Id)
+
+    results = [
+        bench("legacy (loads+dumps+validate x2)", lambda: legacy_ingest(body)),
+        bench("single parse (model_validate_json)", lambda: single_parse_ingest(body)),
+        bench("projection (WebhookView.parse)", lambda: projection_ingest(body)),
+    ]
+    print_results(f"ingest parse path, payload {len(body)} bytes", results,
+                  baseline="legacy (loads+dumps+validate x2)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+日志开销基准测试
+
+对比同步处理器(调用线程中格式化并写文件/控制台)和队列模式(调用线程只入队)下
+单次 logger.info 以及记录完整请求体的耗时。控制台输出被重定向到 /dev/null。
+
+    python -m benchmarks.bench_logging
+"""
+import contextlib
+import logging
+import os
+import tempfile
+
+from benchmarks.common import bench, load_sample_payload, print_results
+
+import config.settings as settings
+
+
+def measure(use_queue: bool, payload: bytes):
+    from utils.logger import LazyPayload, Logger
+
+    logger_wrapper = Logger()
+    logger_wrapper.setup_logger(logging.INFO, use_queue=use_queue)
+    logger = logger_wrapper.get_logger()
+    mode = "queue" if use_queue else "sync"
+    text = payload.decode()
+
+    results = [
+        bench(f"{mode}: short message", lambda: logger.info("消息已添加到队列，当前队列长度: %d", 42),
+              number=2000),
+        bench(f"{mode}: full payload (eager)", lambda: logger.info(f"原始数据: {text}"), number=2000),
+        bench(f"{mode}: payload (lazy, truncated)", lambda: logger.info("原始数据: %s", LazyPayload(payload)),
+              number=2000),
+    ]
+    # 等待监听线程写完，避免影响下一组测量
+    logger_wrapper.stop()
+    return results
+
+
+def main():
+    payload = load_sample_payload()
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, "w") as devnull:
+        settings.LOG_DIR = log_dir
+        import utils.logger as logger_module
+        logger_module.LOG_DIR = log_dir
+        with contextlib.redirect_stdout(devnull):
+            results = measure(False, payload) + measure(True, payload)
+    print_results("logger.info cost per call", results, baseline="sync: short message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+webhook 模型解析基准测试
+
+对比完整模型(EmbyWebhook.model_validate_json)和精简投影(WebhookView.parse)
+从原始字节解析的单次耗时和每个实例占用的内存。
+除仓库自带的示例请求外，还构造了一个内容更多的变体: 长简介、几十个类型/标签、
+外部链接和预告片，接近刮削完整的电影条目。
+
+    python -m benchmarks.bench_parse
+"""
+import copy
+import json
+import tracemalloc
+
+from benchmarks.common import bench, load_sample_dict, load_sample_payload, print_results
+from models.projection import WebhookView
+from models.webhook import EmbyWebhook
+
+
+def heavy_payload() -> bytes:
+    data = copy.deepcopy(load_sample_dict())
+    item = data["Item"]
+    item["Overview"] = "这是一段很长的剧情简介，包含大量描述。" * 200
+    item["Taglines"] = [f"宣传语 {n}" for n in range(10)]
+    item["Genres"] = [f"类型{n}" for n in range(40)]
+    item["GenreItems"] = [{"Name": f"类型{n}", "Id": 5000 + n} for n in range(40)]
+    item["TagItems"] = [{"Name": f"标签{n}", "Id": 6000 + n} for n in range(40)]
+    item["Studios"] = [{"Name": f"制作公司{n}", "Id": 7000 + n} for n in range(5)]
+    item["ExternalUrls"] = [{"Name": f"Site {n}", "Url": f"https://example.com/{n}/{item['Id']}"} for n in range(20)]
+    item["RemoteTrailers"] = [{"Url": f"https://video.example.com/trailer/{n}"} for n in range(10)]
+    item["ProviderIds"] = {f"Provider{n}": str(n) for n in range(10)}
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def bytes_per_instance(parse, body: bytes, count: int = 500) -> float:
+    """解析 count 次并保留结果，按新增内存估算单个实例的大小(不含共享的请求体)"""
+    bodies = [bytes(bytearray(body)) for _ in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [parse(b) for b in bodies]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return growth / count
+
+
+def check_equivalence(body: bytes) -> None:
+    """投影中的字段与完整模型一致"""
+    full = EmbyWebhook.model_validate_json(body)
+    view = WebhookView.parse(body)
+    assert (view.Event, view.Title, view.Server.Id) == (full.Event, full.Title, full.Server.Id)
+    for field in ("Name", "Id", "Path", "ParentId", "Type", "DateCreated", "Overview", "Size", "Genres",
+                  "BackdropImageTags"):
+        expected = getattr(full.Item, field)
+        actual = getattr(view.Item, field)
+        assert (tuple(expected) if isinstance(expected, list) else expected) == actual, field
+    assert [t.Name for t in full.Item.TagItems] == [t.Name for t in view.Item.TagItems]
+    assert view.full() == full
+
+
+def main():
+    payloads = [("sample", load_sample_payload()), ("heavy", heavy_payload())]
+    for label, body in payloads:
+        check_equivalence(body)
+        results = [
+            bench("full (EmbyWebhook)", lambda: EmbyWebhook.model_validate_json(body)),
+            bench("projection (WebhookView)", lambda: WebhookView.parse(body)),
+        ]
+        print_results(f"parse {label} payload, {len(body)} bytes", results, baseline="full (EmbyWebhook)")
+        full_size = bytes_per_instance(EmbyWebhook.model_validate_json, body)
+        view_size = bytes_per_instance(WebhookView.parse, body)
+        print(f"{'memory per instance':<40}{'full':>10} {full_size:>8.0f} B{'projection':>14} {view_size:>8.0f} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+通知说明文字渲染基准测试
+
+对比三种实现的单条消息耗时(都包含字段格式化):
+- 原先的 f-string 拼接: 每条消息 5 次未编译的 re.sub，不转义、不限制长度，
+  标题中的 & < > 会导致 Telegram 拒绝消息，超长说明也会被拒绝
+- 同样的 f-string 加上逐字段 HTML 转义和 UTF-16 长度检查(不截断)，即功能对等的最简实现
+- 编译模板: 所有字段一次转义，长度上界不超过限制时不计算 UTF-16 长度，超长时截断
+
+编译模板比不转义的 f-string 慢几微秒，这是转义和长度保证的代价；应与功能对等的实现比较。
+
+    python -m benchmarks.bench_render
+"""
+import html
+import re
+
+from benchmarks.common import bench, load_sample_payload, print_results
+from handlers.webhook_handler import WebhookHandler
+from models.webhook import EmbyWebhook
+from utils.helpers import format_runtime, format_size, format_telegram_hashtag, parse_emby_date
+from utils.templates import CAPTION_LIMIT, TemplateEngine, escape_html, visible_length
+
+
+def legacy_clean_html_text(text):
+    if not text:
+        return ""
+    text = re.sub(r'<br\s*?>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'<p[^>]*>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'</p>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    return text.strip()
+
+
+def legacy_render(item, library_name):
+    message = (
+        f"🎬 <b>新片入库</b>\n\n"
+        f"📝 <b>标题:</b> {item.Name}\n"
+        f"📚 <b>媒体库:</b> {library_name}\n"
+        f"🗓️ <b>发行日期:</b> {parse_emby_date(item.PremiereDate)}\n"
+        f"⏱ <b>入库时间:</b> {parse_emby_date(item.DateCreated)}\n"
+        f"💎 <b>分辨率:</b> {item.Width}x{item.Height}\n"
+        f"⏳ <b>时  长:</b> {format_runtime(item.RunTimeTicks)}\n"
+        f"📦 <b>大  小:</b> {format_size(item.Size)}\n"
+        f"🎞️ <b>类  型:</b> {item.Container.upper() if item.Container else '未知'}"
+    )
+    if item.Overview:
+        clean_overview = legacy_clean_html_text(item.Overview)
+        if clean_overview:
+            message += f"\n\n📖 <b>简介:</b>\n{clean_overview}\n"
+    if item.Studios:
+        message += f"\n🏢 <b>制作公司:</b> {', '.join(f'#{studio.Name}' for studio in item.Studios)}"
+    if item.TagItems:
+        hashtags = [f"#{t}" for t in map(format_telegram_hashtag, (tag.Name for tag in item.TagItems)) if t]
+        if hashtags:
+            message += f"\n🏷 <b>标签:</b> {' '.join(hashtags)}"
+    return message
+
+
+def escaped_render(item, library_name):
+    """功能对等的 f-string: 每个字段单独转义，并检查 UTF-16 长度"""
+    e = escape_html
+    message = (
+        f"🎬 <b>新片入库</b>\n\n"
+        f"📝 <b>标题:</b> {e(item.Name)}\n"
+        f"📚 <b>媒体库:</b> {e(library_name)}\n"
+        f"🗓️ <b>发行日期:</b> {e(parse_emby_date(item.PremiereDate))}\n"
+        f"⏱ <b>入库时间:</b> {e(parse_emby_date(item.DateCreated))}\n"
+        f"💎 <b>分辨率:</b> {item.Width}x{item.Height}\n"
+        f"⏳ <b>时  长:</b> {format_runtime(item.RunTimeTicks)}\n"
+        f"📦 <b>大  小:</b> {format_size(item.Size)}\n"
+        f"🎞️ <b>类  型:</b> {e(item.Container.upper()) if item.Container else '未知'}"
+    )
+    if item.Overview:
+        clean_overview = legacy_clean_html_text(item.Overview)
+        if clean_overview:
+            message += f"\n\n📖 <b>简介:</b>\n{e(clean_overview)}\n"
+    if item.Studios:
+        message += f"\n🏢 <b>制作公司:</b> {e(', '.join(f'#{studio.Name}' for studio in item.Studios))}"
+    if item.TagItems:
+        hashtags = [f"#{t}" for t in map(format_telegram_hashtag, (tag.Name for tag in item.TagItems)) if t]
+        if hashtags:
+            message += f"\n🏷 <b>标签:</b> {e(' '.join(hashtags))}"
+    # 只检查不截断，标签和实体按原样计入长度
+    visible_length(message)
+    return message
+
+
+def template_render(handler, engine, webhook, library_name):
+    item = webhook.Item
+    values = {
+        "event": webhook.Event,
+        "name": item.Name,
+        "library": library_name,
+        "premiere_date": parse_emby_date(item.PremiereDate),
+        "date_created": parse_emby_date(item.DateCreated),
+        "resolution": f"{item.Width}x{item.Height}",
+        "runtime": format_runtime(item.RunTimeTicks),
+        "size": format_size(item.Size),
+        "container": item.Container.upper() if item.Container else '未知',
+        "overview": handler.clean_html_text(item.Overview) if item.Overview else "",
+        "studios": ", ".join(f"#{studio.Name}" for studio in item.Studios),
+        "tags": ' '.join(f"#{t}" for t in map(format_telegram_hashtag, (tag.Name for tag in item.TagItems)) if t),
+    }
+    return engine.render(webhook.Event, values, CAPTION_LIMIT)
+
+
+def main():
+    webhook = EmbyWebhook.model_validate_json(load_sample_payload())
+    long_webhook = webhook.model_copy(deep=True)
+    long_webhook.Item.Overview = "<p>" + "很长的简介 & <剧情> " * 300 + "</p>"
+
+    handler = WebhookHandler()
+    engine = TemplateEngine()
+
+    # 没有需要转义的字符时两种实现结果一致
+    assert legacy_render(webhook.Item, "Lib") == template_render(handler, engine, webhook, "Lib")
+    # Telegram 按解析实体后的文本计算长度
+    truncated = template_render(handler, engine, long_webhook, "Lib")
+    assert visible_length(html.unescape(re.sub(r'<[^>]+>', '', truncated))) <= CAPTION_LIMIT
+
+    assert escaped_render(webhook.Item, "Lib") == template_render(handler, engine, webhook, "Lib")
+
+    results = [
+        bench("legacy f-string (sample)", lambda: legacy_render(webhook.Item, "Lib")),
+        bench("escaped f-string (sample)", lambda: escaped_render(webhook.Item, "Lib")),
+        bench("compiled template (sample)", lambda: template_render(handler, engine, webhook, "Lib")),
+        bench("legacy f-string (long overview)", lambda: legacy_render(long_webhook.Item, "Lib")),
+        bench("escaped f-string (long, not truncated)", lambda: escaped_render(long_webhook.Item, "Lib")),
+        bench("compiled template (long, truncated)",
+              lambda: template_render(handler, engine, long_webhook, "Lib")),
+    ]
+    print_results("caption rendering per message", results, baseline="escaped f-string (sample)")
+
+
+if __name__ == "__main__":
+    main()
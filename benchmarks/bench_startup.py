@@ -0,0 +1,160 @@
+"""
+启动和停止基准测试
+
+每一轮都在新的子进程中冷启动，测量:
+- 导入 emby_webhook / emby_ingest 模块的耗时
+- 从启动 main.py 到 POST /webhook 返回 200 的耗时(Telegram 和 Emby 由本地替身模拟)
+- 发送一批事件后立即 SIGTERM，进程退出的耗时、退出前已投递的消息数，
+  以及截止时间内未发送的消息在重启后是否全部补发
+
+    python -m benchmarks.bench_startup --rounds 5
+    python -m benchmarks.bench_startup --events 200 --drain-timeout 0.5
+"""
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import ROOT
+from benchmarks.load_test import build_payloads, free_port
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="启动和停止耗时")
+    parser.add_argument("--rounds", type=int, default=5, help="每项测量的轮数，报告中位数")
+    parser.add_argument("--events", type=int, default=50, help="SIGTERM 前发送的事件数")
+    parser.add_argument("--telegram-latency", type=float, default=50, help="替身 Telegram 响应延迟(毫秒)")
+    parser.add_argument("--drain-timeout", type=float, default=20, help="SHUTDOWN_DRAIN_TIMEOUT(秒)")
+    parser.add_argument("--journal", action="store_true", help="启用持久化队列日志(默认使用溢出文件保存剩余消息)")
+    return parser.parse_args()
+
+
+def import_seconds(module: str, env: dict) -> float:
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET.format(module=module)], cwd=ROOT, env=env)
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def server_environment(args, telegram_url: str, emby_url: str, workdir: str, port: int) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_API_URL": telegram_url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "WEBHOOK_CHANNEL_ID": "-1001",
+        "EMBY_URL": emby_url,
+        "EMBY_API_KEY": "bench",
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(port),
+        "DATA_DIR": os.path.join(workdir, "data"),
+        "ARCHIVE_DIR": os.path.join(workdir, "notifications"),
+        "QUEUE_JOURNAL_ENABLED": "true" if args.journal else "false",
+        "SHUTDOWN_DRAIN_TIMEOUT": str(args.drain_timeout),
+        "DIGEST_MODE": "off",
+        "TELEGRAM_GROUP_RATE_PER_MIN": "6000",
+        "TELEGRAM_GLOBAL_RATE": "100",
+        "TELEGRAM_GLOBAL_BURST": "100",
+        "LOG_LEVEL": "WARNING",
+        "LOG_PAYLOAD_SAMPLE_RATE": "0",
+    })
+    return env
+
+
+async def wait_until_ready(session, url: str, body: bytes, timeout: float = 30) -> None:
+    """反复发送同一个事件直到返回 200"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with session.post(url, data=body) as resp:
+                await resp.read()
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        await asyncio.sleep(0.01)
+    raise RuntimeError(f"服务未能在 {timeout} 秒内就绪")
+
+
+async def wait_for_deliveries(telegram, expected: int, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while len(telegram.deliveries) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def measure_round(args, payloads):
+    """一轮冷启动 -> 发送 -> SIGTERM -> 重启补发"""
+    import aiohttp
+
+    from benchmarks.fakes import FakeEmbyServer, FakeTelegramServer
+
+    telegram = FakeTelegramServer(latency=args.telegram_latency / 1000)
+    emby = FakeEmbyServer()
+    telegram_url = await telegram.start()
+    emby_url = await emby.start()
+    workdir = tempfile.mkdtemp(prefix="emby_webhook_startup_")
+    port = free_port()
+    env = server_environment(args, telegram_url, emby_url, workdir, port)
+    url = f"http://127.0.0.1:{port}/webhook"
+    result = {}
+    try:
+        async with aiohttp.ClientSession() as session:
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(sys.executable, "main.py", cwd=ROOT, env=env)
+            # 第一个事件同时作为就绪探测，去重会过滤重复的请求
+            await wait_until_ready(session, url, payloads[0])
+            result["ready"] = time.perf_counter() - start
+
+            for body in payloads[1:]:
+                async with session.post(url, data=body) as resp:
+                    await resp.read()
+
+            stop = time.perf_counter()
+            process.send_signal(signal.SIGTERM)
+            result["exit_code"] = await asyncio.wait_for(process.wait(), args.drain_timeout + 30)
+            result["shutdown"] = time.perf_counter() - stop
+            result["delivered_before_exit"] = len(telegram.deliveries)
+
+            # 重启后补发截止时间内未发送的消息
+            process = await asyncio.create_subprocess_exec(sys.executable, "main.py", cwd=ROOT, env=env)
+            await wait_for_deliveries(telegram, len(payloads), 30)
+            process.send_signal(signal.SIGTERM)
+            await asyncio.wait_for(process.wait(), args.drain_timeout + 30)
+            result["delivered_total"] = len(telegram.deliveries)
+    finally:
+        await telegram.stop()
+        await emby.stop()
+    return result
+
+
+def median(results, key):
+    return statistics.median(r[key] for r in results)
+
+
+def main():
+    args = parse_args()
+    env = dict(os.environ, QUEUE_JOURNAL_ENABLED="false", LOG_LEVEL="WARNING")
+
+    print(f"冷启动导入耗时(中位数，{args.rounds} 轮)")
+    for module in ("emby_webhook", "emby_ingest"):
+        samples = [import_seconds(module, env) for _ in range(args.rounds)]
+        print(f"  import {module:<20}{statistics.median(samples) * 1000:>10.1f} ms")
+
+    payloads = build_payloads(args.events, folders=args.events)
+    results = [asyncio.run(measure_round(args, payloads)) for _ in range(args.rounds)]
+
+    print(f"\nmain.py 启动和停止(中位数，{args.rounds} 轮，{args.events} 个事件，"
+          f"SHUTDOWN_DRAIN_TIMEOUT={args.drain_timeout})")
+    print(f"  启动到 /webhook 返回 200      {median(results, 'ready') * 1000:>10.1f} ms")
+    print(f"  SIGTERM 到进程退出           {median(results, 'shutdown') * 1000:>10.1f} ms")
+    print(f"  退出前已投递                 {median(results, 'delivered_before_exit'):>10.0f} / {args.events}")
+    print(f"  重启后累计投递               {median(results, 'delivered_total'):>10.0f} / {args.events}")
+    print(f"  退出码                       {sorted({r['exit_code'] for r in results})}")
+
+
+if __name__ == "__main__":
+    main()
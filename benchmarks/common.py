@@ -0,0 +1,53 @@
+"""
+基准测试公共工具
+
+所有基准脚本都在项目根目录下以模块方式运行，例如:
+    python -m benchmarks.bench_ingest
+"""
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLE_PAYLOAD = ROOT / "library.new_20250708_062238.json"
+
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# 基准测试不需要持久化队列和真实的 Telegram/Emby 配置
+os.environ.setdefault("QUEUE_JOURNAL_ENABLED", "false")
+
+
+def load_sample_payload() -> bytes:
+    """读取仓库自带的 library.new 示例请求体"""
+    return SAMPLE_PAYLOAD.read_bytes()
+
+
+def load_sample_dict() -> dict:
+    return json.loads(load_sample_payload())
+
+
+def bench(name: str, func: Callable[[], object], number: int = 0, repeat: int = 5) -> Dict[str, float]:
+    """
+    测量 func 单次调用耗时，取多轮中的最好成绩
+
+    :param number: 每轮调用次数，0 表示自动选择使每轮约 0.2 秒
+    """
+    timer = timeit.Timer(func)
+    if not number:
+        number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {"name": name, "us_per_call": best * 1e6, "calls_per_sec": 1 / best if best else float("inf")}
+
+
+def print_results(title: str, results: List[Dict[str, float]], baseline: str = "") -> None:
+    """打印结果表格，baseline 指定作为对比基准的名称"""
+    base = next((r["us_per_call"] for r in results if r["name"] == baseline), None)
+    print(f"\n{title}")
+    print(f"{'name':<40}{'us/call':>12}{'calls/s':>14}{'speedup':>10}")
+    for r in results:
+        speedup = f"{base / r['us_per_call']:.2f}x" if base else ""
+        print(f"{r['name']:<40}{r['us_per_call']:>12.2f}{r['calls_per_sec']:>14.0f}{speedup:>10}")
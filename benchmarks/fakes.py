@@ -0,0 +1,207 @@
+"""
+本地 Telegram Bot API 和 Emby 服务替身，用于负载测试和回放
+
+两个服务都监听 127.0.0.1 的随机端口，可配置响应延迟。
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+
+class _FakeServer:
+    """aiohttp 测试服务基类"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def _delay(self):
+        self.requests += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def start(self) -> str:
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class FakeTelegramServer(_FakeServer):
+    """
+    模拟 Telegram Bot API
+
+    记录每次调用的方法、接收时间和消息文本(相册中每条说明各记一条)。
+    支持 JSON 和 multipart 请求，上传的图片返回新的 file_id，并统计上传字节数。
+    rate_limit_every > 0 时每隔 N 次请求返回一次 429，error_every > 0 时每隔 N 次请求返回一次 502，
+    发往 missing_chats 中聊天的消息返回 400 chat not found。
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_every: int = 0,
+                 retry_after: int = 1, error_every: int = 0, missing_chats=()):
+        super().__init__(latency, jitter)
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.error_every = error_every
+        self.missing_chats = {str(chat_id) for chat_id in missing_chats}
+        self.calls: Dict[str, int] = {}
+        # (接收时间, 文本) 每条投递的消息一条
+        self.deliveries: List[tuple] = []
+        # 聊天ID -> 投递的消息数
+        self.chat_deliveries: Dict[str, int] = {}
+        self.upload_bytes = 0
+        self.uploads = 0
+        self._file_ids = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        await self._delay()
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            return web.json_response(
+                {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                 "parameters": {"retry_after": self.retry_after}},
+                status=429
+            )
+        if self.error_every and self.requests % self.error_every == 0:
+            return web.json_response({"ok": False, "error_code": 502, "description": "Bad Gateway"}, status=502)
+
+        payload = await self._read_payload(request)
+        now = time.perf_counter()
+        chat_id = str(payload.get("chat_id"))
+        if chat_id in self.missing_chats:
+            return web.json_response(
+                {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}, status=400
+            )
+        if method == "sendMediaGroup":
+            media = payload.get("media") or []
+            if isinstance(media, str):
+                media = json.loads(media)
+            for entry in media:
+                self.deliveries.append((now, entry.get("caption", "")))
+            self.chat_deliveries[chat_id] = self.chat_deliveries.get(chat_id, 0) + len(media)
+            result = [{"message_id": i, "photo": self._photo_sizes(entry.get("media"))}
+                      for i, entry in enumerate(media)]
+        elif method == "sendPhoto":
+            self.deliveries.append((now, payload.get("caption", "")))
+            self.chat_deliveries[chat_id] = self.chat_deliveries.get(chat_id, 0) + 1
+            result = {"message_id": 1, "photo": self._photo_sizes(payload.get("photo"))}
+        else:
+            self.deliveries.append((now, payload.get("text", "")))
+            self.chat_deliveries[chat_id] = self.chat_deliveries.get(chat_id, 0) + 1
+            result = {"message_id": 1}
+        return web.json_response({"ok": True, "result": result})
+
+    async def _read_payload(self, request: web.Request) -> dict:
+        if not request.content_type.startswith("multipart/"):
+            return await request.json()
+        payload = {}
+        form = await request.post()
+        for name, value in form.items():
+            if isinstance(value, web.FileField):
+                size = len(value.file.read())
+                self.uploads += 1
+                self.upload_bytes += size
+                payload[name] = f"upload:{name}"
+            else:
+                payload[name] = value
+        return payload
+
+    def _photo_sizes(self, media) -> list:
+        """已有 file_id 原样返回，新图片(上传或 URL)分配新的 file_id"""
+        if isinstance(media, str) and media.startswith("file-"):
+            file_id = media
+        else:
+            self._file_ids += 1
+            file_id = f"file-{self._file_ids}"
+        return [{"file_id": f"{file_id}-thumb", "width": 90, "height": 51},
+                {"file_id": file_id, "width": 1280, "height": 720}]
+
+
+class FakeEmbyServer(_FakeServer):
+    """
+    模拟 Emby 服务器
+
+    所有条目都挂在同一个媒体库下: 条目 -> 文件夹 -> 媒体库(CollectionFolder)。
+    /Items?Ids=a,b,c 批量返回条目(记录每次请求的ID数)，图片接口返回 image_bytes 大小的固定内容。
+    """
+
+    LIBRARY_ID = "1000"
+    LIBRARY_NAME = "Benchmark Library"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, image_bytes: int = 200 * 1024):
+        super().__init__(latency, jitter)
+        self.image = b"\xff\xd8\xff\xe0" + bytes(max(0, image_bytes - 4))
+        self.image_requests = 0
+        # 每次批量查询的ID数
+        self.batch_sizes: List[int] = []
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/emby/Items", self.items)
+        app.router.add_get("/emby/Library/MediaFolders", self.media_folders)
+        app.router.add_get("/emby/Library/VirtualFolders", self.virtual_folders)
+        app.router.add_get("/emby/Items/{id}", self.item)
+        app.router.add_get("/emby/Items/{id}/Images/{type}", self.image_handler)
+        app.router.add_get("/emby/Items/{id}/Images/{type}/{index}", self.image_handler)
+        return app
+
+    def _item(self, item_id: str) -> dict:
+        if item_id == self.LIBRARY_ID:
+            return {"Id": item_id, "Name": self.LIBRARY_NAME, "Type": "CollectionFolder", "ParentId": "1"}
+        if item_id.startswith("folder-"):
+            return {"Id": item_id, "Name": item_id, "Type": "Folder", "ParentId": self.LIBRARY_ID}
+        return {
+            "Id": item_id, "Name": f"Item {item_id}", "Type": "Movie", "ParentId": f"folder-{item_id}",
+            "RunTimeTicks": 72_000_000_000, "Width": 1920, "Height": 1080,
+            "MediaSources": [{"Container": "mkv", "Size": 4 * 1024 ** 3, "RunTimeTicks": 72_000_000_000,
+                              "MediaStreams": [{"Type": "Video", "Width": 1920, "Height": 1080}]}]
+        }
+
+    async def media_folders(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"Items": [{"Id": self.LIBRARY_ID, "Name": self.LIBRARY_NAME}]})
+
+    async def virtual_folders(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response([{"Name": self.LIBRARY_NAME, "ItemId": self.LIBRARY_ID, "Locations": []}])
+
+    async def items(self, request: web.Request) -> web.Response:
+        await self._delay()
+        ids = [item_id for item_id in request.query.get("Ids", "").split(",") if item_id]
+        self.batch_sizes.append(len(ids))
+        items = [self._item(item_id) for item_id in ids]
+        return web.json_response({"Items": items, "TotalRecordCount": len(items)})
+
+    async def item(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response(self._item(request.match_info["id"]))
+
+    async def image_handler(self, request: web.Request) -> web.Response:
+        await self._delay()
+        self.image_requests += 1
+        return web.Response(body=self.image, content_type="image/jpeg")
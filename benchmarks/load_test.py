@@ -0,0 +1,329 @@
+"""
+端到端负载测试
+
+以可配置的速率向 create_webhook_app 发送示例 library.new 请求的变体，
+Telegram Bot API 和 Emby 均由本地替身(benchmarks.fakes)模拟，可配置延迟。
+
+报告:
+- 入队延迟 p50/p99 (POST /webhook 的响应时间)
+- 队列延迟 (请求发出到替身 Telegram 收到对应消息的时间) p50/p99/max
+- 投递吞吐量 (条/秒) 和 Telegram API 调用次数
+- 进程内存增长 (RSS)
+
+结果保存为 JSON 文件，便于在不同提交之间对比:
+    python -m benchmarks.load_test --events 2000 --rate 500
+    python -m benchmarks.load_test --compare benchmarks/results/<上一次结果>.json
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import re
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.common import ROOT, load_sample_dict
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+MARKER = re.compile(r"BENCH-(\d{6})")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Emby webhook 端到端负载测试")
+    parser.add_argument("--events", type=int, default=1000, help="发送的事件总数")
+    parser.add_argument("--rate", type=float, default=0, help="每秒发送的事件数，0 表示不限速")
+    parser.add_argument("--concurrency", type=int, default=50, help="最大并发请求数")
+    parser.add_argument("--folders", type=int, default=50, help="事件分布的父文件夹数量")
+    parser.add_argument("--telegram-latency", type=float, default=50, help="替身 Telegram 响应延迟(毫秒)")
+    parser.add_argument("--emby-latency", type=float, default=20, help="替身 Emby 响应延迟(毫秒)")
+    parser.add_argument("--telegram-rate", type=float, default=1000,
+                        help="群组/频道每分钟消息上限，默认放开以测量管道本身的吞吐")
+    parser.add_argument("--journal", action="store_true", help="启用持久化队列日志")
+    parser.add_argument("--destinations", type=int, default=1, help="每个事件分发到的聊天数量")
+    parser.add_argument("--image-upload", action="store_true", help="由服务下载图片并上传给 Telegram")
+    parser.add_argument("--image-kb", type=int, default=200, help="替身 Emby 返回的图片大小(KB)")
+    parser.add_argument("--error-every", type=int, default=0, help="替身 Telegram 每隔 N 次请求返回一次 502，测试后台重试")
+    parser.add_argument("--ingest-workers", type=int, default=0,
+                        help="split 部署模式的 ingest 进程数，0 表示单进程模式")
+    parser.add_argument("--digest", type=float, default=0,
+                        help="开启自动汇总并使用该汇总窗口(秒)，0 表示关闭汇总以测量逐条发送的吞吐")
+    parser.add_argument("--sparse", action="store_true",
+                        help="去掉请求中的分辨率、时长和大小，由服务从替身 Emby 批量补全")
+    parser.add_argument("--memory-limit", type=int, default=1000, help="队列内存中最多保留的事件数，超出部分溢出到磁盘")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="等待队列排空的最长时间(秒)")
+    parser.add_argument("--label", default="", help="结果标签")
+    parser.add_argument("--output", default=str(RESULTS_DIR), help="结果保存目录")
+    parser.add_argument("--compare", default="", help="与之前保存的结果文件对比")
+    return parser.parse_args()
+
+
+def configure_environment(args, telegram_url: str, emby_url: str, workdir: str):
+    """在导入应用模块前设置环境变量"""
+    os.environ.update({
+        "TELEGRAM_API_URL": telegram_url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "WEBHOOK_CHANNEL_ID": "-1001",
+        "NOTIFICATION_ROUTES": json.dumps([{"chat_id": str(-1001 - n)} for n in range(args.destinations)]),
+        "EMBY_URL": emby_url,
+        "EMBY_API_KEY": "bench",
+        "DATA_DIR": os.path.join(workdir, "data"),
+        "ARCHIVE_DIR": os.path.join(workdir, "notifications"),
+        "QUEUE_JOURNAL_ENABLED": "true" if args.journal else "false",
+        "IMAGE_UPLOAD_ENABLED": "true" if args.image_upload else "false",
+        "QUEUE_MEMORY_LIMIT": str(args.memory_limit),
+        "QUEUE_RETRY_BASE_DELAY": "0.2",
+        "DIGEST_MODE": "auto" if args.digest else "off",
+        "DIGEST_WINDOW": str(args.digest),
+        "INGEST_QUEUE_FILE": os.path.join(workdir, "data", "ingest.db"),
+        "TELEGRAM_GLOBAL_RATE": str(max(30.0, args.telegram_rate / 60)),
+        "TELEGRAM_GLOBAL_BURST": str(max(30.0, args.telegram_rate / 60)),
+        "TELEGRAM_GROUP_RATE_PER_MIN": str(args.telegram_rate),
+        "LOG_LEVEL": "WARNING",
+        "LOG_PAYLOAD_SAMPLE_RATE": "0",
+    })
+
+
+def build_payloads(count: int, folders: int, sparse: bool = False):
+    """基于示例请求生成带唯一标记的变体，sparse 时去掉需要从 Emby 补全的字段"""
+    sample = load_sample_dict()
+    payloads = []
+    for n in range(count):
+        data = copy.deepcopy(sample)
+        marker = f"BENCH-{n:06d}"
+        item = data["Item"]
+        item["Id"] = str(100000 + n)
+        item["Name"] = f"{marker} {item['Name']}"
+        item["ParentId"] = f"folder-{n % folders}"
+        item["Path"] = f"/bench/{n % folders}/{marker}.mkv"
+        item["FileName"] = f"{marker}.mkv"
+        data["Title"] = f"新 {item['Name']}"
+        data["Date"] = datetime.now(timezone.utc).isoformat()
+        if sparse:
+            for field in ("Width", "Height", "RunTimeTicks", "Size"):
+                item.pop(field, None)
+        payloads.append(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    return payloads
+
+
+def rss_bytes() -> int:
+    """当前进程常驻内存"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_listening(port: int, timeout: float = 30) -> None:
+    """等待 ingest 子进程开始监听"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"ingest 进程未能在 {timeout} 秒内启动")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args):
+    import aiohttp
+    import uvicorn
+
+    from benchmarks.fakes import FakeEmbyServer, FakeTelegramServer
+
+    telegram = FakeTelegramServer(latency=args.telegram_latency / 1000, error_every=args.error_every)
+    emby = FakeEmbyServer(latency=args.emby_latency / 1000, image_bytes=args.image_kb * 1024)
+    telegram_url = await telegram.start()
+    emby_url = await emby.start()
+
+    workdir = tempfile.mkdtemp(prefix="emby_webhook_bench_")
+    configure_environment(args, telegram_url, emby_url, workdir)
+
+    import emby_webhook
+
+    payloads = build_payloads(args.events, args.folders, args.sparse)
+    rss_start = rss_bytes()
+
+    await emby_webhook.start_services(archive=not args.ingest_workers)
+
+    port = free_port()
+    if args.ingest_workers:
+        # split 模式: ingest 子进程接收 webhook，本进程作为分发进程读取收件箱
+        from utils.ingest_queue import IngestQueue
+
+        ingest_queue = IngestQueue(os.environ["INGEST_QUEUE_FILE"])
+        ingest_queue.open()
+        consumer = asyncio.create_task(emby_webhook.consume_ingest_queue(ingest_queue))
+        ingest_process = await emby_webhook.start_ingest_workers(args.ingest_workers, "127.0.0.1", port)
+        await wait_until_listening(port)
+    else:
+        server = uvicorn.Server(uvicorn.Config(
+            emby_webhook.create_webhook_app(), host="127.0.0.1", port=port, log_level="warning"
+        ))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+
+    url = f"http://127.0.0.1:{port}/webhook"
+    sent_at = {}
+    ingest_latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send(session, n, body):
+        async with semaphore:
+            start = time.perf_counter()
+            sent_at[n] = start
+            async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as resp:
+                await resp.read()
+            ingest_latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        tasks = []
+        for n, body in enumerate(payloads):
+            if args.rate > 0:
+                delay = started + n / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(session, n, body)))
+        await asyncio.gather(*tasks)
+    ingest_done = time.perf_counter()
+
+    # 等待所有消息投递到替身 Telegram，汇总消息按其中合并的事件数计算
+    digest_stats = emby_webhook.message_queue.digest.stats
+
+    def delivered_events() -> int:
+        return len(telegram.deliveries) - digest_stats['digests'] + digest_stats['digested']
+
+    deadline = time.perf_counter() + args.drain_timeout
+    expected = args.events * args.destinations
+    while delivered_events() < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    rss_end = rss_bytes()
+
+    if args.ingest_workers:
+        await emby_webhook.stop_ingest_workers(ingest_process)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        ingest_queue.close()
+    else:
+        server.should_exit = True
+        await server_task
+    await emby_webhook.stop_services()
+    await telegram.stop()
+    await emby.stop()
+
+    lags = []
+    delivered_times = []
+    for received_at, text in telegram.deliveries:
+        match = MARKER.search(text or "")
+        if match and int(match.group(1)) in sent_at:
+            lags.append(received_at - sent_at[int(match.group(1))])
+            delivered_times.append(received_at)
+
+    delivery_span = (max(delivered_times) - started) if delivered_times else 0
+    return {
+        "label": args.label,
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "ingest": {
+            "requests": len(ingest_latencies),
+            "duration_s": ingest_done - started,
+            "requests_per_s": len(ingest_latencies) / (ingest_done - started),
+            "p50_ms": percentile(ingest_latencies, 50) * 1000,
+            "p99_ms": percentile(ingest_latencies, 99) * 1000,
+        },
+        "queue_lag": {
+            "p50_ms": percentile(lags, 50) * 1000,
+            "p99_ms": percentile(lags, 99) * 1000,
+            "max_ms": max(lags) * 1000 if lags else 0,
+        },
+        "delivery": {
+            "delivered": len(lags),
+            "messages_per_s": len(lags) / delivery_span if delivery_span else 0,
+            "telegram_calls": dict(telegram.calls),
+            "per_destination": dict(telegram.chat_deliveries),
+            "emby_requests": emby.requests,
+            "emby_batch_requests": len(emby.batch_sizes),
+            "emby_batched_ids": sum(emby.batch_sizes),
+            "image_downloads": emby.image_requests,
+            "image_upload_mb": telegram.upload_bytes / 2 ** 20,
+            "spilled": emby_webhook.message_queue.spill_stats['spilled'],
+            "failures": dict(emby_webhook.message_queue.failure_stats),
+            "digests": digest_stats['digests'],
+            "digested_events": digest_stats['digested'],
+        },
+        "memory": {
+            "rss_start_mb": rss_start / 2 ** 20,
+            "rss_end_mb": rss_end / 2 ** 20,
+            "rss_growth_mb": (rss_end - rss_start) / 2 ** 20,
+        },
+    }
+
+
+def save(result: dict, output: str) -> Path:
+    directory = Path(output)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{result['revision']}"
+    if result["label"]:
+        name += f"_{result['label']}"
+    path = directory / f"{name}.json"
+    path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def compare(result: dict, previous_path: str) -> None:
+    previous = json.loads(Path(previous_path).read_text(encoding="utf-8"))
+    print(f"\n对比 {previous_path} ({previous.get('revision')})")
+    for section in ("ingest", "queue_lag", "delivery", "memory"):
+        for key, value in result[section].items():
+            old = previous.get(section, {}).get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+                print(f"  {section}.{key:<18}{old:>12.2f} -> {value:>12.2f}  {change}")
+
+
+def main():
+    args = parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    path = save(result, args.output)
+    print(f"\n结果已保存到 {path}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
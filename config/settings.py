@@ -8,6 +8,7 @@ load_dotenv()
 
 # Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')  # 可指向自建 Bot API 服务
 # ADMIN_USER_IDS: Set[int] = set(map(int, os.getenv('ADMIN_USER_IDS', '').split(',')))
 
 # Telegram Bot Instance
@@ -27,6 +28,18 @@ def get_telegram_bot_instance():
 EMBY_URL = os.getenv('EMBY_URL', '').rstrip('/')
 EMBY_API_KEY = os.getenv('EMBY_API_KEY')
 EMBY_SERVERS = os.getenv('EMBY_SERVERS', [])
+EMBY_SERVER_ID = os.getenv('EMBY_SERVER_ID', '')  # EMBY_URL 对应的服务器ID，留空时处理所有未登记的服务器
+EMBY_REQUEST_RATE = float(os.getenv('EMBY_REQUEST_RATE', '50'))  # 每台 Emby 服务器每秒最多请求数
+EMBY_REQUEST_BURST = float(os.getenv('EMBY_REQUEST_BURST', '20'))
+EMBY_POOL_LIMIT = int(os.getenv('EMBY_POOL_LIMIT', '20'))  # 每台 Emby 服务器的最大连接数
+EMBY_ENRICH_ENABLED = os.getenv('EMBY_ENRICH_ENABLED', 'true').lower() == 'true'  # 从 Emby 补全 webhook 中缺少的展示字段
+# 需要补全的字段，SeriesId/SeriesName/ParentIndexNumber/IndexNumber 只对剧集检查
+EMBY_ENRICH_FIELDS = [f for f in os.getenv(
+    'EMBY_ENRICH_FIELDS', 'Width,Height,RunTimeTicks,Size,Container,SeriesId,SeriesName,ParentIndexNumber,IndexNumber'
+).replace(' ', '').split(',') if f]
+EMBY_BATCH_WINDOW_MS = float(os.getenv('EMBY_BATCH_WINDOW_MS', '20'))  # 合并条目查询的等待时间(毫秒)
+EMBY_BATCH_SIZE = int(os.getenv('EMBY_BATCH_SIZE', '50'))  # 一次 /Items?Ids= 查询最多包含的条目数
+EMBY_ITEM_CACHE_TTL = float(os.getenv('EMBY_ITEM_CACHE_TTL', '600'))  # 条目查询结果缓存时间(秒)
 
 # Database Configuration
 DATABASE_FILE = os.getenv('DATABASE_FILE', "emby_bot.db")
@@ -56,6 +69,10 @@ LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d -
 LOG_DIR = "logs"
 LOG_FILE_MAX_BYTES = 10 * 1024 * 1024  # 10MB
 LOG_FILE_BACKUP_COUNT = 5
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'  # 是否在后台线程中写日志
+LOG_MAX_MESSAGE_CHARS = int(os.getenv('LOG_MAX_MESSAGE_CHARS', '8000'))  # 单条日志最大字符数，0 表示不限制
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))  # 非 DEBUG 级别下记录原始请求体的比例
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '2000'))  # 记录原始请求体的最大字符数
 
 # Registration Configuration
 DEFAULT_PASSWORD_LENGTH = 12
@@ -68,6 +85,103 @@ PROXY_URL = os.getenv('PROXY_URL', 'socks5://127.0.0.1:7890')
 WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
 WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8000'))
 WEBHOOK_CHANNEL_ID = os.getenv('WEBHOOK_CHANNEL_ID')  # 通知发送的目标频道ID
+NOTIFICATION_ROUTES = os.getenv('NOTIFICATION_ROUTES', '')  # 通知路由表(JSON)，为空时全部发送到 WEBHOOK_CHANNEL_ID
+# 部署模式: single 为单进程；split 为 INGEST_WORKERS 个接收进程 + 1 个分发进程，通过共享的 SQLite 收件箱传递事件
+DEPLOYMENT_MODE = os.getenv('DEPLOYMENT_MODE', 'single').lower()
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', str(os.cpu_count() or 1)))  # split 模式下的接收进程数
+DISPATCHER_PORT = int(os.getenv('DISPATCHER_PORT', '8001'))  # split 模式下分发进程的 /metrics 和 /admin 端口
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '20'))  # 收到 SIGTERM 后排空消息队列的最长时间(秒)
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN', '')  # /admin 接口的访问令牌(Authorization: Bearer)，为空时禁用管理接口
+
+# HTTP Client Configuration
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '100'))  # 每个上游会话的最大连接数
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '0'))  # 单主机最大连接数，0 表示不限制
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30'))  # 空闲连接保持时间(秒)
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))  # DNS 缓存时间(秒)
+HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', '30'))  # 请求总超时(秒)
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))  # 建立连接超时(秒)
+
+# Library Cache Configuration
+LIBRARY_CACHE_TTL = float(os.getenv('LIBRARY_CACHE_TTL', '3600'))  # 媒体库名称缓存时间(秒)
+LIBRARY_CACHE_SIZE = int(os.getenv('LIBRARY_CACHE_SIZE', '10000'))  # 媒体库名称缓存最大条目数
+
+# Caption Template Configuration
+CAPTION_TEMPLATE_DIR = os.getenv('CAPTION_TEMPLATE_DIR', 'templates')  # 自定义模板目录，文件名为 <事件类型>.html
+
+# Data Directory
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+# Notification Image Configuration
+IMAGE_UPLOAD_ENABLED = os.getenv('IMAGE_UPLOAD_ENABLED', 'true').lower() == 'true'  # 由本服务下载图片并上传，而不是让 Telegram 拉取 Emby 地址
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '1280'))  # 图片最长边(像素)，0 表示不缩放
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))  # 重新压缩的 JPEG 质量
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(5 * 1024 * 1024)))  # 超过该大小的图片会被重新压缩(Telegram 上限 10MB)
+IMAGE_FILE_ID_CACHE_SIZE = int(os.getenv('IMAGE_FILE_ID_CACHE_SIZE', '50000'))  # 内存中缓存的 file_id 数量
+IMAGE_FILE_ID_DB_FILE = os.getenv('IMAGE_FILE_ID_DB_FILE', os.path.join(DATA_DIR, 'file_ids.db'))
+
+# Notification Archive Configuration
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'true').lower() == 'true'  # 是否归档原始通知
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '../notifications')
+ARCHIVE_COMPRESS = os.getenv('ARCHIVE_COMPRESS', 'true').lower() == 'true'  # 是否使用 gzip 压缩分段
+ARCHIVE_SEGMENT_MAX_MB = float(os.getenv('ARCHIVE_SEGMENT_MAX_MB', '64'))  # 单个分段最大大小(MB，压缩前)
+ARCHIVE_SEGMENT_MAX_AGE = float(os.getenv('ARCHIVE_SEGMENT_MAX_AGE', '3600'))  # 单个分段最长时间(秒)
+ARCHIVE_FLUSH_INTERVAL_MS = float(os.getenv('ARCHIVE_FLUSH_INTERVAL_MS', '1000'))  # 批量写入间隔(毫秒)
+ARCHIVE_MAX_PENDING = int(os.getenv('ARCHIVE_MAX_PENDING', '10000'))  # 缓冲区最大记录数，超出后丢弃
+
+# Message Queue Configuration
+QUEUE_JOURNAL_ENABLED = os.getenv('QUEUE_JOURNAL_ENABLED', 'true').lower() == 'true'  # 是否持久化队列
+QUEUE_JOURNAL_FILE = os.getenv('QUEUE_JOURNAL_FILE', os.path.join(DATA_DIR, 'message_queue.db'))
+QUEUE_GROUP_COMMIT_MS = float(os.getenv('QUEUE_GROUP_COMMIT_MS', '2'))  # 组提交等待窗口(毫秒)
+QUEUE_COMPACT_EVERY = int(os.getenv('QUEUE_COMPACT_EVERY', '1000'))  # 每确认多少条消息压缩一次日志
+QUEUE_RENDER_CONCURRENCY = int(os.getenv('QUEUE_RENDER_CONCURRENCY', '20'))  # 同时构建通知(媒体库查询、图片下载)的最大事件数
+QUEUE_BATCH_WINDOW_MS = float(os.getenv('QUEUE_BATCH_WINDOW_MS', '500'))  # 合并同一目标消息的等待窗口(毫秒)
+QUEUE_BATCH_SIZE = min(int(os.getenv('QUEUE_BATCH_SIZE', '10')), 10)  # 每批最多合并的消息数，1 表示不合并
+QUEUE_MEMORY_LIMIT = int(os.getenv('QUEUE_MEMORY_LIMIT', '1000'))  # 内存中最多保留的待处理事件数，超出部分溢出到磁盘
+QUEUE_LANE_LIMIT = int(os.getenv('QUEUE_LANE_LIMIT', '1000'))  # 单个目标队列最多消息数，达到后只暂存该目标的后续消息，暂存总数达到 QUEUE_MEMORY_LIMIT 时暂停分发
+QUEUE_IMAGE_BYTES_LIMIT = int(os.getenv('QUEUE_IMAGE_BYTES_LIMIT', str(256 * 1024 * 1024)))  # 已分发、尚未发送完的通知持有的图片数据上限(字节)，达到后暂停分发
+QUEUE_SPILL_FILE = os.getenv('QUEUE_SPILL_FILE', os.path.join(DATA_DIR, 'message_spill.db'))  # 未启用日志时的溢出文件
+QUEUE_HIGH_WATERMARK = int(os.getenv('QUEUE_HIGH_WATERMARK', '20000'))  # 积压达到该值时开始拒绝新事件
+QUEUE_LOW_WATERMARK = int(os.getenv('QUEUE_LOW_WATERMARK', '10000'))  # 积压降到该值以下时恢复接收
+QUEUE_BACKPRESSURE_ENABLED = os.getenv('QUEUE_BACKPRESSURE_ENABLED', 'false').lower() == 'true'  # 超过高水位时 /webhook 返回 503
+QUEUE_RETRY_AFTER = int(os.getenv('QUEUE_RETRY_AFTER', '60'))  # 503 响应中的 Retry-After(秒)
+# 条目类型 -> 优先级(high/normal/low)，未列出的类型为 normal，重试的消息总是排在最后
+QUEUE_PRIORITY_TYPES = dict(
+    entry.split(':', 1) for entry in
+    os.getenv('QUEUE_PRIORITY_TYPES', 'Movie:high,Episode:normal,Audio:low').replace(' ', '').split(',')
+    if ':' in entry
+)
+QUEUE_RETRY_MAX_ATTEMPTS = int(os.getenv('QUEUE_RETRY_MAX_ATTEMPTS', '5'))  # 临时故障最多发送次数，耗尽后进入死信存储
+QUEUE_RETRY_BASE_DELAY = float(os.getenv('QUEUE_RETRY_BASE_DELAY', '2'))  # 后台重试的初始退避(秒)，每次翻倍
+QUEUE_RETRY_MAX_DELAY = float(os.getenv('QUEUE_RETRY_MAX_DELAY', '300'))  # 后台重试的最大退避(秒)
+DEAD_LETTER_DB_FILE = os.getenv('DEAD_LETTER_DB_FILE', os.path.join(DATA_DIR, 'dead_letters.db'))
+# 批量入库汇总: auto 按到达速率自动开启，on 始终开启，off 关闭
+DIGEST_MODE = os.getenv('DIGEST_MODE', 'auto').lower()
+DIGEST_RATE_THRESHOLD = float(os.getenv('DIGEST_RATE_THRESHOLD', '30'))  # 自动开启汇总的到达速率(条/分钟)
+DIGEST_WINDOW = float(os.getenv('DIGEST_WINDOW', '60'))  # 汇总模式下每个目标收集消息的时间窗口(秒)
+DIGEST_MIN_ITEMS = int(os.getenv('DIGEST_MIN_ITEMS', '3'))  # 同一组达到该数量才合并为汇总消息
+DIGEST_MAX_ITEMS = int(os.getenv('DIGEST_MAX_ITEMS', '500'))  # 一个窗口内最多收集的消息数
+DIGEST_MAX_TITLES = int(os.getenv('DIGEST_MAX_TITLES', '50'))  # 汇总消息中列出的标题数
+DIGEST_GROUP_BY = os.getenv('DIGEST_GROUP_BY', 'auto').lower()  # 分组方式: auto(剧集/媒体库)、parent(剧集/父文件夹)、library
+
+# Ingest Inbox Configuration (split 部署模式)
+INGEST_QUEUE_FILE = os.getenv('INGEST_QUEUE_FILE', os.path.join(DATA_DIR, 'ingest.db'))
+INGEST_POLL_MS = float(os.getenv('INGEST_POLL_MS', '20'))  # 收件箱为空时分发进程的轮询间隔(毫秒)
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '500'))  # 分发进程每次从收件箱读取的最大事件数
+
+# Duplicate Suppression Configuration
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'  # 是否抑制重复的 library.new 事件
+DEDUP_WINDOW_SECONDS = float(os.getenv('DEDUP_WINDOW_SECONDS', '86400'))  # 抑制窗口(秒)
+DEDUP_KEYS = [k.strip() for k in os.getenv('DEDUP_KEYS', 'item_id,title').split(',') if k.strip()]  # 可选 item_id,title,path
+DEDUP_MAX_ENTRIES = int(os.getenv('DEDUP_MAX_ENTRIES', '100000'))  # 内存中最多保留的键数量
+DEDUP_DB_FILE = os.getenv('DEDUP_DB_FILE', os.path.join(DATA_DIR, 'dedup.db'))
+
+# Telegram Rate Limit Configuration
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))  # 每个 bot 每秒最多消息数
+TELEGRAM_GLOBAL_BURST = float(os.getenv('TELEGRAM_GLOBAL_BURST', '30'))
+TELEGRAM_PRIVATE_RATE = float(os.getenv('TELEGRAM_PRIVATE_RATE', '1'))  # 私聊每秒最多消息数
+TELEGRAM_PRIVATE_BURST = float(os.getenv('TELEGRAM_PRIVATE_BURST', '1'))
+TELEGRAM_GROUP_RATE_PER_MIN = float(os.getenv('TELEGRAM_GROUP_RATE_PER_MIN', '20'))  # 群组/频道每分钟最多消息数
+TELEGRAM_GROUP_BURST = float(os.getenv('TELEGRAM_GROUP_BURST', '3'))
 
 # Membership Check Configuration
 REQUIRED_CHANNEL_ID = int(os.getenv('REQUIRED_CHANNEL_ID', '0'))  # 必须加入的频道ID
@@ -0,0 +1,148 @@
+"""
+split 部署模式的 ingest 进程
+
+只负责接收、校验和归档 webhook，把需要通知的事件追加到共享的 SQLite 收件箱，不保存任何发送状态，
+因此可以由 uvicorn 以多个 worker 进程运行:
+    uvicorn emby_ingest:create_ingest_app --factory --workers 4
+消息队列、去重和 Telegram 速率限制只存在于分发进程中(见 emby_webhook.run_dispatcher_server)。
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from config.settings import (
+    ARCHIVE_ENABLED,
+    ARCHIVE_DIR,
+    ARCHIVE_COMPRESS,
+    ARCHIVE_SEGMENT_MAX_MB,
+    ARCHIVE_SEGMENT_MAX_AGE,
+    ARCHIVE_FLUSH_INTERVAL_MS,
+    ARCHIVE_MAX_PENDING,
+    INGEST_QUEUE_FILE,
+    QUEUE_BACKPRESSURE_ENABLED,
+    QUEUE_HIGH_WATERMARK,
+    QUEUE_LOW_WATERMARK,
+    QUEUE_RETRY_AFTER
+)
+from models.projection import WebhookView
+from utils.archive import NotificationArchive
+from utils.ingest_queue import IngestQueue
+from utils.logger import LazyPayload, Logger, should_log_payload
+from utils.metrics import metrics
+
+logger = Logger().get_logger()
+
+INGEST_SECONDS = metrics.histogram("webhook_ingest_seconds", "/webhook 请求处理耗时")
+PARSE_SECONDS = metrics.histogram("webhook_parse_seconds", "webhook 请求体解析校验耗时")
+EVENTS_TOTAL = metrics.counter("webhook_events_total", "收到的 webhook 事件数", ["event"])
+INGEST_ERRORS_TOTAL = metrics.counter("webhook_ingest_errors_total", "处理失败的 webhook 请求数")
+REJECTED_TOTAL = metrics.counter("webhook_rejected_total", "队列积压过高时以 503 拒绝的请求数")
+
+
+def create_ingest_app() -> FastAPI:
+    """创建 ingest 进程的应用，每个 worker 进程调用一次"""
+    ingest_queue = IngestQueue(INGEST_QUEUE_FILE)
+    archive = NotificationArchive(
+        ARCHIVE_DIR,
+        compress=ARCHIVE_COMPRESS,
+        segment_max_bytes=int(ARCHIVE_SEGMENT_MAX_MB * 1024 * 1024),
+        segment_max_age=ARCHIVE_SEGMENT_MAX_AGE,
+        flush_interval=ARCHIVE_FLUSH_INTERVAL_MS / 1000,
+        max_pending=ARCHIVE_MAX_PENDING,
+        segment_prefix=f"notifications_{os.getpid()}"
+    )
+    # 收件箱积压(由后台任务每秒刷新)和是否接收新事件，超过高水位后降到低水位以下才恢复
+    state = {'backlog': 0, 'accepting': True}
+
+    async def watch_backlog():
+        while True:
+            backlog = state['backlog'] = await asyncio.to_thread(ingest_queue.backlog)
+            if state['accepting'] and backlog >= QUEUE_HIGH_WATERMARK:
+                state['accepting'] = False
+                logger.warning(f"收件箱积压 {backlog} 条，超过高水位 {QUEUE_HIGH_WATERMARK}，暂停接收新事件")
+            elif not state['accepting'] and backlog <= QUEUE_LOW_WATERMARK:
+                state['accepting'] = True
+                logger.info(f"收件箱积压降到 {backlog} 条，恢复接收新事件")
+            await asyncio.sleep(1)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        ingest_queue.open(writer=True)
+        if ARCHIVE_ENABLED:
+            archive.start()
+        watcher = asyncio.create_task(watch_backlog()) if QUEUE_BACKPRESSURE_ENABLED else None
+        logger.info(f"ingest 进程 {os.getpid()} 已启动")
+        try:
+            yield
+        finally:
+            if watcher:
+                watcher.cancel()
+            # 缓冲区中剩余的事件提交到收件箱后再退出
+            await asyncio.to_thread(ingest_queue.close)
+            archive.stop()
+
+    app = FastAPI(title="Emby Webhook Ingest", lifespan=lifespan)
+
+    metrics.callback("ingest_inbox_backlog", "收件箱中等待分发进程处理的事件数(本进程最近一次读取)",
+                     lambda: state['backlog'])
+    metrics.callback("ingest_inbox_appended_total", "本进程写入收件箱的事件数",
+                     lambda: ingest_queue.stats['appended'], kind="counter")
+
+    @app.post("/webhook")
+    async def webhook(request: Request):
+        """接收 Emby 的 Webhook 通知"""
+        start = time.perf_counter()
+        if QUEUE_BACKPRESSURE_ENABLED and not state['accepting']:
+            REJECTED_TOTAL.inc()
+            return JSONResponse(
+                status_code=503,
+                content={"status": "error", "message": "Queue is full, retry later"},
+                headers={"Retry-After": str(QUEUE_RETRY_AFTER)}
+            )
+        try:
+            body = await request.body()
+
+            # 抽样记录原始数据用于调试，解码和截断在日志线程中完成
+            if should_log_payload(logger):
+                logger.info("原始数据: %s", LazyPayload(body))
+
+            # 只校验请求体，分发进程会从原始字节重新解析
+            parse_start = time.perf_counter()
+            webhook_data = WebhookView.parse(body)
+            PARSE_SECONDS.observe(time.perf_counter() - parse_start)
+            EVENTS_TOTAL.labels(webhook_data.Event).inc()
+
+            if ARCHIVE_ENABLED:
+                archive.submit(webhook_data.Event, body)
+            if webhook_data.Event == 'library.new':
+                ingest_queue.append(webhook_data.Event, body)
+
+            return {
+                "status": "success",
+                "message": f"Successfully queued {webhook_data.Event} event",
+                "title": webhook_data.Title
+            }
+
+        except Exception as e:
+            INGEST_ERRORS_TOTAL.inc()
+            logger.error(f"处理webhook时发生错误: {str(e)}")
+            return {"status": "error", "message": str(e)}
+
+        finally:
+            INGEST_SECONDS.observe(time.perf_counter() - start)
+
+    @app.get("/")
+    async def root():
+        """服务器状态检查"""
+        return {"status": "running"}
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        """本 ingest 进程的 Prometheus 指标"""
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    return app
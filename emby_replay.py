@@ -0,0 +1,325 @@
+"""
+归档通知回放工具
+
+按接收时间顺序流式读取通知归档(ARCHIVE_DIR 中的 JSONL 分段和旧版本的单事件 JSON 文件)，
+经过与 webhook 相同的 解析校验 -> 构建通知 -> 发送 流程，用于给新频道回填历史通知，
+或用成千上万条真实数据对模板和渲染做回归测试。结束时输出各阶段的吞吐量。
+
+发送目标(--sink):
+    dry-run   只构建通知不发送，--output 把渲染结果写入 JSONL 文件，可对比修改前后的输出
+    fake      发送到本地 Telegram Bot API 替身(benchmarks.fakes)，测量整条流程的吞吐量
+    telegram  发送到真实的 Telegram，遵守配置的速率限制
+
+    python emby_replay.py --output /tmp/captions.jsonl
+    python emby_replay.py --sink fake --limit 5000 --telegram-latency 50
+    python emby_replay.py --sink telegram --chat-id -1001234567890 --since 2025-07-01
+
+发送时仍要从 Emby 下载图片，吞吐量受每台服务器的 EMBY_REQUEST_RATE 限制。
+回放不使用服务的持久化队列、溢出文件、死信存储和去重索引，可以在服务运行时执行。
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+SINK_DRY_RUN = 'dry-run'
+SINK_FAKE = 'fake'
+SINK_TELEGRAM = 'telegram'
+
+# 读取线程每次交给事件循环的记录数，以及最多预读的批数
+CHUNK_SIZE = 256
+READ_AHEAD = 4
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="按时间顺序回放归档的通知")
+    parser.add_argument("--dir", help="归档目录，默认为 ARCHIVE_DIR")
+    parser.add_argument("--sink", choices=(SINK_DRY_RUN, SINK_FAKE, SINK_TELEGRAM), default=SINK_DRY_RUN,
+                        help="发送目标")
+    parser.add_argument("--chat-id", help="发送到该聊天，默认按 NOTIFICATION_ROUTES / WEBHOOK_CHANNEL_ID 路由")
+    parser.add_argument("--events", default="library.new", help="回放的事件类型，逗号分隔，all 表示全部")
+    parser.add_argument("--since", help="只回放该时间之后接收的通知(ISO 格式，如 2025-07-01 或 2025-07-01T12:00)")
+    parser.add_argument("--until", help="只回放该时间之前接收的通知(ISO 格式)")
+    parser.add_argument("--limit", type=int, default=0, help="最多回放的通知数，0 表示不限制")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时构建的通知数")
+    parser.add_argument("--output", help="dry-run: 渲染结果写入该 JSONL 文件")
+    parser.add_argument("--digest", choices=("off", "auto", "on"), default="off", help="汇总模式(DIGEST_MODE)")
+    parser.add_argument("--offline", action="store_true", help="不请求 Emby，媒体库名称和图片均为空")
+    parser.add_argument("--telegram-latency", type=float, default=0, help="fake: 替身 Telegram 响应延迟(毫秒)")
+    parser.add_argument("--drain-timeout", type=float, default=3600, help="读取完成后等待发送完毕的最长秒数")
+    parser.add_argument("--progress", type=float, default=5, help="进度输出间隔(秒)，0 表示不输出")
+    args = parser.parse_args()
+    if args.output and args.sink != SINK_DRY_RUN:
+        parser.error("--output 只用于 dry-run")
+    return args
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def configure_environment(args, telegram_url=None):
+    """配置在导入服务模块前设置，回放不读写服务的持久化状态"""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["QUEUE_JOURNAL_ENABLED"] = "false"
+    os.environ["QUEUE_RENDER_CONCURRENCY"] = str(args.concurrency)
+    os.environ["DIGEST_MODE"] = args.digest
+    if args.offline:
+        os.environ["EMBY_URL"] = ""
+        os.environ["EMBY_SERVERS"] = ""
+    if args.sink == SINK_DRY_RUN:
+        # 只需要图片地址，不下载图片
+        os.environ["IMAGE_UPLOAD_ENABLED"] = "false"
+    if args.sink == SINK_FAKE:
+        # 替身不限速，测量的是回放流程本身的吞吐量
+        os.environ["TELEGRAM_API_URL"] = telegram_url
+        os.environ.setdefault("TELEGRAM_BOT_TOKEN", "replay")
+        os.environ.setdefault("WEBHOOK_CHANNEL_ID", "-1001")
+        os.environ["TELEGRAM_GROUP_RATE_PER_MIN"] = "60000"
+        os.environ["TELEGRAM_GLOBAL_RATE"] = "1000"
+        os.environ["TELEGRAM_GLOBAL_BURST"] = "1000"
+
+
+class Stats:
+    """回放计数和各阶段耗时"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.parse_errors = 0
+        self.parse_seconds = 0.0
+        self.rendered = 0
+        self.render_errors = 0
+        self.queued = 0
+        self.events = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+def read_archive(reader, limit: int, chunks: "queue.Queue", stats: Stats, stop: threading.Event) -> None:
+    """
+    读取线程: 解压、切分和解析校验都在这里完成，与事件循环中的构建和发送并行
+
+    chunks 有界，事件循环处理不过来时读取线程等待，内存中最多保留 READ_AHEAD 批记录
+    """
+    from models.projection import WebhookView
+
+    chunk = []
+    try:
+        for record in reader:
+            if stop.is_set():
+                break
+            start = time.perf_counter()
+            try:
+                view = WebhookView.parse(record.payload)
+            except Exception as e:
+                stats.parse_errors += 1
+                print(f"解析 {record.source} 中 {datetime.fromtimestamp(record.received_at)} 的通知失败: {e}",
+                      file=sys.stderr)
+                continue
+            finally:
+                stats.parse_seconds += time.perf_counter() - start
+            stats.read += 1
+            stats.events[record.event] = stats.events.get(record.event, 0) + 1
+            chunk.append((record, view))
+            if len(chunk) >= CHUNK_SIZE:
+                chunks.put(chunk)
+                chunk = []
+            if limit and stats.read >= limit:
+                break
+        if chunk:
+            chunks.put(chunk)
+    except Exception as e:
+        chunks.put(e)
+    finally:
+        chunks.put(None)
+
+
+def render_entry(record, view, notification) -> dict:
+    """dry-run 输出的一行"""
+    photo = notification["photo"]
+    return {
+        "received_at": datetime.fromtimestamp(record.received_at).isoformat(),
+        "event": view.Event,
+        "item_id": view.Item.Id,
+        "title": view.Title,
+        "library": notification["library"],
+        "photo": photo.key if photo else None,
+        "caption": notification["caption"],
+    }
+
+
+async def render_chunk(handler, chunk, semaphore: asyncio.Semaphore, output, stats: Stats) -> None:
+    """并发构建一批通知，按原顺序写入输出"""
+    async def build(view):
+        async with semaphore:
+            return await handler.build_notification(view)
+
+    results = await asyncio.gather(*(build(view) for _, view in chunk), return_exceptions=True)
+    for (record, view), notification in zip(chunk, results):
+        if isinstance(notification, BaseException) or notification is None:
+            stats.render_errors += 1
+            reason = notification if notification is not None else "没有条目信息"
+            print(f"构建 {view.Title} 的通知失败: {reason}", file=sys.stderr)
+            continue
+        stats.rendered += 1
+        if output:
+            output.write(json.dumps(render_entry(record, view, notification), ensure_ascii=False) + "\n")
+
+
+async def queue_chunk(message_queue, chunk, backlog: int, stats: Stats) -> None:
+    """按时间顺序放入消息队列，队列积压达到 backlog 时等待"""
+    for _, view in chunk:
+        while len(message_queue) >= backlog:
+            await asyncio.sleep(0.01)
+        await message_queue.add_message({'webhook': view, 'event_type': view.Event})
+        stats.queued += 1
+
+
+async def report_progress(args, stats: Stats, message_queue=None) -> None:
+    while True:
+        await asyncio.sleep(args.progress)
+        done = stats.rendered + stats.render_errors if message_queue is None else stats.queued - len(message_queue)
+        print(f"[{stats.elapsed():7.1f}s] 已读取 {stats.read} 条，已处理 {done} 条，"
+              f"{done / stats.elapsed():.0f} 条/秒", file=sys.stderr)
+
+
+def print_report(args, reader, stats: Stats, elapsed: float, handler, message_queue=None, telegram=None) -> None:
+    def rate(count, seconds):
+        return f"{count / seconds:>10.1f} 条/秒" if seconds > 0 else f"{'-':>10}"
+
+    print(f"\n回放 {args.dir}，发送目标 {args.sink}，并发 {args.concurrency}")
+    print(f"  读取的文件                   {reader.stats['files']:>10}")
+    print(f"  回放的通知                   {stats.read:>10}   "
+          + ", ".join(f"{event} {count}" for event, count in sorted(stats.events.items())))
+    print(f"  按条件跳过                   {reader.stats['skipped']:>10}")
+    print(f"  损坏的记录                   {reader.stats['errors']:>10}")
+    print(f"  解析失败                     {stats.parse_errors:>10}")
+    print(f"  解析校验                     {stats.parse_seconds:>10.2f} s {rate(stats.read, stats.parse_seconds)}")
+    if message_queue is None:
+        print(f"  构建通知                     {stats.rendered:>10}   失败 {stats.render_errors}")
+    else:
+        failures = message_queue.failure_stats
+        remaining = len(message_queue)
+        print(f"  放入队列                     {stats.queued:>10}")
+        print(f"  处理完成                     {stats.queued - remaining:>10}   未完成 {remaining}")
+        print(f"  Telegram API 调用            {handler.stats['telegram_api_calls']:>10}")
+        print(f"  发送失败(重试/死信)          {failures['retried']:>10} / {failures['dead_lettered']}")
+        if telegram is not None:
+            print(f"  替身收到的消息               {len(telegram.deliveries):>10}")
+        if message_queue.digest.stats['digests']:
+            print(f"  汇总消息                     {message_queue.digest.stats['digests']:>10}   "
+                  f"合并 {message_queue.digest.stats['digested']} 条")
+    items = handler.items.stats
+    if items['lookups']:
+        print(f"  Emby 条目查询                {items['lookups']:>10}   请求 {items['requests']} 次，"
+              f"缓存命中 {items['cache_hits']}")
+    print(f"  总耗时                       {elapsed:>10.2f} s {rate(stats.read, elapsed)}")
+
+
+async def replay(args) -> int:
+    telegram = None
+    if args.sink == SINK_FAKE:
+        from benchmarks.fakes import FakeTelegramServer
+
+        telegram = FakeTelegramServer(latency=args.telegram_latency / 1000)
+        configure_environment(args, await telegram.start())
+    else:
+        configure_environment(args)
+
+    # 服务模块在导入时读取配置
+    from config.settings import ARCHIVE_DIR
+    from handlers.webhook_handler import WebhookHandler
+    from utils.archive import ArchiveReader
+    from utils.dead_letters import DeadLetterStore
+    from utils.http_client import http_pool
+    from utils.message_queue import MessageQueue
+    from utils.routing import NotificationRouter, Route
+
+    args.dir = args.dir or ARCHIVE_DIR
+    if not os.path.isdir(args.dir):
+        print(f"归档目录不存在: {args.dir}", file=sys.stderr)
+        return 2
+    events = None if args.events == "all" else [event.strip() for event in args.events.split(",") if event.strip()]
+    reader = ArchiveReader(args.dir, events=events, since=parse_time(args.since), until=parse_time(args.until))
+
+    handler = WebhookHandler()
+    if args.sink != SINK_TELEGRAM:
+        # 替身返回的 file_id 不能写入服务的 file_id 缓存
+        handler.images.db_file = None
+    message_queue = None
+    if args.sink != SINK_DRY_RUN:
+        router = NotificationRouter([Route(args.chat_id)]) if args.chat_id else None
+        message_queue = MessageQueue(handler, router=router, spill_file=None, dead_letters=DeadLetterStore(None))
+        if not message_queue.router.routes:
+            print("没有发送目标: 请指定 --chat-id 或配置 NOTIFICATION_ROUTES / WEBHOOK_CHANNEL_ID", file=sys.stderr)
+            return 2
+
+    await http_pool.start('telegram', *(server.session_name for server in handler.servers))
+    await handler.images.start()
+    if message_queue is not None:
+        await message_queue.start_processing()
+
+    stats = Stats()
+    chunks: "queue.Queue" = queue.Queue(maxsize=READ_AHEAD)
+    stop = threading.Event()
+    thread = threading.Thread(target=read_archive, args=(reader, args.limit, chunks, stats, stop),
+                              name="archive-reader", daemon=True)
+    progress = asyncio.create_task(report_progress(args, stats, message_queue)) if args.progress > 0 else None
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    backlog = max(1, args.concurrency) * 8
+    thread.start()
+    try:
+        while True:
+            chunk = await asyncio.to_thread(chunks.get)
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            if message_queue is None:
+                await render_chunk(handler, chunk, semaphore, output, stats)
+            else:
+                await queue_chunk(message_queue, chunk, backlog, stats)
+
+        if message_queue is not None:
+            # 等待队列和后台重试全部完成
+            deadline = time.perf_counter() + args.drain_timeout
+            while message_queue.pending_retries and time.perf_counter() < deadline:
+                await message_queue.drain(max(0.0, deadline - time.perf_counter()))
+                await asyncio.sleep(0.05)
+            await message_queue.drain(max(0.0, deadline - time.perf_counter()))
+        elapsed = stats.elapsed()
+    finally:
+        stop.set()
+        if progress:
+            progress.cancel()
+        if output:
+            output.close()
+        if message_queue is not None:
+            await message_queue.stop_processing()
+        await http_pool.close()
+        await handler.images.stop()
+        if telegram is not None:
+            await telegram.stop()
+
+    print_report(args, reader, stats, elapsed, handler, message_queue, telegram)
+    failed = stats.parse_errors + stats.render_errors
+    if message_queue is not None:
+        failed += message_queue.failure_stats['dead_lettered'] + len(message_queue)
+    return 1 if failed else 0
+
+
+def main():
+    args = parse_args()
+    sys.exit(asyncio.run(replay(args)))
+
+
+if __name__ == "__main__":
+    main()
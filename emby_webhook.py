@@ -1,18 +1,49 @@
+import asyncio
+import hmac
 import json
-from datetime import datetime
-from pathlib import Path
+import os
+import sys
+import time
+from typing import Optional
 
-import uvicorn
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from config.settings import (
     WEBHOOK_HOST,
-    WEBHOOK_PORT
+    WEBHOOK_PORT,
+    ARCHIVE_ENABLED,
+    ARCHIVE_DIR,
+    ARCHIVE_COMPRESS,
+    ARCHIVE_SEGMENT_MAX_MB,
+    ARCHIVE_SEGMENT_MAX_AGE,
+    ARCHIVE_FLUSH_INTERVAL_MS,
+    ARCHIVE_MAX_PENDING,
+    DEDUP_ENABLED,
+    DEDUP_WINDOW_SECONDS,
+    DEDUP_KEYS,
+    DEDUP_MAX_ENTRIES,
+    DEDUP_DB_FILE,
+    QUEUE_BACKPRESSURE_ENABLED,
+    QUEUE_RETRY_AFTER,
+    ADMIN_API_TOKEN,
+    INGEST_WORKERS,
+    INGEST_QUEUE_FILE,
+    INGEST_POLL_MS,
+    INGEST_BATCH_SIZE,
+    DISPATCHER_PORT,
+    SHUTDOWN_DRAIN_TIMEOUT
 )
 from handlers.webhook_handler import WebhookHandler
-from models.webhook import EmbyWebhook
-from utils.logger import Logger
+from models.projection import WebhookView
+from utils.archive import NotificationArchive
+from utils.dedup import DuplicateFilter
+from utils.http_client import http_pool
+from utils.ingest_queue import IngestQueue
+from utils.logger import LazyPayload, Logger, should_log_payload
 from utils.message_queue import MessageQueue
+from utils.metrics import metrics
+from utils import runtime
 
 # 配置日志
 logger = Logger().get_logger()
@@ -20,50 +51,230 @@ logger = Logger().get_logger()
 # 创建 webhook handler
 webhook_handler = WebhookHandler()
 
-# 创建消息队列
-message_queue = MessageQueue()
+# 创建消息队列，与 webhook 共用同一个 handler
+message_queue = MessageQueue(webhook_handler)
 
-# 创建存储目录
-NOTIFICATION_DIR = Path("../notifications")
-NOTIFICATION_DIR.mkdir(exist_ok=True)
+# 创建通知归档写入器
+notification_archive = NotificationArchive(
+    ARCHIVE_DIR,
+    compress=ARCHIVE_COMPRESS,
+    segment_max_bytes=int(ARCHIVE_SEGMENT_MAX_MB * 1024 * 1024),
+    segment_max_age=ARCHIVE_SEGMENT_MAX_AGE,
+    flush_interval=ARCHIVE_FLUSH_INTERVAL_MS / 1000,
+    max_pending=ARCHIVE_MAX_PENDING
+)
+
+
+# 创建重复事件过滤器
+duplicate_filter = DuplicateFilter(
+    DEDUP_DB_FILE,
+    window=DEDUP_WINDOW_SECONDS,
+    max_entries=DEDUP_MAX_ENTRIES,
+    strategies=DEDUP_KEYS
+)
+
+# 指标
+INGEST_SECONDS = metrics.histogram("webhook_ingest_seconds", "/webhook 请求处理耗时")
+PARSE_SECONDS = metrics.histogram("webhook_parse_seconds", "webhook 请求体解析校验耗时")
+EVENTS_TOTAL = metrics.counter("webhook_events_total", "收到的 webhook 事件数", ["event"])
+INGEST_ERRORS_TOTAL = metrics.counter("webhook_ingest_errors_total", "处理失败的 webhook 请求数")
+DUPLICATES_TOTAL = metrics.counter("webhook_duplicates_suppressed_total", "被抑制的重复事件数", ["key"])
+REJECTED_TOTAL = metrics.counter("webhook_rejected_total", "队列积压过高时以 503 拒绝的请求数")
+
+
+def register_metrics():
+    """注册从各组件现有统计中读取的指标"""
+    metrics.callback("message_queue_depth", "队列中待发送的消息数", lambda: len(message_queue))
+    metrics.callback("message_queue_destination_depth", "各目标队列中待发送的消息数",
+                     message_queue.depths, labelnames=["destination"])
+    metrics.callback("message_queue_spilled", "溢出到磁盘、等待读回的事件数", message_queue.spilled)
+    metrics.callback("message_queue_image_bytes", "已分发、尚未发送完的消息持有的图片数据字节数",
+                     message_queue.image_bytes)
+    metrics.callback("message_queue_accepting", "队列是否接收新事件(低于高水位为 1)",
+                     lambda: int(message_queue.accepting()))
+    metrics.callback("message_queue_failures_total", "发送失败次数及后续处理(重试、进入死信)",
+                     lambda: {(key,): value for key, value in message_queue.failure_stats.items()},
+                     labelnames=["kind"], kind="counter")
+    metrics.callback("dead_letters", "死信存储中的消息数", lambda: message_queue.dead_letters.size)
+    metrics.callback("message_queue_oldest_age_seconds", "队列中最早一条消息已等待的秒数",
+                     message_queue.oldest_age)
+    metrics.callback("message_queue_batches_total", "合并发送的批次数",
+                     lambda: message_queue.batch_stats['batches'], kind="counter")
+    metrics.callback("message_queue_batched_messages_total", "以批次方式发送的消息数",
+                     lambda: message_queue.batch_stats['messages'], kind="counter")
+    metrics.callback("message_queue_digest_active", "是否处于批量入库汇总模式",
+                     lambda: int(message_queue.digest.active(len(message_queue))))
+    metrics.callback("message_queue_digest_events_total", "汇总模式统计(开启次数、汇总消息数、被合并的事件数)",
+                     lambda: {(key,): value for key, value in message_queue.digest.stats.items()},
+                     labelnames=["event"], kind="counter")
+    metrics.callback("telegram_api_calls_total", "发送通知使用的 Telegram API 调用次数",
+                     lambda: webhook_handler.stats['telegram_api_calls'], kind="counter")
+    metrics.callback("library_cache_requests_total", "媒体库名称缓存查询次数",
+                     lambda: {(server.name, result): count for server in webhook_handler.servers
+                              for result, count in (('hit', server.library_cache.hits),
+                                                    ('miss', server.library_cache.misses))},
+                     labelnames=["server", "result"], kind="counter")
+    metrics.callback("emby_item_lookups_total", "Emby 条目查询统计(查询、缓存命中、批量请求、请求的ID数、未找到)",
+                     lambda: {(key,): value for key, value in webhook_handler.items.stats.items()},
+                     labelnames=["event"], kind="counter")
+    metrics.callback("http_pool_events_total", "HTTP 连接池事件数",
+                     lambda: {(name, key): value
+                              for name, stats in http_pool.stats().items() for key, value in stats.items()},
+                     labelnames=["upstream", "event"], kind="counter")
+    # 字节数与次数分开导出，避免对同一指标求和时混在一起
+    metrics.callback("notification_image_events_total", "通知图片处理统计(下载、上传、file_id 命中等)",
+                     lambda: {(key,): value for key, value in webhook_handler.images.stats.items()
+                              if not key.endswith('_bytes')},
+                     labelnames=["event"], kind="counter")
+    metrics.callback("notification_image_bytes_total", "通知图片下载和上传的字节数",
+                     lambda: {(direction,): webhook_handler.images.stats[f'{direction}_bytes']
+                              for direction in ('download', 'upload')},
+                     labelnames=["direction"], kind="counter")
+    metrics.callback("notification_archive_records_total", "通知归档记录数",
+                     lambda: {('written',): notification_archive.stats['written'],
+                              ('dropped',): notification_archive.stats['dropped']},
+                     labelnames=["result"], kind="counter")
+
+
+register_metrics()
+
+
+def save_notification(event_type: str, data: bytes):
+    """将通知提交给后台归档线程，不等待磁盘写入"""
+    if ARCHIVE_ENABLED:
+        notification_archive.submit(event_type, data)
+
+
+async def enqueue_event(webhook_data: WebhookView) -> bool:
+    """去重后将事件放入消息队列，重复事件返回 False"""
+    # 同一条目或同一作品的其他版本在窗口内已通知过则跳过
+    duplicate_key = duplicate_filter.check(webhook_data) if DEDUP_ENABLED else None
+    if duplicate_key:
+        DUPLICATES_TOTAL.labels(duplicate_key.split(':', 1)[0]).inc()
+        logger.info("忽略重复事件: %s", duplicate_key)
+        return False
 
+    # 将解析好的对象添加到队列，其中保留的原始字节用于持久化
+    await message_queue.add_message({
+        'webhook': webhook_data,
+        'event_type': webhook_data.Event
+    })
+    return True
 
-def save_notification(event_type: str, data: dict):
-    """将通知保存到文件"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = NOTIFICATION_DIR / f"{event_type}_{timestamp}.json"
 
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+async def consume_ingest_queue(ingest_queue: IngestQueue):
+    """
+    split 模式: 从共享收件箱读取 ingest 进程接收的事件并放入消息队列
+
+    消息队列积压超过高水位时暂停读取，事件留在收件箱中，由 ingest 进程据此返回 503。
+    事件写入消息队列日志并落盘后才从收件箱删除。
+    读取或确认出错(例如收件箱被锁)时按指数退避重试，未确认的事件下次重新读取。
+    """
+    poll_interval = INGEST_POLL_MS / 1000
+    failures = 0
+    while True:
+        try:
+            if not message_queue.accepting():
+                await asyncio.sleep(poll_interval)
+                continue
+            rows = await asyncio.to_thread(ingest_queue.fetch, INGEST_BATCH_SIZE)
+            if not rows:
+                await asyncio.sleep(poll_interval)
+                continue
+            for _, _, payload in rows:
+                try:
+                    webhook_data = WebhookView.parse(payload)
+                except Exception as e:
+                    INGEST_ERRORS_TOTAL.inc()
+                    logger.error(f"收件箱中的事件无法解析，已丢弃: {str(e)}")
+                    continue
+                EVENTS_TOTAL.labels(webhook_data.Event).inc()
+                await enqueue_event(webhook_data)
+            journal = message_queue.journal
+            if journal and not await asyncio.to_thread(journal.wait_durable, journal.last_seq):
+                # 消息队列日志未能落盘时不能删除收件箱中的事件，退避后整批重新读取
+                raise RuntimeError("消息队列日志写入线程已停止，事件未能落盘")
+            await asyncio.to_thread(ingest_queue.ack, [row[0] for row in rows])
+            failures = 0
+        except Exception as e:
+            # 读取任务退出后事件会一直留在收件箱中，出错时只退避不退出
+            INGEST_ERRORS_TOTAL.inc()
+            delay = min(30, 2 ** failures)
+            failures += 1
+            logger.error(f"读取收件箱失败(连续 {failures} 次)，{delay:.1f} 秒后重试: {str(e)}")
+            await asyncio.sleep(delay)
+
+
+def check_admin(request: Request):
+    """校验管理接口令牌，未配置 ADMIN_API_TOKEN 时管理接口不可用"""
+    if not ADMIN_API_TOKEN:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Admin API disabled"})
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {ADMIN_API_TOKEN}"):
+        return JSONResponse(status_code=401, content={"status": "error", "message": "Unauthorized"})
+    return None
+
+
+def _invalid_redrive_options(options) -> Optional[str]:
+    """校验死信重新投递的请求体，有问题时返回错误描述"""
+    if not isinstance(options, dict):
+        return "Request body must be a JSON object"
+    ids = options.get("ids")
+    if ids is not None and not (
+        isinstance(ids, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in ids)
+    ):
+        return "ids must be a list of integers"
+    if ids is not None and not ids:
+        # 空列表容易被误当作"不过滤"而重新投递全部死信，直接拒绝
+        return "ids must not be empty; omit it to redrive all dead letters"
+    limit = options.get("limit")
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 0):
+        return "limit must be a non-negative integer"
+    return None
 
 
-def create_webhook_app() -> FastAPI:
-    """创建并配置 FastAPI 应用"""
+def create_webhook_app(accept_webhooks: bool = True) -> FastAPI:
+    """
+    创建并配置 FastAPI 应用
+
+    :param accept_webhooks: 为 False 时不提供 /webhook(split 模式的分发进程只提供 /metrics 和 /admin)
+    """
     app = FastAPI(title="Emby Bot & Webhook Server")
 
-    @app.post("/webhook")
     async def webhook(request: Request):
         """接收 Emby 的 Webhook 通知"""
+        start = time.perf_counter()
+        # 积压超过高水位时让 Emby 稍后重试，不读取和解析请求体
+        if QUEUE_BACKPRESSURE_ENABLED and not message_queue.accepting():
+            REJECTED_TOTAL.inc()
+            return JSONResponse(
+                status_code=503,
+                content={"status": "error", "message": "Queue is full, retry later"},
+                headers={"Retry-After": str(QUEUE_RETRY_AFTER)}
+            )
         try:
-            # 获取原始JSON数据
-            data = await request.json()
+            # 获取原始请求体
+            body = await request.body()
 
-            # 记录原始数据用于调试
-            logger.info(f"原始数据: {json.dumps(data, ensure_ascii=False)}")
+            # 抽样记录原始数据用于调试，解码和截断在日志线程中完成
+            if should_log_payload(logger):
+                logger.info("原始数据: %s", LazyPayload(body))
 
-            # 使用Pydantic模型解析数据
-            webhook_data = EmbyWebhook.model_validate(data)
+            # 直接从原始字节解析并校验，只解析一次
+            parse_start = time.perf_counter()
+            webhook_data = WebhookView.parse(body)
+            PARSE_SECONDS.observe(time.perf_counter() - parse_start)
+            EVENTS_TOTAL.labels(webhook_data.Event).inc()
 
             # 保存原始通知数据
-            save_notification(webhook_data.Event, data)
+            save_notification(webhook_data.Event, body)
 
             # 根据事件类型处理
-            if webhook_data.Event == 'library.new':
-                # 将消息添加到队列而不是直接发送
-                await message_queue.add_message({
-                    'webhook_data': data,
-                    'event_type': webhook_data.Event
-                })
+            if webhook_data.Event == 'library.new' and not await enqueue_event(webhook_data):
+                return {
+                    "status": "success",
+                    "message": f"Duplicate {webhook_data.Event} event suppressed",
+                    "title": webhook_data.Title
+                }
 
             return {
                 "status": "success",
@@ -72,32 +283,151 @@ def create_webhook_app() -> FastAPI:
             }
 
         except Exception as e:
+            INGEST_ERRORS_TOTAL.inc()
             logger.error(f"处理webhook时发生错误: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+        finally:
+            INGEST_SECONDS.observe(time.perf_counter() - start)
+
+    if accept_webhooks:
+        app.post("/webhook")(webhook)
+
     @app.get("/")
     async def root():
         """服务器状态检查"""
         return {"status": "running"}
 
+    @app.get("/admin/dead-letters")
+    async def list_dead_letters(request: Request, limit: int = 100, offset: int = 0):
+        """查看死信"""
+        denied = check_admin(request)
+        if denied:
+            return denied
+        items = await asyncio.to_thread(message_queue.dead_letters.list, limit, offset)
+        return {"status": "success", "total": message_queue.dead_letters.size, "items": items}
+
+    @app.post("/admin/dead-letters/redrive")
+    async def redrive_dead_letters(request: Request):
+        """
+        批量重新投递死信
+
+        请求体可选: {"ids": [1, 2, 3]} 只投递指定的死信，{"limit": 100} 按顺序投递前 N 条(与 ids 同时指定时投递其中前 N 条)，
+        为空时投递全部
+        """
+        denied = check_admin(request)
+        if denied:
+            return denied
+        body = await request.body()
+        try:
+            options = json.loads(body) if body else {}
+        except ValueError:
+            return JSONResponse(status_code=400, content={"status": "error", "message": "Invalid JSON"})
+        message = _invalid_redrive_options(options)
+        if message:
+            return JSONResponse(status_code=400, content={"status": "error", "message": message})
+        count = await message_queue.redrive(options.get("ids"), options.get("limit"))
+        return {"status": "success", "redriven": count, "remaining": message_queue.dead_letters.size}
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        """Prometheus 指标"""
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
     return app
 
 
-async def run_emby_webhook_server():
-    """运行 Webhook 服务器"""
+async def start_services(archive: bool = True):
+    """启动发送相关的组件"""
+    # 创建共享的 HTTP 长连接会话
+    await http_pool.start('telegram', *(server.session_name for server in webhook_handler.servers))
+
+    # 启动通知归档线程
+    if ARCHIVE_ENABLED and archive:
+        notification_archive.start()
+
+    # 预热媒体库名称缓存(网络)、加载图片 file_id 缓存和去重索引(磁盘)互不依赖，并发进行以缩短启动时间
+    await asyncio.gather(
+        webhook_handler.prewarm_library_cache(),
+        webhook_handler.images.start(),
+        duplicate_filter.start() if DEDUP_ENABLED else asyncio.sleep(0)
+    )
+
     # 启动消息队列处理器
     await message_queue.start_processing()
-    
-    app = create_webhook_app()
-    config = uvicorn.Config(
-        app,
-        host=WEBHOOK_HOST,
-        port=WEBHOOK_PORT,
-        reload=True
+
+
+async def stop_services(force: Optional[asyncio.Event] = None):
+    """停止发送相关的组件，先在 SHUTDOWN_DRAIN_TIMEOUT 内排空消息队列"""
+    await message_queue.drain(SHUTDOWN_DRAIN_TIMEOUT, force)
+    # 停止消息队列处理器，未发送的消息保留到下次启动
+    await message_queue.stop_processing()
+    # 关闭 HTTP 会话
+    await http_pool.close()
+    # 关闭图片 file_id 缓存
+    await webhook_handler.images.stop()
+    # 写入剩余的归档记录
+    notification_archive.stop()
+    # 保存去重索引
+    await duplicate_filter.stop()
+
+
+async def run_emby_webhook_server():
+    """运行 Webhook 服务器"""
+    await start_services()
+
+    # 生产模式: 不启用自动重载，SIGTERM 时先停止接收请求再排空队列
+    server = runtime.Server(runtime.server_config(create_webhook_app(), WEBHOOK_HOST, WEBHOOK_PORT))
+    force = runtime.install_shutdown_handlers(server)
+    try:
+        await server.serve()
+    finally:
+        await stop_services(force)
+
+
+async def start_ingest_workers(workers: int = INGEST_WORKERS, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+    """以子进程启动 uvicorn，由它管理 workers 个 ingest 进程，共享同一个监听端口"""
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "uvicorn", "emby_ingest:create_ingest_app", "--factory",
+        "--host", host, "--port", str(port), "--workers", str(workers), "--no-access-log",
+        cwd=os.path.dirname(os.path.abspath(__file__))
     )
-    server = uvicorn.Server(config)
+
+
+async def stop_ingest_workers(process) -> None:
+    if process.returncode is None:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), 30)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def run_dispatcher_server():
+    """
+    split 模式: 本进程作为唯一的分发进程(消息队列、去重、Telegram 速率限制都只有一份)，
+    另外启动 INGEST_WORKERS 个 ingest 进程在 WEBHOOK_PORT 上接收 webhook，两者通过 SQLite 收件箱传递事件。
+    分发进程在 DISPATCHER_PORT 上提供 /metrics 和 /admin。
+    """
+    # 归档由 ingest 进程写入
+    await start_services(archive=False)
+    ingest_queue = IngestQueue(INGEST_QUEUE_FILE)
+    ingest_queue.open()
+    consumer = asyncio.create_task(consume_ingest_queue(ingest_queue), name="ingest-consumer")
+    ingest_process = await start_ingest_workers()
+    logger.info(f"已启动 {INGEST_WORKERS} 个 ingest 进程，监听 {WEBHOOK_HOST}:{WEBHOOK_PORT}")
+
+    server = runtime.Server(runtime.server_config(
+        create_webhook_app(accept_webhooks=False), WEBHOOK_HOST, DISPATCHER_PORT
+    ))
+    force = runtime.install_shutdown_handlers(server)
     try:
         await server.serve()
     finally:
-        # 停止消息队列处理器
-        await message_queue.stop_processing()
+        # 先停止接收，收件箱中剩余的事件在下次启动时继续处理
+        await stop_ingest_workers(ingest_process)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        ingest_queue.close()
+        await stop_services(force)
@@ -1,19 +1,137 @@
-import aiohttp
 import re
 import json
+import time
 import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
 
-from config.settings import EMBY_URL, EMBY_API_KEY, WEBHOOK_CHANNEL_ID, TELEGRAM_BOT_TOKEN
-from models import EmbyWebhook
+from config.settings import (
+    EMBY_URL,
+    EMBY_API_KEY,
+    EMBY_SERVERS,
+    EMBY_SERVER_ID,
+    EMBY_REQUEST_RATE,
+    EMBY_REQUEST_BURST,
+    EMBY_POOL_LIMIT,
+    EMBY_ENRICH_ENABLED,
+    EMBY_ENRICH_FIELDS,
+    EMBY_BATCH_WINDOW_MS,
+    EMBY_BATCH_SIZE,
+    EMBY_ITEM_CACHE_TTL,
+    WEBHOOK_CHANNEL_ID,
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_API_URL,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GLOBAL_BURST,
+    TELEGRAM_PRIVATE_RATE,
+    TELEGRAM_PRIVATE_BURST,
+    TELEGRAM_GROUP_RATE_PER_MIN,
+    TELEGRAM_GROUP_BURST,
+    LIBRARY_CACHE_TTL,
+    LIBRARY_CACHE_SIZE,
+    CAPTION_TEMPLATE_DIR,
+    IMAGE_UPLOAD_ENABLED,
+    IMAGE_MAX_DIMENSION,
+    IMAGE_JPEG_QUALITY,
+    IMAGE_MAX_BYTES,
+    IMAGE_FILE_ID_CACHE_SIZE,
+    IMAGE_FILE_ID_DB_FILE,
+    DIGEST_MAX_TITLES
+)
+from models.projection import WebhookView
+from utils.delivery import DeliveryError, PERMANENT, THROTTLED, TRANSIENT, classify_failure
+from utils.emby_servers import EmbyServer, EmbyServerRegistry
+from utils.enrichment import EmbyItemBatcher, enrich, missing_fields
+from utils.http_client import HttpClientPool, http_pool
 from utils.helpers import parse_emby_date, format_runtime, format_size, format_telegram_hashtag
+from utils.images import ImagePipeline, Photo
 from utils.logger import Logger
+from utils.metrics import metrics
+from utils.rate_limiter import TelegramRateLimiter
+from utils.templates import CAPTION_LIMIT, MESSAGE_LIMIT, TemplateEngine
+
+# Telegram 相册最多包含 10 条媒体
+MEDIA_GROUP_MAX = 10
+
+# 汇总消息中条目类型的显示名称
+ITEM_TYPE_NAMES = {'Movie': '电影', 'Episode': '剧集', 'Season': '季', 'Series': '剧集系列', 'Audio': '音乐',
+                   'MusicVideo': '音乐视频', 'Video': '视频', 'Book': '书籍'}
+
+# 预编译的 HTML 清理正则
+_BR_TAG = re.compile(r'<br\s*?>', re.IGNORECASE)
+_P_TAG = re.compile(r'<p[^>]*>|</p>', re.IGNORECASE)
+_ANY_TAG = re.compile(r'<[^>]+>')
+_BLANK_LINES = re.compile(r'\n\s*\n')
+
+TELEGRAM_REQUEST_SECONDS = metrics.histogram(
+    "telegram_request_seconds", "Telegram Bot API 请求耗时", ["method"]
+)
+TELEGRAM_RESPONSES_TOTAL = metrics.counter(
+    "telegram_responses_total", "Telegram Bot API 响应次数", ["method", "status"]
+)
+TELEGRAM_RATE_LIMITED_TOTAL = metrics.counter(
+    "telegram_rate_limited_total", "Telegram Bot API 返回 429 的次数", ["method"]
+)
+TELEGRAM_RETRY_AFTER_SECONDS_TOTAL = metrics.counter(
+    "telegram_retry_after_seconds_total", "Telegram 要求等待的 retry_after 总秒数"
+)
+EMBY_REQUEST_SECONDS = metrics.histogram(
+    "emby_request_seconds", "Emby 接口请求耗时", ["server", "endpoint"]
+)
 
 
 class WebhookHandler():
-    def __init__(self):
+    def __init__(self, http: HttpClientPool = http_pool):
         super().__init__()
         self.logger = Logger().get_logger()
-        self.telegram_api_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+        self.http = http
+        # 按服务器ID区分的 Emby 服务器，每台服务器独立的连接池、媒体库缓存和请求速率
+        self.servers = EmbyServerRegistry.from_config(
+            http,
+            EMBY_URL,
+            EMBY_API_KEY,
+            EMBY_SERVERS,
+            default_id=EMBY_SERVER_ID,
+            rate=EMBY_REQUEST_RATE,
+            burst=EMBY_REQUEST_BURST,
+            pool_limit=EMBY_POOL_LIMIT,
+            cache_size=LIBRARY_CACHE_SIZE,
+            cache_ttl=LIBRARY_CACHE_TTL
+        )
+        # 条目查询(补全字段、媒体库父级链)按服务器合并为批量请求并缓存
+        self.items = EmbyItemBatcher(
+            self._fetch_emby_json,
+            window=EMBY_BATCH_WINDOW_MS / 1000,
+            max_batch=EMBY_BATCH_SIZE,
+            cache_size=LIBRARY_CACHE_SIZE,
+            cache_ttl=EMBY_ITEM_CACHE_TTL
+        )
+        # 发送统计
+        self.stats = defaultdict(int)
+        # 按事件类型编译的通知模板
+        self.templates = TemplateEngine(CAPTION_TEMPLATE_DIR)
+        # 通知图片下载、上传和 file_id 缓存
+        self.images = ImagePipeline(
+            enabled=IMAGE_UPLOAD_ENABLED,
+            max_dimension=IMAGE_MAX_DIMENSION,
+            quality=IMAGE_JPEG_QUALITY,
+            max_bytes=IMAGE_MAX_BYTES,
+            cache_size=IMAGE_FILE_ID_CACHE_SIZE,
+            db_file=IMAGE_FILE_ID_DB_FILE
+        )
+        # 正在上传的图片: 图片 key -> 上传完成时结束的 Future，同一张图片同时发往多个目标时只上传一次
+        self._uploads: Dict[str, asyncio.Future] = {}
+        self.telegram_api_url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}"
+        self.rate_limiter = TelegramRateLimiter(
+            global_rate=TELEGRAM_GLOBAL_RATE,
+            global_burst=TELEGRAM_GLOBAL_BURST,
+            private_rate=TELEGRAM_PRIVATE_RATE,
+            private_burst=TELEGRAM_PRIVATE_BURST,
+            group_rate=TELEGRAM_GROUP_RATE_PER_MIN / 60,
+            group_burst=TELEGRAM_GROUP_BURST
+        )
 
     def clean_html_text(self, text: str) -> str:
         """
@@ -23,168 +141,273 @@ class WebhookHandler():
             return ""
 
         # 替换常见的 HTML 标签
-        text = re.sub(r'<br\s*?>', '\n', text, flags=re.IGNORECASE)
-        text = re.sub(r'<p[^>]*>', '\n', text, flags=re.IGNORECASE)
-        text = re.sub(r'</p>', '\n', text, flags=re.IGNORECASE)
-        text = re.sub(r'<[^>]+>', '', text)  # 移除其他 HTML 标签
+        text = _BR_TAG.sub('\n', text)
+        text = _P_TAG.sub('\n', text)
+        text = _ANY_TAG.sub('', text)  # 移除其他 HTML 标签
 
         # 清理多余的换行符
-        text = re.sub(r'\n\s*\n', '\n\n', text)
+        text = _BLANK_LINES.sub('\n\n', text)
         text = text.strip()
 
         return text
 
-    async def get_library_name(self, library_id: str, visited_ids: set = None) -> str:
+    async def prewarm_library_cache(self, force: bool = False, server: Optional[EmbyServer] = None) -> None:
+        """
+        从 /Library/MediaFolders 和 /Library/VirtualFolders 预热媒体库缓存，未指定服务器时预热所有服务器
+        """
+        if server is None:
+            await asyncio.gather(*(self.prewarm_library_cache(force, s) for s in self.servers))
+            return
+        if not server.configured:
+            return
+        if not force and time.monotonic() < server.library_prewarmed_until:
+            return
+        await server.library_flight.do('__prewarm__', self._prewarm_library_cache, server)
+
+    async def _prewarm_library_cache(self, server: EmbyServer) -> None:
+        folders = await self._fetch_emby_json(server, server.api_url("Library/MediaFolders"), "media_folders")
+        if folders is None:
+            # 预热失败时稍后再试，避免每条消息都重复请求
+            server.library_prewarmed_until = time.monotonic() + 60
+            return
+        for folder in folders.get("Items", []):
+            if folder.get("Id"):
+                server.library_cache.set(folder["Id"], folder.get("Name", "未知媒体库"))
+
+        # 媒体库的物理路径，用于直接根据文件路径判断所属媒体库
+        virtual_folders = await self._fetch_emby_json(
+            server, server.api_url("Library/VirtualFolders"), "virtual_folders"
+        )
+        if isinstance(virtual_folders, list):
+            locations = []
+            for folder in virtual_folders:
+                for location in folder.get("Locations") or []:
+                    locations.append((location.rstrip('/') + '/', folder.get("Name", "未知媒体库")))
+            # 最长前缀优先
+            server.library_locations = sorted(locations, key=lambda x: len(x[0]), reverse=True)
+
+        server.library_prewarmed_until = time.monotonic() + LIBRARY_CACHE_TTL
+        self.logger.info(f"Emby 服务器 {server.name} 媒体库缓存已预热，共 {len(server.library_cache)} 个媒体库")
+
+    async def _fetch_emby_json(self, server: EmbyServer, url: str, endpoint: str = "items"):
+        """请求 Emby 接口并返回 JSON，失败时返回 None"""
+        await server.acquire()
+        start = time.perf_counter()
+        try:
+            async with server.session().get(url) as response:
+                if response.ok:
+                    return await response.json()
+                self.logger.error(f"请求 Emby 接口失败: {server.name} {response.status}")
+        except Exception as e:
+            self.logger.error(f"请求 Emby 接口时发生错误: {server.name} {str(e)}")
+        finally:
+            EMBY_REQUEST_SECONDS.labels(server.name, endpoint).observe(time.perf_counter() - start)
+        return None
+
+    async def get_library_name_for_item(self, item, server: Optional[EmbyServer] = None) -> str:
+        """
+        获取媒体项所属媒体库名称，优先通过路径匹配，其次沿父级链查询
+        """
+        server = server or self.servers.get(item.ServerId)
+        await self.prewarm_library_cache(server=server)
+        if item.Path:
+            for location, name in server.library_locations:
+                if item.Path.startswith(location):
+                    return name
+        return await self.get_library_name(item.ParentId, server=server)
+
+    async def get_library_name(self, library_id: str, visited_ids: set = None,
+                               server: Optional[EmbyServer] = None) -> str:
         """
         通过媒体库ID获取媒体库名称
+
+        沿父级链逐级查询直到命中缓存或遇到 CollectionFolder，并缓存整条链上的所有ID；
+        到达根节点仍没有 CollectionFolder 时，以最上层的 Folder 作为媒体库。
+        同一ID的并发查询只会发出一个请求。
         """
+        server = server or self.servers.default
+        cached = server.library_cache.get(library_id)
+        if cached is not None:
+            return cached
+
+        if not server.configured:
+            return "未知媒体库"
+
+        await self.prewarm_library_cache(server=server)
+
         if visited_ids is None:
             visited_ids = set()
 
-        # 防止无限递归
-        if library_id in visited_ids:
-            self.logger.warning(f"检测到循环引用，媒体库ID: {library_id}")
-            return "未知媒体库"
+        chain = []
+        current_id = library_id
+        library_name = None
+        # 最靠近根的普通 Folder，没有 CollectionFolder 的配置中它就是顶层媒体库
+        folder_name = None
+        while current_id:
+            cached = server.library_cache.get(current_id)
+            if cached is not None:
+                library_name = cached
+                break
 
-        visited_ids.add(library_id)
+            # 防止无限循环
+            if current_id in visited_ids:
+                self.logger.warning(f"检测到循环引用，媒体库ID: {current_id}")
+                return "未知媒体库"
+            visited_ids.add(current_id)
 
-        if not EMBY_URL or not EMBY_API_KEY:
-            return "未知媒体库"
+            # 首先尝试通过 Items 端点获取，同一时间窗口内的查询合并为一次请求
+            data = await self.items.get(server, current_id)
+            if data is None:
+                # 如果直接获取失败，尝试通过媒体文件夹列表获取
+                return await self.get_library_name_from_folders(current_id, server)
 
-        # 首先尝试通过 Items 端点获取
-        url = f"{EMBY_URL}/emby/Items/{library_id}?api_key={EMBY_API_KEY}"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.ok:
-                        data = await response.json()
-                        # 检查是否为媒体库类型
-                        if data.get("Type") in ["CollectionFolder", "Folder"]:
-                            return data.get("Name", "未知媒体库")
-                        # 如果不是媒体库类型，尝试获取其父级
-                        parent_id = data.get("ParentId")
-                        if parent_id and parent_id != library_id:
-                            return await self.get_library_name(parent_id, visited_ids)
-                        return data.get("Name", "未知媒体库")
-                    else:
-                        self.logger.error(f"获取媒体库名称失败: {response.status}")
-                        # 如果直接获取失败，尝试通过媒体文件夹列表获取
-                        return await self.get_library_name_from_folders(library_id)
-        except Exception as e:
-            self.logger.error(f"获取媒体库名称时发生错误: {str(e)}")
-            # 如果直接获取失败，尝试通过媒体文件夹列表获取
-            return await self.get_library_name_from_folders(library_id)
+            chain.append(current_id)
+            # 检查是否为媒体库类型
+            if data.get("Type") == "CollectionFolder":
+                library_name = data.get("Name", "未知媒体库")
+                break
+            # 如果不是媒体库类型，尝试获取其父级
+            parent_id = data.get("ParentId")
+            if not parent_id or parent_id == current_id:
+                # 到达根节点仍未找到 CollectionFolder 时使用最上层的 Folder
+                library_name = folder_name or data.get("Name", "未知媒体库")
+                break
+            if data.get("Type") == "Folder":
+                folder_name = data.get("Name") or folder_name
+            current_id = parent_id
 
-    async def get_library_name_from_folders(self, library_id: str) -> str:
+        library_name = library_name or "未知媒体库"
+        for item_id in chain:
+            server.library_cache.set(item_id, library_name)
+        return library_name
+
+    async def get_library_name_from_folders(self, library_id: str, server: Optional[EmbyServer] = None) -> str:
         """
         通过查询媒体文件夹列表获取媒体库名称
         """
-        if not EMBY_URL or not EMBY_API_KEY:
+        server = server or self.servers.default
+        if not server.configured:
             return "未知媒体库"
 
-        url = f"{EMBY_URL}/emby/Library/MediaFolders?api_key={EMBY_API_KEY}"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.ok:
-                        data = await response.json()
-                        items = data.get("Items", [])
-                        for item in items:
-                            if item.get("Id") == library_id:
-                                return item.get("Name", "未知媒体库")
-                        return "未知媒体库"
-                    else:
-                        self.logger.error(f"获取媒体文件夹列表失败: {response.status}")
-                        return "未知媒体库"
-        except Exception as e:
-            self.logger.error(f"获取媒体文件夹列表时发生错误: {str(e)}")
-            return "未知媒体库"
+        await self.prewarm_library_cache(server=server)
+        return server.library_cache.get(library_id, "未知媒体库")
 
-    async def send_telegram_message_with_retry(self, session, endpoint, data, max_retries=3):
+    async def send_telegram_message_with_retry(self, session, endpoint, data, max_retries=3, files=None,
+                                               retry_transient=True):
         """
-        发送 Telegram 消息，支持重试和速率限制处理
+        发送 Telegram 消息，支持重试和速率限制处理，成功时返回响应，失败时抛出 DeliveryError
+
+        :param files: {字段名: (文件名, 内容)}，不为空时以 multipart 方式上传
+        :param retry_transient: 临时故障是否在这里退避重试；为 False 时立即抛出，由调用方在后台重试
         """
+        chat_id = data.get("chat_id")
+        method = endpoint.rsplit('/', 1)[-1]
+        error = None
         for attempt in range(max_retries):
+            if error is not None and error.kind == TRANSIENT:
+                await asyncio.sleep(2 ** (attempt - 1))  # 指数退避
             try:
-                async with session.post(endpoint, json=data) as response:
-                    if response.status == 429:  # 速率限制错误
-                        response_json = await response.json()
+                # 按令牌桶调度，只在超出 Telegram 限制时等待
+                await self.rate_limiter.acquire(chat_id)
+                start = time.perf_counter()
+                if files:
+                    # multipart 表单只能发送一次，每次重试重新构建
+                    request = session.post(endpoint, data=self._build_form(data, files))
+                else:
+                    request = session.post(endpoint, json=data)
+                async with request as response:
+                    TELEGRAM_REQUEST_SECONDS.labels(method).observe(time.perf_counter() - start)
+                    TELEGRAM_RESPONSES_TOTAL.labels(method, response.status).inc()
+                    if response.ok:
+                        self.rate_limiter.on_success(chat_id)
+                        # 读取响应体，供调用方在连接释放后解析返回的消息
+                        await response.read()
+                        return response
+
+                    response_text = await response.text()
+                    try:
+                        response_json = json.loads(response_text)
+                    except ValueError:
+                        response_json = {}
+                    description = response_json.get('description') or response_text[:200]
+                    kind = classify_failure(response.status, description)
+
+                    if kind == THROTTLED:  # 速率限制错误
                         retry_after = response_json.get('parameters', {}).get('retry_after', 30)
+                        TELEGRAM_RATE_LIMITED_TOTAL.labels(method).inc()
+                        TELEGRAM_RETRY_AFTER_SECONDS_TOTAL.inc(retry_after)
                         self.logger.warning(f"Telegram API 速率限制: 需要等待 {retry_after} 秒")
-                        await asyncio.sleep(retry_after)
+                        # 由调度器记录暂停时间，下次 acquire 时自动等待
+                        self.rate_limiter.on_retry_after(chat_id, retry_after)
+                        error = DeliveryError(kind, description, response.status, retry_after)
+                        if not retry_transient:
+                            # 由调用方在后台按 retry_after 重试
+                            raise error
                         continue  # 重试
 
-                    if not response.ok:
-                        response_text = await response.text()
-                        self.logger.error(f"发送通知消息失败: {response_text}")
-                        # 如果是客户端错误(4xx)，不重试
-                        if 400 <= response.status < 500:
-                            break
+                    error = DeliveryError(kind, description, response.status)
+                    self.logger.error(f"发送通知消息失败: {error}")
 
-                    return response
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = DeliveryError(TRANSIENT, str(e) or type(e).__name__)
+                self.logger.error(f"发送通知消息时发生异常: {error}")
 
-            except Exception as e:
-                self.logger.error(f"发送通知消息时发生异常: {str(e)}")
-                if attempt == max_retries - 1:  # 最后一次尝试
-                    raise
-                await asyncio.sleep(2 ** attempt)  # 指数退避
+            # 永久失败不重试，临时故障按需交给调用方在后台重试
+            if error.kind == PERMANENT or not retry_transient:
+                break
 
-        return None
+        raise error
 
-    async def send_new_media_notification(self, webhook: EmbyWebhook) -> None:
+    @staticmethod
+    def _build_form(data: dict, files: dict) -> aiohttp.FormData:
+        """构建 multipart 表单，非字符串字段按 JSON 序列化"""
+        form = aiohttp.FormData()
+        for key, value in data.items():
+            form.add_field(key, value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))
+        for name, (filename, content) in files.items():
+            form.add_field(name, content, filename=filename, content_type="image/jpeg")
+        return form
+
+    async def build_notification(self, webhook: WebhookView) -> Optional[dict]:
         """
-        通过 Telegram API 发送新媒体通知到指定频道
+        构建新媒体通知的图片和文本
         """
         if not webhook.Item:
             self.logger.error("Webhook 数据中没有 Item 信息")
-            return
+            return None
 
         item = webhook.Item
+        # 事件来源服务器，所有 Emby 请求和链接都指向该服务器
+        server = self.servers.get(webhook.Server.Id if webhook.Server else item.ServerId)
+        # 补全 webhook 中缺少的展示字段
+        item = await self.enrich_item(item, server)
 
         # 获取媒体库名称
-        # library_name = await self.get_library_name(item.ParentId)
-
-        # 获取图片URL
-        image_url = None
-        # if EMBY_URL and EMBY_API_KEY:
-        # 首先尝试获取背景图
-        image_url = item.get_backdrop_url(EMBY_URL, EMBY_API_KEY, 0)
-        # 如果没有背景图，回退到主封面图
-        if not image_url:
-            image_url = item.get_primary_image_url(EMBY_URL, EMBY_API_KEY)
-
-        # 构建消息文本
-        message = (
-            f"🎬 <b>新片入库</b>\n\n"
-            f"📝 <b>标题:</b> {item.Name}\n"
-            # f"📚 <b>媒体库:</b> {library_name}\n"
-            f"🗓️ <b>发行日期:</b> {parse_emby_date(item.PremiereDate)}\n"
-            f"⏱ <b>入库时间:</b> {parse_emby_date(item.DateCreated)}\n"
-            f"💎 <b>分辨率:</b> {item.Width}x{item.Height}\n"
-            f"⏳ <b>时  长:</b> {format_runtime(item.RunTimeTicks)}\n"
-            f"📦 <b>大  小:</b> {format_size(item.Size)}\n"
-            f"🎞️ <b>类  型:</b> {item.Container.upper() if item.Container else '未知'}"
-        )
+        library_name = await self.get_library_name_for_item(item, server)
 
-        if item.Overview:
-            # 清理 HTML 标签
-            clean_overview = self.clean_html_text(item.Overview)
-            if clean_overview:
-                message += f"\n\n📖 <b>简介:</b>\n{clean_overview}\n"
-
-        if item.Studios:
-            studios = ", ".join(f"#{studio.Name}" for studio in item.Studios)
-            message += f"\n🏢 <b>制作公司:</b> {studios}"
-
-        if item.TagItems:
-            hashtags = []
-            for tag in item.TagItems:
-                sanitized = format_telegram_hashtag(tag.Name)
-                if sanitized:
-                    hashtags.append(f"#{sanitized}")
-            if hashtags:
-                tags = ' '.join(hashtags)
-                message += f"\n🏷 <b>标签:</b> {tags}"
+        # 获取图片: 优先背景图，其次主封面图，已上传过的图片直接使用 file_id
+        photo = await self.images.prepare(item, server)
+
+        # 构建消息文本，模板在启动时已编译，字段值统一转义
+        values = {
+            "event": webhook.Event,
+            "name": item.Name,
+            "library": library_name,
+            "premiere_date": parse_emby_date(item.PremiereDate),
+            "date_created": parse_emby_date(item.DateCreated),
+            "resolution": f"{item.Width}x{item.Height}",
+            "runtime": format_runtime(item.RunTimeTicks),
+            "size": format_size(item.Size),
+            "container": item.Container.upper() if item.Container else '未知',
+            "overview": self.clean_html_text(item.Overview) if item.Overview else "",
+            "studios": ", ".join(f"#{studio.Name}" for studio in item.Studios),
+            "tags": ' '.join(
+                f"#{sanitized}" for sanitized in map(format_telegram_hashtag, (tag.Name for tag in item.TagItems))
+                if sanitized
+            ),
+        }
+        limit = CAPTION_LIMIT if photo else MESSAGE_LIMIT
+        message = self.templates.render(webhook.Event, values, limit)
 
         # 构建 Inline Keyboard
         keyboard = {
@@ -192,39 +415,262 @@ class WebhookHandler():
                 [
                     {
                         "text": "在 Emby 中查看",
-                        "url": f"{EMBY_URL}/web/index.html#!/item?id={item.Id}&serverId={item.ServerId}"
+                        "url": server.item_link(item.Id, item.ServerId)
                     }
                 ]
             ]
         }
 
-        # 发送消息
-        try:
-            async with aiohttp.ClientSession() as session:
-                if image_url:
-                    # 发送图文消息
-                    endpoint = f"{self.telegram_api_url}/sendPhoto"
-                    data = {
-                        "chat_id": WEBHOOK_CHANNEL_ID,
-                        "photo": image_url,
-                        "caption": message,
-                        "parse_mode": "HTML",
-                        # "reply_markup": json.dumps(keyboard)
-                    }
+        return {
+            "photo": photo,
+            "caption": message,
+            "keyboard": keyboard,
+            "library": library_name,
+            "item": item
+        }
+
+    async def enrich_item(self, item, server: EmbyServer):
+        """从 Emby 查询并补全条目中缺少的 EMBY_ENRICH_FIELDS 字段，查询失败时原样返回"""
+        if not EMBY_ENRICH_ENABLED or not server.configured:
+            return item
+        fields = missing_fields(item, EMBY_ENRICH_FIELDS)
+        if not fields:
+            return item
+        data = await self.items.get(server, item.Id)
+        if data is None:
+            return item
+        return enrich(item, data, fields)
+
+    def build_digest(self, title: str, entries: List[Tuple[WebhookView, dict]]) -> dict:
+        """
+        将同一组的多条通知合并为一条汇总消息: 数量(按类型)、总大小、总时长和标题列表
+
+        entries 为 [(webhook, 已构建的通知)]，标题列表最多 DIGEST_MAX_TITLES 条，超长时由模板截断
+        """
+        items = [notification.get('item') or webhook.Item for webhook, notification in entries]
+        counts = defaultdict(int)
+        for item in items:
+            counts[item.Type] += 1
+        libraries = list(dict.fromkeys(notification['library'] for _, notification in entries))
+
+        # 剧集按季和集排序，其他条目保持到达顺序
+        if all(item.SeriesId for item in items):
+            items = sorted(items, key=lambda item: (item.ParentIndexNumber or 0, item.IndexNumber or 0))
+        lines = []
+        for item in items[:DIGEST_MAX_TITLES]:
+            if item.IndexNumber is not None and item.SeriesId:
+                label = f"S{item.ParentIndexNumber or 0:02d}E{item.IndexNumber:02d} {item.Name}"
+            elif item.ProductionYear:
+                label = f"{item.Name} ({item.ProductionYear})"
+            else:
+                label = item.Name
+            lines.append(f"• {label}")
+        if len(items) > DIGEST_MAX_TITLES:
+            lines.append(f"… 等 {len(items)} 个条目")
+
+        sizes = [item.Size for item in items if item.Size is not None]
+        runtimes = [item.RunTimeTicks for item in items if item.RunTimeTicks is not None]
+        values = {
+            "title": title,
+            "library": ", ".join(libraries),
+            "counts": f"{len(items)} 个" + (
+                f" ({', '.join(f'{ITEM_TYPE_NAMES.get(t, t)} {n}' for t, n in counts.items())})"
+                if len(counts) > 1 else ""
+            ),
+            "size": format_size(sum(sizes)) if sizes else "未知",
+            "runtime": format_runtime(sum(runtimes)) if runtimes else "未知",
+            "titles": "\n".join(lines),
+        }
+        return {
+            "photo": None,
+            "caption": self.templates.render("digest", values, MESSAGE_LIMIT),
+            "keyboard": None,
+            "library": libraries[0] if libraries else ""
+        }
+
+    async def send_new_media_notification(self, webhook: WebhookView) -> None:
+        """
+        通过 Telegram API 发送新媒体通知到指定频道
+        """
+        await self.send_new_media_notifications([webhook])
+
+    async def send_new_media_notifications(self, webhooks: List[WebhookView]) -> None:
+        """
+        批量发送新媒体通知到 WEBHOOK_CHANNEL_ID
+        """
+        # 并发构建，图片下载和媒体库查询互不等待
+        notifications = [
+            notification for notification in await asyncio.gather(*map(self.build_notification, webhooks))
+            if notification
+        ]
+        for _, error in await self.send_notifications(notifications, WEBHOOK_CHANNEL_ID):
+            self.logger.error(f"发送通知消息最终失败: {error}")
+
+    async def send_notifications(self, notifications: List[dict], chat_id: str,
+                                 retry_transient: bool = True) -> List[Tuple[dict, DeliveryError]]:
+        """
+        将已构建的通知发送到指定聊天，连续的图文消息合并为相册(sendMediaGroup)发送
+
+        同一通知可以发送到多个聊天，图片上传后得到的 file_id 会被后续目标直接使用。
+        返回发送失败的 [(通知, 错误)]，一条失败不影响同一批的其他通知。
+        """
+        failures = []
+
+        async def send_photos(photos: List[dict]) -> None:
+            try:
+                await self._send_photos(photos, chat_id, retry_transient)
+            except DeliveryError as e:
+                if e.kind == PERMANENT and e.content_related and len(photos) > 1:
+                    # 相册中一条说明文字有问题会导致整组失败，逐条重发以找出有问题的那一条
+                    for notification in photos:
+                        await send_photos([notification])
                 else:
-                    # 发送纯文本消息
-                    endpoint = f"{self.telegram_api_url}/sendMessage"
-                    data = {
-                        "chat_id": WEBHOOK_CHANNEL_ID,
-                        "text": message,
+                    failures.extend((notification, e) for notification in photos)
+
+        # 按原顺序发送，连续的图文消息最多 MEDIA_GROUP_MAX 条合并为一个相册
+        photos = []
+        for notification in notifications:
+            if notification["photo"]:
+                photos.append(notification)
+                if len(photos) == MEDIA_GROUP_MAX:
+                    await send_photos(photos)
+                    photos = []
+            else:
+                if photos:
+                    await send_photos(photos)
+                    photos = []
+                try:
+                    await self._send_notification_request("sendMessage", {
+                        "chat_id": chat_id,
+                        "text": notification["caption"],
                         "parse_mode": "HTML",
-                        # "reply_markup": json.dumps(keyboard)
-                    }
+                        # "reply_markup": json.dumps(notification["keyboard"])
+                    }, retry_transient=retry_transient)
+                except DeliveryError as e:
+                    failures.append((notification, e))
+        if photos:
+            await send_photos(photos)
+        return failures
 
-                response = await self.send_telegram_message_with_retry(session, endpoint, data)
-                if response and not response.ok:
-                    response_text = await response.text()
-                    self.logger.error(f"发送通知消息最终失败: {response_text}")
+    async def _send_photos(self, photos: List[dict], chat_id: str, retry_transient: bool = True) -> None:
+        """
+        发送一条或多条图文消息，失败时抛出 DeliveryError
+
+        同一通知并发发往多个目标时，需要上传的图片由第一个目标上传，
+        其他目标等待上传完成后直接使用返回的 file_id；上传失败时由下一个目标重新上传。
+        """
+        claimed = await self._claim_uploads([notification["photo"] for notification in photos])
+        try:
+            await self._post_photos(photos, chat_id, retry_transient)
+        finally:
+            for key in claimed:
+                self._uploads.pop(key).set_result(None)
 
+    async def _claim_uploads(self, photos: List[Photo]) -> List[str]:
+        """等待其他目标正在上传的图片，然后登记本次需要上传的图片，返回登记的 key"""
+        while True:
+            pending = [self._uploads[photo.key] for photo in photos
+                       if photo.file_id is None and photo.data is not None and photo.key in self._uploads]
+            if not pending:
+                break
+            self.stats["upload_waits"] += 1
+            await asyncio.wait(pending)
+            for photo in photos:
+                # 不同通知可能持有同一张图片的不同 Photo 对象，从缓存取回其他目标上传得到的 file_id
+                if photo.file_id is None:
+                    photo.file_id = self.images.file_ids.get(photo.key)
+        loop = asyncio.get_running_loop()
+        claimed = list(dict.fromkeys(
+            photo.key for photo in photos if photo.file_id is None and photo.data is not None
+        ))
+        for key in claimed:
+            self._uploads[key] = loop.create_future()
+        return claimed
+
+    async def _post_photos(self, photos: List[dict], chat_id: str, retry_transient: bool) -> None:
+        files = {}
+
+        def media_ref(photo: Photo, name: str) -> str:
+            if photo.file_id:
+                return photo.file_id
+            if photo.data is not None:
+                files[name] = (photo.filename, photo.data)
+                return f"attach://{name}"
+            return photo.url
+
+        if len(photos) == 1:
+            photo = photos[0]["photo"]
+            data = {
+                "chat_id": chat_id,
+                "caption": photos[0]["caption"],
+                "parse_mode": "HTML",
+                # "reply_markup": json.dumps(photos[0]["keyboard"])
+            }
+            if photo.file_id or photo.data is None:
+                data["photo"] = media_ref(photo, "photo")
+            else:
+                files["photo"] = (photo.filename, photo.data)
+            try:
+                result = await self._send_notification_request("sendPhoto", data, files, retry_transient)
+            except DeliveryError as e:
+                self._discard_file_ids([photo], e)
+                raise
+            self._remember_file_ids([photo], [result] if result else None)
+            return
+
+        # 相册中每张图片保留各自的说明文字
+        media = [
+            {
+                "type": "photo",
+                "media": media_ref(notification["photo"], f"photo{index}"),
+                "caption": notification["caption"],
+                "parse_mode": "HTML"
+            }
+            for index, notification in enumerate(photos)
+        ]
+        self.stats["media_groups"] += 1
+        self.stats["media_group_items"] += len(photos)
+        try:
+            result = await self._send_notification_request("sendMediaGroup", {
+                "chat_id": chat_id,
+                "media": media
+            }, files, retry_transient)
+        except DeliveryError as e:
+            self._discard_file_ids([notification["photo"] for notification in photos], e)
+            raise
+        self._remember_file_ids([notification["photo"] for notification in photos], result)
+
+    def _discard_file_ids(self, photos: List[Photo], error: DeliveryError) -> None:
+        """请求被 Telegram 拒绝(4xx)时丢弃本次使用的 file_id，网络错误、5xx 和限速不影响 file_id"""
+        if error.kind != THROTTLED and error.status and error.status < 500:
+            self._remember_file_ids(photos, None)
+
+    def _remember_file_ids(self, photos: List[Photo], messages: Optional[list]) -> None:
+        """记录 Telegram 返回的 file_id；发送失败时丢弃本次使用的 file_id，避免反复使用失效的 ID"""
+        if not messages:
+            for photo in photos:
+                if photo.file_id:
+                    self.images.forget(photo)
+            return
+        for photo, message in zip(photos, messages):
+            sizes = message.get("photo") if isinstance(message, dict) else None
+            if sizes:
+                # 最后一个是最大尺寸
+                self.images.remember(photo, sizes[-1].get("file_id"))
+
+    async def _send_notification_request(self, method: str, data: dict, files: Optional[dict] = None,
+                                         retry_transient: bool = True):
+        """调用 Telegram API 发送消息，返回响应中的 result，失败时抛出 DeliveryError"""
+        self.stats["telegram_api_calls"] += 1
+        session = self.http.session('telegram')
+        endpoint = f"{self.telegram_api_url}/{method}"
+        try:
+            response = await self.send_telegram_message_with_retry(
+                session, endpoint, data, files=files, retry_transient=retry_transient
+            )
+            return (await response.json()).get("result")
+        except DeliveryError:
+            raise
         except Exception as e:
             self.logger.error(f"发送通知消息失败: {str(e)}")
+            raise DeliveryError(TRANSIENT, str(e) or type(e).__name__) from e
@@ -1,16 +1,19 @@
 import asyncio
 
-from emby_webhook import run_emby_webhook_server
+from config.settings import DEPLOYMENT_MODE
+from emby_webhook import run_dispatcher_server, run_emby_webhook_server
+from utils import runtime
 
 async def main():
     """主函数：同时运行 bot 和 webhook server"""
-    # 创建任务
-    webhook_task = asyncio.create_task(run_emby_webhook_server())
+    # 创建任务，split 模式下本进程只负责分发，webhook 由独立的 ingest 进程接收
+    server = run_dispatcher_server if DEPLOYMENT_MODE == 'split' else run_emby_webhook_server
+    webhook_task = asyncio.create_task(server())
 
     # 等待两个任务完成
     await asyncio.gather(webhook_task)
 
 
 if __name__ == "__main__":
-    # 运行主函数
-    asyncio.run(main())
\ No newline at end of file
+    # 运行主函数，安装了 uvloop 时使用 uvloop 事件循环
+    runtime.run(main)
\ No newline at end of file
@@ -1,9 +1,11 @@
 from .media import *
 from .server import *
 from .webhook import *
+from .projection import *
 
 __all__ = [
-    'MediaItem', 'ExternalUrl', 'Studio', 'Tag', 'ImageTags', 'ProviderIds',
+    'MediaItem', 'ExternalUrl', 'Studio', 'Tag', 'ImageTag', 'ProviderIds',
     'ServerInfo',
-    'EmbyWebhook'
+    'EmbyWebhook',
+    'WebhookView', 'MediaItemView', 'ServerView'
 ]
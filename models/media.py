@@ -3,6 +3,8 @@ from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
+from utils.helpers import parse_emby_date
+
 
 class ExternalUrl(BaseModel):
     Name: str
@@ -73,7 +75,7 @@ class MediaItem(BaseModel):
     Height: Optional[int] = None
 
     def format_info(self) -> str:
-        """返回格式化的媒体信息"""
+        """返回格式化的媒体信息，日期字段是 Emby 返回的字符串，统一按 parse_emby_date 格式化"""
         return f"""
 新增媒体文件:
 - 名称: {self.Name}
@@ -82,11 +84,11 @@ class MediaItem(BaseModel):
 - 类型: {self.Type}
 - 格式: {self.Container}
 - 路径: {self.Path}
-- 大小: {self.Size:,} bytes
-- 分辨率: {self.Width}x{self.Height if self.Width and self.Height else '未知'}
+- 大小: {f'{self.Size:,} bytes' if self.Size is not None else '未知'}
+- 分辨率: {f'{self.Width}x{self.Height}' if self.Width and self.Height else '未知'}
 - 比特率: {self.Bitrate}
-- 发行日期: {self.PremiereDate if self.PremiereDate else '未知'}
-- 入库日期: {self.DateCreated.strftime('%Y-%m-%d %H:%M:%S')}
+- 发行日期: {parse_emby_date(self.PremiereDate)}
+- 入库日期: {parse_emby_date(self.DateCreated)}
 - 年份: {self.ProductionYear or '未知'}
 - 制作公司: {', '.join(studio.Name for studio in self.Studios)}
 - 标签: {', '.join(tag.Name for tag in self.TagItems)}
@@ -0,0 +1,96 @@
+"""
+webhook 的精简投影
+
+热路径(接收、去重、路由、渲染)只需要事件类型、来源服务器和条目的少数字段，
+完整的 EmbyWebhook 会逐项校验 ExternalUrls、GenreItems、RemoteTrailers、Taglines 等
+从不使用的嵌套列表。这里的模型只声明用到的字段，其余字段在解析时直接跳过，
+实例不可变且使用 __slots__，同时保留原始请求体，需要完整模型时再按需解析。
+"""
+import dataclasses
+from typing import Optional, Tuple
+
+from pydantic import TypeAdapter
+from pydantic.dataclasses import dataclass
+
+from .webhook import EmbyWebhook
+
+
+@dataclass(frozen=True, slots=True)
+class NamedView:
+    """制作公司、标签等只需要名称的条目"""
+    Name: str
+
+
+@dataclass(frozen=True, slots=True)
+class ImageTagsView:
+    Primary: Optional[str] = None
+    Thumb: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class ServerView:
+    Id: str
+    Name: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class MediaItemView:
+    """渲染、路由、去重、选图和汇总分组用到的条目字段"""
+    Name: str
+    ServerId: str
+    Id: str
+    Path: str
+    FileName: str
+    ParentId: str
+    Type: str
+    SeriesId: Optional[str] = None
+    SeriesName: Optional[str] = None
+    ParentIndexNumber: Optional[int] = None
+    IndexNumber: Optional[int] = None
+    ProductionYear: Optional[int] = None
+    DateCreated: Optional[str] = None
+    PremiereDate: Optional[str] = None
+    Container: Optional[str] = None
+    Overview: Optional[str] = None
+    RunTimeTicks: Optional[int] = None
+    Size: Optional[int] = None
+    Width: Optional[int] = None
+    Height: Optional[int] = None
+    Genres: Tuple[str, ...] = ()
+    Studios: Tuple[NamedView, ...] = ()
+    TagItems: Tuple[NamedView, ...] = ()
+    ImageTags: Optional[ImageTagsView] = None
+    BackdropImageTags: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class WebhookView:
+    """
+    webhook 的精简投影，通过 WebhookView.parse 从原始请求体创建
+
+    raw 为原始请求体，持久化队列、死信和归档都使用它，不再重新序列化；
+    full() 首次调用时才解析完整的 EmbyWebhook 并缓存
+    """
+    Title: str
+    Event: str
+    Server: Optional[ServerView] = None
+    Item: Optional[MediaItemView] = None
+    raw: bytes = dataclasses.field(default=b'', init=False, repr=False, compare=False)
+    _full: Optional[EmbyWebhook] = dataclasses.field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def parse(cls, body: bytes) -> "WebhookView":
+        """直接从原始字节解析，未声明的字段只做 JSON 语法检查"""
+        view = _ADAPTER.validate_json(body)
+        # 冻结的实例只能通过 object.__setattr__ 设置非初始化字段
+        object.__setattr__(view, 'raw', bytes(body))
+        return view
+
+    def full(self) -> EmbyWebhook:
+        """完整校验的模型，首次调用时从原始请求体解析"""
+        if self._full is None:
+            object.__setattr__(self, '_full', EmbyWebhook.model_validate_json(self.raw))
+        return self._full
+
+
+_ADAPTER = TypeAdapter(WebhookView)
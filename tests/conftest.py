@@ -0,0 +1,52 @@
+"""
+测试公共配置
+
+服务模块在导入时读取环境变量，这里在任何测试导入它们之前设置测试用的默认值，
+持久化文件都写到临时目录中。
+"""
+import copy
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_DATA_DIR = tempfile.mkdtemp(prefix="emby_webhook_tests_")
+for key, value in {
+    "DATA_DIR": _DATA_DIR,
+    "ARCHIVE_DIR": os.path.join(_DATA_DIR, "notifications"),
+    "TELEGRAM_BOT_TOKEN": "test",
+    "WEBHOOK_CHANNEL_ID": "-1001",
+    "EMBY_URL": "",
+    "LOG_LEVEL": "WARNING",
+    "LOG_ASYNC": "false",
+    "LOG_PAYLOAD_SAMPLE_RATE": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+SAMPLE_PAYLOAD = os.path.join(ROOT, "library.new_20250708_062238.json")
+
+
+@pytest.fixture
+def make_webhook():
+    """以仓库自带的示例请求为基础，按参数覆盖条目字段，返回 WebhookView"""
+    from models.projection import WebhookView
+
+    with open(SAMPLE_PAYLOAD, "rb") as f:
+        sample = json.load(f)
+
+    def make(event: str = "library.new", server_id=None, **item):
+        data = copy.deepcopy(sample)
+        data["Event"] = event
+        data["Item"].update(item)
+        if server_id is not None:
+            data["Server"]["Id"] = server_id
+        return WebhookView.parse(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    return make
@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+from starlette.requests import Request
+
+import emby_webhook
+
+TOKEN = "secret"
+
+
+@pytest.fixture
+def redrive(monkeypatch):
+    """调用重新投递接口，返回 (状态码, 响应, 传给 MessageQueue.redrive 的参数)"""
+    monkeypatch.setattr(emby_webhook, "ADMIN_API_TOKEN", TOKEN)
+    calls = []
+
+    async def fake_redrive(ids=None, limit=None):
+        calls.append((ids, limit))
+        return len(ids or [])
+
+    monkeypatch.setattr(emby_webhook.message_queue, "redrive", fake_redrive)
+    app = emby_webhook.create_webhook_app(accept_webhooks=False)
+    endpoint = next(route.endpoint for route in app.routes if route.path == "/admin/dead-letters/redrive")
+
+    def call(body: bytes, token: str = TOKEN):
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        request = Request({
+            "type": "http", "method": "POST", "path": "/admin/dead-letters/redrive",
+            "headers": [(b"authorization", f"Bearer {token}".encode())],
+        }, receive)
+        response = asyncio.run(endpoint(request))
+        if isinstance(response, dict):
+            return 200, response, calls
+        return response.status_code, json.loads(response.body), calls
+
+    return call
+
+
+@pytest.mark.parametrize("body,expected", [
+    (b"", (None, None)),
+    (b"{}", (None, None)),
+    (b'{"ids": [1, 2]}', ([1, 2], None)),
+    (b'{"limit": 5}', (None, 5)),
+    (b'{"limit": 0}', (None, 0)),
+    (b'{"ids": [3, 1], "limit": 1}', ([3, 1], 1)),
+])
+def test_valid_bodies_are_redriven(redrive, body, expected):
+    status, response, calls = redrive(body)
+    assert status == 200 and response["status"] == "success"
+    assert calls == [expected]
+
+
+@pytest.mark.parametrize("body", [
+    b"not json", b"[1, 2]", b'"all"', b"3", b"null",
+    b'{"ids": []}', b'{"ids": [], "limit": 0}',
+    b'{"ids": 1}', b'{"ids": ["1"]}', b'{"ids": [1.5]}', b'{"ids": [true]}',
+    b'{"limit": "10"}', b'{"limit": 2.5}', b'{"limit": -1}', b'{"limit": false}',
+])
+def test_invalid_bodies_are_rejected(redrive, body):
+    status, response, calls = redrive(body)
+    assert status == 400 and response["status"] == "error"
+    assert calls == []
+
+
+def test_wrong_token_is_rejected(redrive):
+    status, _, calls = redrive(b"{}", token="wrong")
+    assert status == 401 and calls == []
@@ -0,0 +1,109 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.archive import ArchiveReader, NotificationArchive
+
+BASE = datetime(2025, 7, 8, 6, 0, 0)
+
+
+def at(seconds: float) -> datetime:
+    return BASE + timedelta(seconds=seconds)
+
+
+def write_segment(directory, prefix, started, records, compress=False):
+    """写入一个分段，records 为 [(秒, 事件, 名称)]"""
+    suffix = ".jsonl.gz" if compress else ".jsonl"
+    path = os.path.join(directory, f"{prefix}_{started:%Y%m%d_%H%M%S_%f}{suffix}")
+    lines = b"".join(
+        json.dumps({"received_at": at(second).isoformat(), "event": event, "payload": {"Name": name}},
+                   ensure_ascii=False).encode() + b"\n"
+        for second, event, name in records
+    )
+    with (gzip.open if compress else open)(path, "wb") as f:
+        f.write(lines)
+    return path
+
+
+def names(reader):
+    return [json.loads(record.payload)["Name"] for record in reader]
+
+
+def test_overlapping_segments_are_merged_by_time(tmp_path):
+    write_segment(tmp_path, "ingest-1", at(0), [(0, "library.new", "a"), (5, "library.new", "c"),
+                                                (9, "library.new", "e")])
+    write_segment(tmp_path, "ingest-2", at(1), [(1, "library.new", "b"), (6, "library.new", "d")], compress=True)
+    write_segment(tmp_path, "ingest-1", at(3600), [(3600, "library.new", "f")])
+    assert names(ArchiveReader(str(tmp_path))) == ["a", "b", "c", "d", "e", "f"]
+
+
+def test_records_written_before_segment_name_time_are_merged_within_slack(tmp_path):
+    # 批量写入时分段中的记录可能早于文件名中的时间
+    write_segment(tmp_path, "p1", at(0), [(0, "library.new", "a"), (20, "library.new", "c")])
+    write_segment(tmp_path, "p2", at(30), [(10, "library.new", "b"), (40, "library.new", "d")])
+    assert names(ArchiveReader(str(tmp_path), slack=60)) == ["a", "b", "c", "d"]
+
+
+def test_equal_timestamps_keep_file_order(tmp_path):
+    write_segment(tmp_path, "p1", at(0), [(5, "library.new", "first")])
+    write_segment(tmp_path, "p2", at(1), [(5, "library.new", "second")])
+    assert names(ArchiveReader(str(tmp_path))) == ["first", "second"]
+
+
+def test_segments_are_opened_lazily(tmp_path):
+    for hour in range(5):
+        write_segment(tmp_path, "p", at(hour * 3600), [(hour * 3600, "library.new", str(hour))])
+    reader = ArchiveReader(str(tmp_path), slack=60)
+    iterator = iter(reader)
+    assert names([next(iterator)]) == ["0"]
+    assert reader.stats["files"] == 1
+    assert names(iterator) == ["1", "2", "3", "4"]
+    assert reader.stats["files"] == 5
+
+
+def test_legacy_files_events_and_time_range(tmp_path):
+    write_segment(tmp_path, "p", at(0), [(0, "library.new", "a"), (10, "item.rate", "b"),
+                                         (20, "library.new", "c"), (40, "library.new", "e")])
+    with open(tmp_path / f"library.new_{at(30):%Y%m%d_%H%M%S}.json", "w", encoding="utf-8") as f:
+        json.dump({"Name": "d"}, f)
+    with open(tmp_path / f"item.rate_{at(35):%Y%m%d_%H%M%S}.json", "w", encoding="utf-8") as f:
+        json.dump({"Name": "skipped"}, f)
+    (tmp_path / "README.txt").write_text("not an archive")
+
+    reader = ArchiveReader(str(tmp_path), events=["library.new"], since=at(5).timestamp(),
+                           until=at(35).timestamp())
+    assert names(reader) == ["c", "d"]
+    assert reader.stats["skipped"] == 3
+
+
+def test_corrupt_lines_and_truncated_segments_are_skipped(tmp_path):
+    path = write_segment(tmp_path, "p", at(0), [(0, "library.new", "a"), (1, "library.new", "b")])
+    with open(path, "ab") as f:
+        f.write(b"{broken\n")
+    truncated = write_segment(tmp_path, "q", at(2), [(2, "library.new", "c")] * 200, compress=True)
+    with open(truncated, "r+b") as f:
+        f.truncate(os.path.getsize(truncated) - 20)
+
+    reader = ArchiveReader(str(tmp_path))
+    result = names(reader)
+    assert result[:2] == ["a", "b"]
+    assert set(result[2:]) <= {"c"}
+    assert reader.stats["errors"] == 2
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_archive_round_trip(tmp_path, compress):
+    archive = NotificationArchive(str(tmp_path), compress=compress, flush_interval=0.01)
+    archive.start()
+    payloads = [json.dumps({"Name": f"item {n}", "Overview": "line\nbreak"}, indent=2).encode() for n in range(5)]
+    for payload in payloads:
+        assert archive.submit("library.new", payload)
+    archive.stop()
+
+    records = list(ArchiveReader(str(tmp_path)))
+    assert [record.event for record in records] == ["library.new"] * 5
+    assert [json.loads(record.payload) for record in records] == [json.loads(payload) for payload in payloads]
+    assert [record.received_at for record in records] == sorted(record.received_at for record in records)
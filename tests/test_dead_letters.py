@@ -0,0 +1,35 @@
+import pytest
+
+from utils.dead_letters import DeadLetterStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DeadLetterStore(str(tmp_path / "dead_letters.db"))
+    store.open()
+    for n in range(1, 6):
+        store.add(f"-100{n}", "permanent", "chat not found", 1, {"event_type": "library.new", "n": n}, b"{}")
+    yield store
+    store.close()
+
+
+def taken(rows):
+    return [meta["n"] for _, meta, _ in rows]
+
+
+def test_take_all_and_limit(store):
+    assert taken(store.take(limit=2)) == [1, 2]
+    assert taken(store.take()) == [3, 4, 5]
+    assert store.size == 0
+
+
+def test_empty_ids_take_nothing(store):
+    assert store.take(ids=[]) == []
+    assert store.take(ids=[], limit=10) == []
+    assert store.size == 5
+
+
+def test_ids_are_taken_in_order_and_limited(store):
+    assert taken(store.take(ids=[4, 2, 99])) == [2, 4]
+    assert taken(store.take(ids=[5, 3, 1], limit=2)) == [1, 3]
+    assert [entry["meta"]["n"] for entry in store.list()] == [5]
@@ -0,0 +1,103 @@
+import pytest
+
+from utils.dedup import DuplicateFilter, normalize_title
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("MOND-158-C.mkv", "mond-158"),
+    ("MOND-158.mp4", "mond-158"),
+    ("ABC-123_UC.mkv", "abc-123"),
+    ("ABC-123-cd1.mkv", "abc-123"),
+    ("ABC-123.2160p.mkv", "abc-123"),
+    ("FC2-PPV-1234567-C.mp4", "fc2-ppv-1234567"),
+    # 普通标题中的单词不是版本后缀
+    ("Plan C.mkv", "plan c"),
+    ("Vitamin C", "vitamin c"),
+    ("Movie 4K.mkv", "movie 4k"),
+    ("Movie.HD.mkv", "movie hd"),
+    ("Apollo 13.mkv", "apollo 13"),
+    ("", ""),
+    (None, ""),
+])
+def test_normalize_title(name, expected):
+    assert normalize_title(name) == expected
+
+
+@pytest.fixture
+def dedup():
+    return DuplicateFilter(None, strategies=("item_id", "title"))
+
+
+def test_same_item_is_suppressed(dedup, make_webhook):
+    assert dedup.check(make_webhook(Id="1")) is None
+    assert dedup.check(make_webhook(Id="1")).startswith("item:")
+
+
+def test_versions_of_a_code_title_in_different_folders_are_suppressed(dedup, make_webhook):
+    assert dedup.check(make_webhook(Id="1", FileName="MOND-158.mp4", ParentId="a")) is None
+    assert dedup.check(make_webhook(Id="2", FileName="MOND-158-C.mkv", ParentId="b")).startswith("title:")
+
+
+def test_same_episode_file_name_in_different_shows_is_not_a_duplicate(dedup, make_webhook):
+    episode = dict(Type="Episode", FileName="01.mkv", Name="第 1 集")
+    assert dedup.check(make_webhook(Id="1", ParentId="show-a-s1", SeriesId="show-a", **episode)) is None
+    assert dedup.check(make_webhook(Id="2", ParentId="show-b-s1", SeriesId="show-b", **episode)) is None
+    # 同一季中的另一个版本仍然是重复
+    assert dedup.check(make_webhook(Id="3", ParentId="show-a-s1", SeriesId="show-a", **episode)) is not None
+
+
+def test_plain_titles_are_scoped_to_their_folder(dedup, make_webhook):
+    assert dedup.check(make_webhook(Id="1", FileName="Plan C.mkv", ParentId="a")) is None
+    assert dedup.check(make_webhook(Id="2", FileName="Plan.mkv", ParentId="a")) is None
+    assert dedup.check(make_webhook(Id="3", FileName="Movie 4K.mkv", ParentId="a")) is None
+    assert dedup.check(make_webhook(Id="4", FileName="Movie.mkv", ParentId="a")) is None
+    assert dedup.check(make_webhook(Id="5", FileName="Movie.mkv", ParentId="b")) is None
+
+
+def test_keys_are_scoped_by_server(dedup, make_webhook):
+    assert dedup.check(make_webhook(Id="1", server_id="s1")) is None
+    assert dedup.check(make_webhook(Id="1", server_id="s2")) is None
+
+
+def test_window_expiry(make_webhook):
+    dedup = DuplicateFilter(None, window=0, strategies=("item_id",))
+    assert dedup.check(make_webhook(Id="1")) is None
+    assert dedup.check(make_webhook(Id="1")) is None
+
+
+def test_keys_survive_restart(tmp_path, make_webhook):
+    db_file = str(tmp_path / "dedup.db")
+    dedup = DuplicateFilter(db_file)
+    dedup.load()
+    assert dedup.check(make_webhook(Id="1")) is None
+    dedup.close()
+
+    restarted = DuplicateFilter(db_file)
+    restarted.load()
+    assert restarted.check(make_webhook(Id="1")) is not None
+    restarted.close()
+
+
+@pytest.fixture
+def path_dedup():
+    return DuplicateFilter(None, strategies=("path",))
+
+
+def test_episodes_in_one_folder_are_not_suppressed_by_path(path_dedup, make_webhook):
+    for n in range(1, 4):
+        webhook = make_webhook(Id=str(n), Type="Episode", Path=f"/tv/Show/Season 1/Show - S01E0{n}.mkv")
+        assert path_dedup.check(webhook) is None
+
+
+def test_movies_in_one_folder_are_not_suppressed_by_path(path_dedup, make_webhook):
+    assert path_dedup.check(make_webhook(Id="1", Path="/movies/合集/Movie One.mkv")) is None
+    assert path_dedup.check(make_webhook(Id="2", Path="/movies/合集/Movie Two.mkv")) is None
+
+
+def test_same_file_or_version_in_one_folder_is_suppressed_by_path(path_dedup, make_webhook):
+    assert path_dedup.check(make_webhook(Id="1", Path="/av/MOND-158/MOND-158.mp4")) is None
+    assert path_dedup.check(make_webhook(Id="2", Path="/av/MOND-158/MOND-158-C.mkv")).startswith("path:")
+    # Windows 路径同样按文件夹和文件名区分
+    assert path_dedup.check(make_webhook(Id="3", Path="D:\\tv\\Show\\S01E01.mkv")) is None
+    assert path_dedup.check(make_webhook(Id="4", Path="D:\\tv\\Show\\S01E02.mkv")) is None
+    assert path_dedup.check(make_webhook(Id="5", Path="D:\\tv\\Show\\S01E01.mkv")).startswith("path:")
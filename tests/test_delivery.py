@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeTelegramServer
+from handlers.webhook_handler import WebhookHandler
+from utils.delivery import PERMANENT, THROTTLED, TRANSIENT, DeliveryError, classify_failure
+from utils.http_client import HttpClientPool
+
+
+@pytest.mark.parametrize("status,description,kind", [
+    (429, "Too Many Requests: retry after 5", THROTTLED),
+    (500, "Internal Server Error", TRANSIENT),
+    (502, "Bad Gateway", TRANSIENT),
+    (408, "", TRANSIENT),
+    (409, "Conflict: terminated by other getUpdates request", TRANSIENT),
+    (400, "Bad Request: chat not found", PERMANENT),
+    (403, "Forbidden: bot was kicked from the channel chat", PERMANENT),
+    (400, "Bad Request: wrong file identifier/HTTP URL specified", TRANSIENT),
+    (400, "Bad Request: failed to get HTTP URL content", TRANSIENT),
+    (0, "", TRANSIENT),
+])
+def test_classify_failure(status, description, kind):
+    assert classify_failure(status, description) == kind
+
+
+async def send_once(retry_transient, **fake_options):
+    telegram = FakeTelegramServer(**fake_options)
+    http = HttpClientPool()
+    try:
+        handler = WebhookHandler(http)
+        handler.telegram_api_url = f"{await telegram.start()}/bottest"
+        try:
+            await handler._send_notification_request(
+                "sendMessage", {"chat_id": "-1001", "text": "hi"}, retry_transient=retry_transient
+            )
+            error = None
+        except DeliveryError as e:
+            error = e
+        return telegram, error
+    finally:
+        await http.close()
+        await telegram.stop()
+
+
+def test_throttled_is_raised_immediately_without_transient_retries():
+    telegram, error = asyncio.run(send_once(False, rate_limit_every=1, retry_after=7))
+    assert telegram.requests == 1
+    assert error.kind == THROTTLED and error.retry_after == 7
+
+
+def test_transient_is_raised_immediately_without_transient_retries():
+    telegram, error = asyncio.run(send_once(False, error_every=1))
+    assert telegram.requests == 1
+    assert error.kind == TRANSIENT and error.status == 502
+
+
+def test_permanent_is_not_retried():
+    telegram, error = asyncio.run(send_once(True, missing_chats=["-1001"]))
+    assert telegram.requests == 1
+    assert error.kind == PERMANENT and error.status == 400
+
@@ -0,0 +1,105 @@
+import pytest
+
+from utils.digest import (GROUP_AUTO, GROUP_LIBRARY, GROUP_PARENT, MODE_AUTO, MODE_OFF, MODE_ON, ArrivalRate,
+                          DigestPolicy)
+
+
+@pytest.fixture
+def message(make_webhook):
+    def make(name, library="电视剧", server_id="srv", **item):
+        webhook = make_webhook(server_id=server_id, Name=name, **item)
+        return {"webhook": webhook, "notification": {"library": library, "item": None}}
+
+    return make
+
+
+def episode(message, name, series="s1", **kwargs):
+    return message(name, Type="Episode", SeriesId=series, SeriesName=f"Show {series}", ParentId=f"season-{series}",
+                   **kwargs)
+
+
+def movie(message, name, parent="folder-a", library="电影", **kwargs):
+    return message(name, library=library, Type="Movie", SeriesId=None, SeriesName=None, ParentId=parent,
+                   Path=f"/media/{parent}/{name}.mkv", **kwargs)
+
+
+def titles(units):
+    return [(title, [m["webhook"].Item.Name for m in members]) for title, members in units]
+
+
+def test_group_keys(message):
+    policy = DigestPolicy(MODE_ON, group_by=GROUP_AUTO)
+    assert policy.group_key(episode(message, "e1")) == ("srv", "series", "s1")
+    assert policy.group_key(movie(message, "m1")) == ("srv", "library", "电影")
+    assert DigestPolicy(MODE_ON, group_by=GROUP_PARENT).group_key(movie(message, "m1")) == \
+        ("srv", "parent", "folder-a")
+    assert DigestPolicy(MODE_ON, group_by=GROUP_LIBRARY).group_key(episode(message, "e1")) == \
+        ("srv", "library", "电视剧")
+
+
+def test_same_series_on_different_servers_is_not_merged(message):
+    policy = DigestPolicy(MODE_ON)
+    assert policy.group_key(episode(message, "e1", server_id="a")) != \
+        policy.group_key(episode(message, "e1", server_id="b"))
+
+
+def test_small_groups_stay_single_and_order_is_kept(message):
+    policy = DigestPolicy(MODE_ON, min_items=3)
+    batch = [
+        movie(message, "m1"),
+        episode(message, "e1"),
+        episode(message, "x1", series="s2"),
+        episode(message, "e2"),
+        movie(message, "m2"),
+        episode(message, "e3"),
+    ]
+    assert titles(policy.group(batch)) == [
+        (None, ["m1"]),
+        ("Show s1", ["e1", "e2", "e3"]),
+        (None, ["x1"]),
+        (None, ["m2"]),
+    ]
+
+
+def test_parent_grouping_uses_folder_name(message):
+    policy = DigestPolicy(MODE_ON, min_items=2, group_by=GROUP_PARENT)
+    batch = [movie(message, "m1", parent="合集"), movie(message, "m2", parent="合集"), movie(message, "m3")]
+    assert titles(policy.group(batch)) == [("合集", ["m1", "m2"]), (None, ["m3"])]
+
+
+def test_min_items_is_at_least_two(message):
+    policy = DigestPolicy(MODE_ON, min_items=1)
+    assert titles(policy.group([movie(message, "m1")])) == [(None, ["m1"])]
+
+
+def test_arrival_rate_window():
+    rate = ArrivalRate(window=60)
+    for second in range(30):
+        rate.record(now=1000 + second)
+        rate.record(now=1000 + second)
+    assert rate.per_minute(now=1030) == 60
+    assert rate.per_minute(now=1075) == 28
+    assert rate.per_minute(now=1100) == 0
+
+
+def test_auto_mode_hysteresis(monkeypatch):
+    policy = DigestPolicy(MODE_AUTO, threshold=30)
+    rate = {"value": 0.0}
+    monkeypatch.setattr(policy.rate, "per_minute", lambda now=None: rate["value"])
+    assert not policy.active()
+    rate["value"] = 30
+    assert policy.active()
+    # 速率降到阈值以下但未低于一半，保持开启
+    rate["value"] = 20
+    assert policy.active()
+    # 速率已降低但积压仍多，保持开启
+    rate["value"] = 10
+    assert policy.active(backlog=100)
+    assert not policy.active(backlog=0)
+    assert policy.stats["activations"] == 1
+
+
+def test_fixed_modes():
+    assert DigestPolicy(MODE_ON).active()
+    assert not DigestPolicy(MODE_OFF).active(backlog=10 ** 6)
+    assert DigestPolicy("bogus").mode == MODE_AUTO
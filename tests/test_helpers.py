@@ -0,0 +1,57 @@
+import pytest
+
+from utils import helpers
+
+# 期望值取自预编译正则和缓存改造之前的实现，保证改造前后输出一致
+HASHTAG_CASES = [
+    (None, ""), ("", ""), ("   ", ""), ("动作", "动作"), ("Science Fiction", "Science_Fiction"),
+    ("  Sci-Fi & Fantasy  ", "SciFi_Fantasy"), ("类型：剧情", "类型_剧情"), ("类型 ： 剧情", "类型_剧情"),
+    ("Warner Bros. Pictures", "Warner_Bros_Pictures"), ("A24", "A24"), ("__double__under__", "double_under"),
+    ("Ünïcödé Títle", "Ünïcödé_Títle"), ("日本語タイトル", "日本語タイトル"), ("tab\tand\nnewline", "tab_and_newline"),
+    ("emoji 🎬 tag", "emoji_tag"), ("C++/CLI", "CCLI"), ("100% Pure", "100_Pure"), ("S.H.I.E.L.D.", "SHIELD"),
+    ("::", ""), ("：：", ""), ("a:b:c", "a_b_c"),
+]
+
+MARKDOWN_CASES = [
+    ("", ""),
+    ("plain text", "plain text"),
+    ("_*[]()~`>#+-=|{}.!", "\\_\\*\\[\\]\\(\\)\\~\\`\\>\\#\\+\\-\\=\\|\\{\\}\\.\\!"),
+    ("MOND-158 与暗恋的女上司 (2024) [4K] v1.2!", "MOND\\-158 与暗恋的女上司 \\(2024\\) \\[4K\\] v1\\.2\\!"),
+    ("already \\escaped", "already \\escaped"),
+    ("纯中文标题没有特殊字符", "纯中文标题没有特殊字符"),
+    ("a.b.c.d.e", "a\\.b\\.c\\.d\\.e"),
+    ("https://example.com/path?x=1&y=2#frag", "https://example\\.com/path?x\\=1&y\\=2\\#frag"),
+]
+
+# 不带时区的日期按本机时区解释，结果与运行环境有关，这里不覆盖
+DATE_CASES = [
+    (None, "未知"), ("", "未知"),
+    ("2025-07-08T06:22:38.0000000Z", "2025-07-08 14:22:38"),
+    ("2025-07-08T06:22:38.1234567Z", "2025-07-08 14:22:38"),
+    ("2025-07-08T06:22:38Z", "2025-07-08 14:22:38"),
+    ("2025-07-08T06:22:38.1234567+00:00", "2025-07-08 14:22:38"),
+    ("2025-07-08T06:22:38.123+08:00", "2025-07-08 06:22:38"),
+    ("2025-07-08T06:22:38+08:00", "2025-07-08 06:22:38"),
+    ("2025-07-08T06:22:38.123-05:00", "2025-07-08 19:22:38"),
+    ("0001-01-01T00:00:00.0000000Z", "1-01-01 08:00:00"),
+    ("not a date", "未知"),
+    ("2025-07-08T06:22:38.1.2Z", "未知"),
+]
+
+
+@pytest.mark.parametrize("label,expected", HASHTAG_CASES)
+def test_format_telegram_hashtag(label, expected):
+    assert helpers.format_telegram_hashtag(label) == expected
+    # 第二次调用命中缓存，结果不变
+    assert helpers.format_telegram_hashtag(label) == expected
+
+
+@pytest.mark.parametrize("text,expected", MARKDOWN_CASES)
+def test_escape_markdown_v2(text, expected):
+    assert helpers.escape_markdown_v2(text) == expected
+
+
+@pytest.mark.parametrize("date_str,expected", DATE_CASES)
+def test_parse_emby_date(date_str, expected):
+    assert helpers.parse_emby_date(date_str) == expected
+    assert helpers.parse_emby_date(date_str) == expected
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import emby_webhook
+from utils.ingest_queue import IngestQueue
+
+with open(os.path.join(os.path.dirname(__file__), "..", "library.new_20250708_062238.json"), "rb") as f:
+    SAMPLE = f.read()
+
+
+@pytest.fixture
+def inbox(tmp_path):
+    queue = IngestQueue(str(tmp_path / "ingest.db"), group_commit_interval=0)
+    yield queue
+    queue.close()
+
+
+def failing_commit(queue, times):
+    """前 times 次提交抛出 sqlite3 错误，之后正常提交"""
+    commit = queue._commit
+    calls = []
+
+    def wrapper(batch):
+        calls.append(len(batch))
+        if len(calls) <= times:
+            raise sqlite3.OperationalError("database is locked")
+        commit(batch)
+
+    queue._commit = wrapper
+    return calls
+
+
+def test_append_fetch_ack(inbox):
+    inbox.open(writer=True)
+    for n in range(3):
+        inbox.append("library.new", f"payload {n}".encode())
+    inbox.close()
+    inbox.open()
+    rows = inbox.fetch(10)
+    assert [payload for _, _, payload in rows] == [b"payload 0", b"payload 1", b"payload 2"]
+    inbox.ack([rows[0][0]])
+    assert inbox.backlog() == 2
+
+
+def test_failed_commit_is_retried(inbox):
+    failing_commit(inbox, 2)
+    inbox.open(writer=True)
+    inbox.append("library.new", b"payload")
+    inbox.close()
+    inbox.open()
+    assert inbox.backlog() == 1
+    assert inbox.stats["dropped"] == 0
+
+
+def test_close_gives_up_after_bounded_retries(inbox):
+    calls = failing_commit(inbox, 1000)
+    inbox.open(writer=True)
+    inbox.append("library.new", b"payload")
+    closer = threading.Thread(target=inbox.close)
+    closer.start()
+    closer.join(timeout=5)
+    assert not closer.is_alive(), "close() did not return"
+    assert inbox.stats["dropped"] == 1
+    assert len(calls) < 1000
+
+
+def test_consumer_backs_off_and_survives_errors(monkeypatch):
+    class FlakyInbox:
+        def __init__(self):
+            self.fetches = 0
+            self.acked = []
+
+        def fetch(self, limit):
+            self.fetches += 1
+            if self.fetches == 1:
+                raise sqlite3.OperationalError("database is locked")
+            if len(self.acked) < 2:
+                # 确认之前同一批事件会被重新读取
+                return [(1, "library.new", b"not json"), (2, "library.new", SAMPLE)]
+            return []
+
+        def ack(self, ids):
+            if not self.acked:
+                self.acked.append(None)
+                raise sqlite3.OperationalError("database is locked")
+            self.acked.append(ids)
+
+    class FakeQueue:
+        journal = None
+
+        def accepting(self):
+            return True
+
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def fast_sleep(delay):
+        delays.append(delay)
+        await real_sleep(0)
+
+    enqueued = []
+
+    async def fake_enqueue(webhook):
+        enqueued.append(webhook)
+        return True
+
+    monkeypatch.setattr(emby_webhook, "message_queue", FakeQueue())
+    monkeypatch.setattr(emby_webhook, "enqueue_event", fake_enqueue)
+    monkeypatch.setattr(emby_webhook.asyncio, "sleep", fast_sleep)
+    inbox = FlakyInbox()
+
+    async def run():
+        consumer = asyncio.create_task(emby_webhook.consume_ingest_queue(inbox))
+        for _ in range(1000):
+            if len(inbox.acked) == 2 or consumer.done():
+                break
+            await real_sleep(0.001)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return consumer
+
+    consumer = asyncio.run(run())
+    assert consumer.cancelled()
+    # 读取失败和确认失败连续发生，退避时间翻倍；确认失败后整批重新读取
+    assert [delay for delay in delays if delay >= 1] == [1, 2]
+    assert inbox.acked[-1] == [1, 2]
+    assert len(enqueued) == 2
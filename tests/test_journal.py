@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from utils.journal import MessageJournal
+
+
+def test_unacked_messages_are_replayed_after_reopen(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = MessageJournal(path)
+    assert journal.open() == []
+    first = journal.append({"event_type": "library.new", "priority": 1}, b'{"a": 1}')
+    second = journal.append({"event_type": "library.new", "priority": 0}, b'{"b": 2}')
+    journal.ack(first)
+    assert journal.wait_durable(second, timeout=5)
+    journal.close()
+
+    reopened = MessageJournal(path)
+    pending = reopened.open()
+    assert pending == [(second, {"event_type": "library.new", "priority": 0}, b'{"b": 2}')]
+    # 新消息的序号接着已有的最大序号
+    assert reopened.append({}, None) == second + 1
+    reopened.close()
+
+
+def test_preload_limits_payloads_and_load_reads_them_back(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = MessageJournal(path)
+    journal.open()
+    seqs = [journal.append({"n": n}, f"payload-{n}".encode()) for n in range(5)]
+    journal.close()
+
+    reopened = MessageJournal(path)
+    pending = reopened.open(preload=2)
+    assert [payload for _, _, payload in pending] == [b"payload-0", b"payload-1", None, None, None]
+    loaded = reopened.load([seqs[4], seqs[2]])
+    assert [(seq, meta["n"], payload) for seq, meta, payload in loaded] == [
+        (seqs[4], 4, b"payload-4"), (seqs[2], 2, b"payload-2")
+    ]
+    reopened.close()
+
+
+def test_load_falls_back_to_buffer_when_writer_is_dead(tmp_path, monkeypatch):
+    # 写入线程启动后立即退出，追加的消息永远不会提交
+    monkeypatch.setattr(MessageJournal, "_writer_loop", lambda self: None)
+    journal = MessageJournal(str(tmp_path / "journal.db"))
+    journal.open()
+    seq = journal.append({"n": 1}, b"buffered")
+
+    start = time.monotonic()
+    assert journal.load([seq], timeout=0.2) == [(seq, {"n": 1}, b"buffered")]
+    assert time.monotonic() - start < 2
+
+
+def failing_commit(journal, times, error=sqlite3.OperationalError("disk I/O error")):
+    """前 times 次提交抛出 error，之后正常提交"""
+    commit = journal._commit
+    calls = []
+
+    def wrapper(appends, acks):
+        calls.append((list(appends), list(acks)))
+        if len(calls) <= times:
+            raise error
+        commit(appends, acks)
+
+    journal._commit = wrapper
+    return calls
+
+
+def pending_after_reopen(path):
+    reopened = MessageJournal(path)
+    try:
+        return [(seq, meta) for seq, meta, _ in reopened.open()]
+    finally:
+        reopened.close()
+
+
+def test_failed_commit_is_retried_and_not_reported_durable(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = MessageJournal(path)
+    journal.open()
+    calls = failing_commit(journal, 2)
+    first = journal.append({"n": 1}, b"a")
+    assert not journal.wait_durable(first, timeout=0.05)
+    second = journal.append({"n": 2}, b"b")
+    assert journal.wait_durable(second, timeout=5)
+    journal.close()
+
+    # 失败的批次放回缓冲区头部，与后续消息按序号顺序提交
+    assert [seq for seq, _, _ in calls[-1][0]] == [first, second]
+    assert pending_after_reopen(path) == [(first, {"n": 1}), (second, {"n": 2})]
+
+
+def test_failed_acks_are_retried(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = MessageJournal(path)
+    journal.open()
+    seq = journal.append({"n": 1})
+    assert journal.wait_durable(seq, timeout=5)
+    failing_commit(journal, 1)
+    journal.ack(seq)
+    journal.close()
+    assert pending_after_reopen(path) == []
+
+
+def test_unexpected_errors_do_not_kill_the_writer(tmp_path):
+    journal = MessageJournal(str(tmp_path / "journal.db"))
+    journal.open()
+    failing_commit(journal, 1, RuntimeError("boom"))
+    seq = journal.append({"n": 1})
+    assert journal.wait_durable(seq, timeout=5)
+    assert journal._thread.is_alive()
+    journal.close()
+
+
+def test_unserializable_meta_is_stored_as_string(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = MessageJournal(path)
+    journal.open()
+    seq = journal.append({"n": 1, "when": datetime(2025, 7, 8, 6, 22, 38)})
+    assert journal.wait_durable(seq, timeout=5)
+    journal.close()
+    assert pending_after_reopen(path) == [(seq, {"n": 1, "when": "2025-07-08 06:22:38"})]
+
+
+def test_close_gives_up_when_commits_keep_failing(tmp_path):
+    journal = MessageJournal(str(tmp_path / "journal.db"), close_retries=2)
+    journal.open()
+    failing_commit(journal, 1000)
+    seq = journal.append({"n": 1})
+    closer = threading.Thread(target=journal.close)
+    closer.start()
+    closer.join(timeout=5)
+    assert not closer.is_alive(), "close() did not return"
+    assert not journal.wait_durable(seq, timeout=0)
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from handlers.webhook_handler import WebhookHandler
+from utils.emby_servers import EmbyServer
+from utils.http_client import http_pool
+
+ROOT = {"Id": "root", "Type": "AggregateFolder", "Name": "Media Folders"}
+
+
+@pytest.fixture
+def handler():
+    return WebhookHandler()
+
+
+@pytest.fixture
+def server():
+    server = EmbyServer(http_pool, "srv", "http://emby.test", "key")
+    # 跳过 /Library/MediaFolders 预热
+    server.library_prewarmed_until = float("inf")
+    return server
+
+
+def use_tree(handler, items):
+    """用内存中的条目树代替 Emby 查询，返回查询过的ID"""
+    tree = {item["Id"]: item for item in items}
+    requested = []
+
+    async def get(server, item_id):
+        requested.append(item_id)
+        return tree.get(item_id)
+
+    handler.items.get = get
+    return requested
+
+
+def test_walk_stops_at_collection_folder(handler, server):
+    use_tree(handler, [
+        {"Id": "season", "Type": "Season", "Name": "Season 1", "ParentId": "show"},
+        {"Id": "show", "Type": "Folder", "Name": "Show", "ParentId": "movies"},
+        {"Id": "movies", "Type": "CollectionFolder", "Name": "电视剧", "ParentId": "root"},
+        ROOT,
+    ])
+    assert asyncio.run(handler.get_library_name("season", server=server)) == "电视剧"
+    # 整条链都已缓存
+    assert server.library_cache.get("show") == "电视剧"
+
+
+def test_top_level_folder_is_used_when_no_collection_folder(handler, server):
+    requested = use_tree(handler, [
+        {"Id": "dir", "Type": "Folder", "Name": "2024", "ParentId": "library"},
+        {"Id": "library", "Type": "Folder", "Name": "电影", "ParentId": "root"},
+        {**ROOT, "ParentId": None},
+    ])
+    assert asyncio.run(handler.get_library_name("dir", server=server)) == "电影"
+    assert requested == ["dir", "library", "root"]
+
+
+def test_root_name_is_used_when_chain_has_no_folders(handler, server):
+    use_tree(handler, [{"Id": "orphan", "Type": "Series", "Name": "孤立条目"}])
+    assert asyncio.run(handler.get_library_name("orphan", server=server)) == "孤立条目"
+
+
+def test_unconfigured_server_returns_unknown(handler):
+    server = EmbyServer(http_pool, "srv", "", None)
+    assert asyncio.run(handler.get_library_name("x", server=server)) == "未知媒体库"
@@ -0,0 +1,38 @@
+import logging
+import queue
+
+from utils.logger import LazyPayload, LazyQueueHandler
+
+
+def _enqueue(*args, exc_info=None):
+    log_queue = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "msg %s %s", args, exc_info)
+    handler.emit(record)
+    return log_queue.get_nowait()
+
+
+def test_scalar_args_stay_lazy():
+    payload = LazyPayload(b"{}")
+    record = _enqueue("a", payload)
+    assert record.msg == "msg %s %s"
+    assert record.args == ("a", payload)
+
+
+def test_mutable_args_are_snapshotted_before_enqueue():
+    data = {"state": "before"}
+    record = _enqueue(data, [1])
+    data["state"] = "after"
+    assert record.args is None
+    assert record.getMessage() == "msg {'state': 'before'} [1]"
+
+
+def test_exc_info_is_formatted_and_released():
+    try:
+        raise ValueError("boom")
+    except ValueError as error:
+        record = _enqueue(1, 2, exc_info=(type(error), error, error.__traceback__))
+    assert record.exc_info is None
+    assert "ValueError: boom" in record.exc_text
+    formatted = logging.Formatter("%(message)s").format(record)
+    assert formatted.startswith("msg 1 2\n") and "ValueError: boom" in formatted
@@ -0,0 +1,288 @@
+import asyncio
+from collections import defaultdict
+
+import pytest
+
+from utils.dead_letters import DeadLetterStore
+from utils.images import Photo
+from utils.delivery import PERMANENT, THROTTLED, TRANSIENT, DeliveryError
+from utils.digest import DigestPolicy, MODE_OFF
+from utils.journal import MessageJournal
+from utils.message_queue import MessageQueue
+from utils.routing import NotificationRouter, Route
+
+
+class FakeHandler:
+    """
+    记录每个目标收到的说明文字，blocked 中的目标在 release 之前一直阻塞，
+    failures 中的目标按顺序返回预设的错误(None 表示成功)
+    """
+
+    def __init__(self, blocked=(), failures=None, image_size=0):
+        self.sent = defaultdict(list)
+        self.image_size = image_size
+        self.blocked = set(blocked)
+        self.release = asyncio.Event()
+        self.failures = {chat_id: list(errors) for chat_id, errors in (failures or {}).items()}
+
+    async def build_notification(self, webhook):
+        if webhook.Item.Name == "build error":
+            raise ValueError("bad item")
+        photo = Photo(webhook.Item.Id, "", data=b"x" * self.image_size) if self.image_size else None
+        return {"item": webhook.Item, "library": "电影", "caption": webhook.Item.Name, "photo": photo}
+
+    async def send_notifications(self, notifications, chat_id, retry_transient=True):
+        if chat_id in self.blocked:
+            await self.release.wait()
+        errors = self.failures.get(chat_id)
+        error = errors.pop(0) if errors else None
+        if error is not None:
+            return [(notification, error) for notification in notifications]
+        self.sent[chat_id].extend(notification["caption"] for notification in notifications)
+        return []
+
+
+def journal_path(tmp_path) -> str:
+    return str(tmp_path / "journal.db")
+
+
+def journal_entries(tmp_path) -> list:
+    """重新打开日志，返回未确认消息的元数据"""
+    journal = MessageJournal(journal_path(tmp_path))
+    try:
+        return [meta for _, meta, _ in journal.open()]
+    finally:
+        journal.close()
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(handler, destinations=("fast", "slow"), **kwargs):
+        queue = MessageQueue(
+            handler,
+            journal=MessageJournal(journal_path(tmp_path)),
+            router=NotificationRouter([Route(chat_id) for chat_id in destinations]),
+            dead_letters=DeadLetterStore(str(tmp_path / "dead_letters.db")),
+            digest=DigestPolicy(MODE_OFF),
+            **{"batch_window": 0, "batch_size": 1, **kwargs}
+        )
+        queues.append(queue)
+        return queue
+
+    return make
+
+
+async def wait_until(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+async def add_events(queue, make_webhook, names):
+    for name in names:
+        webhook = make_webhook(Name=name)
+        await queue.add_message({"webhook": webhook, "event_type": webhook.Event})
+
+
+def test_full_lane_does_not_block_other_destinations(make_queue, make_webhook):
+    names = [f"event {n}" for n in range(10)]
+
+    async def run():
+        handler = FakeHandler(blocked={"slow"})
+        queue = make_queue(handler, lane_limit=2, render_concurrency=1)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, names)
+            await wait_until(lambda: len(handler.sent["fast"]) == len(names))
+            # slow 的队列已满，后续消息暂存，按顺序等待发送
+            assert queue.depths()["slow"] == len(names) - 1
+            handler.release.set()
+            await wait_until(queue.idle)
+        finally:
+            await queue.stop_processing()
+        return handler
+
+    handler = asyncio.run(run())
+    assert handler.sent["fast"] == names
+    assert handler.sent["slow"] == names
+
+
+def test_dispatch_pauses_when_too_many_messages_are_parked(make_queue, make_webhook):
+    async def run():
+        handler = FakeHandler(blocked={"slow"})
+        queue = make_queue(handler, lane_limit=1, memory_limit=3, render_concurrency=1)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, [f"event {n}" for n in range(10)])
+            await asyncio.sleep(0.2)
+            delivered = len(handler.sent["fast"])
+            handler.release.set()
+            await wait_until(queue.idle)
+        finally:
+            await queue.stop_processing()
+        return delivered, handler
+
+    delivered, handler = asyncio.run(run())
+    # 1 条发送中 + 1 条在队列中 + 3 条暂存
+    assert delivered == 5
+    assert len(handler.sent["slow"]) == 10
+
+
+def test_dispatch_pauses_when_built_notifications_hold_too_many_image_bytes(make_queue, make_webhook):
+    async def run():
+        handler = FakeHandler(blocked={"slow"}, image_size=1000)
+        queue = make_queue(handler, image_bytes_limit=3500, render_concurrency=1)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, [f"event {n}" for n in range(10)])
+            await asyncio.sleep(0.2)
+            delivered, held = len(handler.sent["fast"]), queue.image_bytes()
+            handler.release.set()
+            await wait_until(queue.idle)
+            return delivered, held, queue.image_bytes(), handler
+        finally:
+            await queue.stop_processing()
+
+    delivered, held, released, handler = asyncio.run(run())
+    # slow 未发送完的消息仍持有图片数据，分发 4 条后达到上限
+    assert delivered == 4 and held == 4000
+    assert released == 0
+    assert len(handler.sent["slow"]) == 10
+
+
+def test_build_error_is_dead_lettered_without_stopping_dispatch(make_queue, make_webhook):
+    async def run():
+        handler = FakeHandler()
+        queue = make_queue(handler)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, ["before", "build error", "after"])
+            await wait_until(lambda: len(handler.sent["slow"]) == 2)
+            return handler, queue.dead_letters.list()
+        finally:
+            await queue.stop_processing()
+
+    handler, dead_letters = asyncio.run(run())
+    assert handler.sent["fast"] == ["before", "after"]
+    assert [(entry["destination"], entry["kind"], entry["error"]) for entry in dead_letters] == \
+        [("", "permanent", "bad item")]
+
+
+def test_routing_error_is_dead_lettered(make_queue, make_webhook):
+    class BrokenRouter(NotificationRouter):
+        def destinations(self, item, library):
+            if item.Name == "route error":
+                raise KeyError("library")
+            return super().destinations(item, library)
+
+    async def run():
+        handler = FakeHandler()
+        queue = make_queue(handler)
+        queue.router = BrokenRouter(queue.router.routes)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, ["route error", "after"])
+            await wait_until(lambda: len(handler.sent["slow"]) == 1)
+            return handler, queue.dead_letters.list()
+        finally:
+            await queue.stop_processing()
+
+    handler, dead_letters = asyncio.run(run())
+    assert handler.sent["fast"] == ["after"]
+    assert len(dead_letters) == 1
+
+
+def test_transient_failure_is_retried_only_on_the_failed_destination(make_queue, make_webhook, tmp_path):
+    async def run():
+        handler = FakeHandler(failures={"slow": [DeliveryError(TRANSIENT, "Bad Gateway", 502)]})
+        queue = make_queue(handler, retry_base_delay=0.01)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, ["event"])
+            await wait_until(lambda: handler.sent["slow"])
+            await wait_until(lambda: queue.idle() and not queue.pending_retries)
+        finally:
+            await queue.stop_processing()
+        return handler, queue
+
+    handler, queue = asyncio.run(run())
+    assert handler.sent == {"fast": ["event"], "slow": ["event"]}
+    assert queue.failure_stats[TRANSIENT] == 1 and queue.failure_stats["retried"] == 1
+    assert journal_entries(tmp_path) == []
+
+
+def test_permanent_failure_is_dead_lettered_for_that_destination(make_queue, make_webhook):
+    async def run():
+        handler = FakeHandler(failures={"slow": [DeliveryError(PERMANENT, "chat not found", 400)]})
+        queue = make_queue(handler)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, ["event"])
+            await wait_until(lambda: queue.dead_letters.size == 1)
+            return handler, queue.dead_letters.list()
+        finally:
+            await queue.stop_processing()
+
+    handler, dead_letters = asyncio.run(run())
+    assert handler.sent == {"fast": ["event"]}
+    assert [(entry["destination"], entry["kind"]) for entry in dead_letters] == [("slow", PERMANENT)]
+
+
+def test_pending_retry_survives_stop_for_its_destination_only(make_queue, make_webhook, tmp_path):
+    async def run():
+        handler = FakeHandler(failures={"slow": [DeliveryError(THROTTLED, "Too Many Requests", 429, 60)]})
+        queue = make_queue(handler)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, ["event"])
+            await wait_until(lambda: handler.sent["fast"] and queue.pending_retries)
+        finally:
+            await queue.stop_processing()
+
+    asyncio.run(run())
+    entries = journal_entries(tmp_path)
+    assert [(meta["destination"], meta["retry"]) for meta in entries] == [("slow", 1)]
+
+
+def test_undelivered_lane_messages_are_journaled_per_destination_on_stop(make_queue, make_webhook, tmp_path):
+    async def run():
+        handler = FakeHandler(blocked={"slow"})
+        queue = make_queue(handler)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, ["first", "second"])
+            await wait_until(lambda: len(handler.sent["fast"]) == 2)
+        finally:
+            await queue.stop_processing()
+
+    asyncio.run(run())
+    entries = journal_entries(tmp_path)
+    assert [meta.get("destination") for meta in entries] == ["slow", "slow"]
+
+
+def test_replayed_retry_is_sent_to_its_destination_only(make_queue, make_webhook, tmp_path):
+    async def run():
+        handler = FakeHandler(failures={"slow": [DeliveryError(THROTTLED, "Too Many Requests", 429, 60)]})
+        queue = make_queue(handler)
+        await queue.start_processing()
+        try:
+            await add_events(queue, make_webhook, ["event"])
+            await wait_until(lambda: handler.sent["fast"] and queue.pending_retries)
+        finally:
+            await queue.stop_processing()
+
+        restarted = FakeHandler()
+        queue = make_queue(restarted)
+        await queue.start_processing()
+        try:
+            await wait_until(lambda: restarted.sent["slow"])
+            await wait_until(queue.idle)
+        finally:
+            await queue.stop_processing()
+        return restarted
+
+    assert asyncio.run(run()).sent == {"slow": ["event"]}
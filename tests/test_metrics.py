@@ -0,0 +1,21 @@
+import emby_webhook
+from utils.metrics import metrics
+
+
+def test_image_bytes_are_exported_separately_from_event_counts(monkeypatch):
+    stats = emby_webhook.webhook_handler.images.stats
+    monkeypatch.setattr(emby_webhook.webhook_handler.images, "stats", type(stats)(int, {
+        "downloads": 2, "download_bytes": 4096, "uploads": 1, "upload_bytes": 2048, "file_id_hits": 3,
+    }))
+    lines = metrics.render().splitlines()
+    events = sorted(line for line in lines if line.startswith("notification_image_events_total{"))
+    image_bytes = sorted(line for line in lines if line.startswith("notification_image_bytes_total{"))
+    assert events == [
+        'notification_image_events_total{event="downloads"} 2',
+        'notification_image_events_total{event="file_id_hits"} 3',
+        'notification_image_events_total{event="uploads"} 1',
+    ]
+    assert image_bytes == [
+        'notification_image_bytes_total{direction="download"} 4096',
+        'notification_image_bytes_total{direction="upload"} 2048',
+    ]
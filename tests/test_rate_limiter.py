@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import TelegramRateLimiter, TokenBucket
+
+
+def test_bucket_allows_burst_then_refills_at_rate():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    for _ in range(3):
+        assert bucket.delay(now) == 0
+        bucket.consume(now)
+    assert bucket.delay(now) == pytest.approx(0.5)
+    # 0.25 秒补充半个令牌，还需要 0.25 秒
+    assert bucket.delay(now + 0.25) == pytest.approx(0.25)
+    assert bucket.delay(now + 0.5) == 0
+    # 补充不超过容量
+    bucket._refill(now + 100)
+    assert bucket.tokens == 3
+
+
+def test_block_empties_bucket_until_deadline():
+    bucket = TokenBucket(rate=1, capacity=5)
+    now = bucket.updated
+    bucket.block(now, 10)
+    assert bucket.delay(now + 4) == pytest.approx(6)
+    # 解除后从空桶开始补充，不会立即突发
+    assert bucket.delay(now + 10) == pytest.approx(1)
+    assert bucket.delay(now + 11) == 0
+
+
+def test_group_and_private_chats_use_separate_limits():
+    limiter = TelegramRateLimiter(private_rate=1, private_burst=1, group_rate=1 / 60, group_burst=3)
+    assert limiter._bucket(-1001).capacity == 3
+    assert limiter._bucket(-1001).rate == pytest.approx(1 / 60)
+    assert limiter._bucket(42).capacity == 1
+    assert limiter._bucket("-1001") is limiter._bucket(-1001)
+
+
+def test_retry_after_halves_rate_and_success_recovers():
+    limiter = TelegramRateLimiter(group_rate=1, group_burst=1, min_rate_factor=0.3, recovery_factor=2)
+    limiter.on_retry_after(-1, 5)
+    bucket = limiter._bucket(-1)
+    assert bucket.rate == pytest.approx(0.5)
+    assert limiter.next_available_in(-1) > 4
+    limiter.on_retry_after(-1, 5)
+    # 不低于 base_rate * min_rate_factor
+    assert bucket.rate == pytest.approx(0.3)
+    limiter.on_success(-1)
+    limiter.on_success(-1)
+    assert bucket.rate == pytest.approx(1)
+
+
+def test_global_retry_after_blocks_every_chat():
+    limiter = TelegramRateLimiter()
+    limiter.on_retry_after(-1, 3, global_scope=True)
+    assert limiter.next_available_in(-2) > 2
+    assert limiter.next_available_in() > 2
+
+
+def test_acquire_sleeps_exactly_until_next_token(monkeypatch):
+    clock = [1000.0]
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", fake_sleep)
+    limiter = TelegramRateLimiter(global_rate=100, global_burst=100, private_rate=2, private_burst=1)
+
+    async def send_three():
+        return [await limiter.acquire(42) for _ in range(3)]
+
+    waited = asyncio.run(send_three())
+    assert waited == [0, pytest.approx(0.5), pytest.approx(0.5)]
+    assert sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from utils.routing import NotificationRouter, Route
+
+
+@pytest.fixture
+def movie(make_webhook):
+    return make_webhook(Type="Movie", Genres=["Action", "科幻"], TagItems=[{"Name": "4K", "Id": 1}]).Item
+
+
+def test_route_without_conditions_matches_everything(movie):
+    assert Route("-1001").matches(movie, "")
+
+
+@pytest.mark.parametrize("conditions,expected", [
+    ({"libraries": ["电影"]}, True),
+    ({"libraries": ["电视剧"]}, False),
+    ({"types": ["movie"]}, True),
+    ({"types": ["Episode"]}, False),
+    ({"genres": ["action"]}, True),
+    ({"genres": ["恐怖", "科幻"]}, True),
+    ({"genres": ["恐怖"]}, False),
+    ({"tags": ["4k"]}, True),
+    ({"tags": ["HDR"]}, False),
+    # 不同条件之间为"且"
+    ({"libraries": ["电影"], "genres": ["Action"], "tags": ["4K"], "types": ["Movie"]}, True),
+    ({"libraries": ["电影"], "tags": ["HDR"]}, False),
+])
+def test_route_conditions(movie, conditions, expected):
+    assert Route("-1001", **conditions).matches(movie, "电影") is expected
+
+
+def test_missing_library_does_not_match_library_route(movie):
+    assert not Route("-1001", libraries=["电影"]).matches(movie, None)
+
+
+def test_destinations_are_deduplicated_in_route_order(movie):
+    router = NotificationRouter.from_config(json.dumps([
+        {"chat_id": "-1003", "tags": ["4K"]},
+        {"chat_id": -1001},
+        {"chat_id": "-1002", "libraries": ["电视剧"]},
+        {"chat_id": "-1003", "libraries": ["电影"]},
+    ]), "-1009")
+    assert router.destinations(movie, "电影") == ["-1003", "-1001"]
+    assert router.destinations(None, "电影") == []
+
+
+@pytest.mark.parametrize("config", [None, "", "   ", "not json", [{"libraries": ["电影"]}, "x"]])
+def test_invalid_or_empty_config_falls_back_to_default_chat(movie, config):
+    router = NotificationRouter.from_config(config, "-1009")
+    assert router.destinations(movie, "电影") == ["-1009"]
+
+
+def test_no_routes_and_no_default_chat(movie):
+    assert NotificationRouter.from_config(None, None).destinations(movie, "电影") == []
@@ -0,0 +1,124 @@
+import html
+import re
+
+import pytest
+
+from utils.templates import (CAPTION_LIMIT, ELLIPSIS, MESSAGE_LIMIT, CompiledTemplate, TemplateEngine,
+                             visible_length)
+
+VALUES = {
+    "event": "library.new",
+    "name": "Tom & Jerry <1080p>",
+    "library": "电影",
+    "premiere_date": "2018-12-27 00:00:00",
+    "date_created": "2025-07-05 22:01:49",
+    "resolution": "1920x1080",
+    "runtime": "02:08:26",
+    "size": "5.55 GB",
+    "container": "MKV",
+    "overview": "简介",
+    "studios": "#Studio",
+    "tags": "#a #b",
+}
+
+
+def telegram_length(text: str) -> int:
+    """Telegram 计算长度时去掉标签并解析实体"""
+    return visible_length(html.unescape(re.sub(r'<[^>]+>', '', text)))
+
+
+def assert_balanced(text: str) -> None:
+    stack = []
+    for closing, tag in re.findall(r'<(/?)([a-z]+)[^>]*>', text):
+        if closing:
+            assert stack and stack.pop() == tag, text
+        else:
+            stack.append(tag)
+    assert not stack, text
+
+
+def test_fields_are_escaped_and_markup_is_kept():
+    caption = TemplateEngine().render("library.new", VALUES)
+    assert "📝 <b>标题:</b> Tom &amp; Jerry &lt;1080p&gt;\n" in caption
+    assert caption.startswith("🎬 <b>新片入库</b>\n\n")
+    assert caption.endswith("\n🏷 <b>标签:</b> #a #b")
+
+
+def test_optional_blocks_are_omitted_when_fields_are_empty():
+    caption = TemplateEngine().render("library.new", {**VALUES, "overview": "", "studios": "", "tags": None})
+    assert "简介" not in caption and "制作公司" not in caption and "标签" not in caption
+    assert caption.endswith("🎞️ <b>类  型:</b> MKV")
+
+
+def test_literal_braces_and_non_string_values():
+    template = CompiledTemplate("{{x}} {n} [[<i>{missing}</i>]]")
+    assert template.render({"n": 3}) == "{x} 3 "
+
+
+def test_separator_inside_a_value_does_not_shift_fields():
+    template = CompiledTemplate("<b>{a}</b>|{b}")
+    assert template.render({"a": "x\x00y", "b": "<z>"}) == "<b>x\x00y</b>|&lt;z&gt;"
+
+
+def test_unknown_event_uses_default_template():
+    caption = TemplateEngine().render("item.rate", {"event": "item.rate", "name": "A", "overview": ""})
+    assert caption == "🔔 <b>item.rate</b>\n\n📝 <b>标题:</b> A"
+
+
+def test_long_overview_is_truncated_first():
+    values = {**VALUES, "overview": "很长的简介 & <剧情> " * 300}
+    caption = TemplateEngine().render("library.new", values, CAPTION_LIMIT)
+    assert telegram_length(caption) <= CAPTION_LIMIT
+    # 其他字段完整保留，简介以省略号结尾
+    assert "🏷 <b>标签:</b> #a #b" in caption
+    assert ELLIPSIS + "\n" in caption
+    assert_balanced(caption)
+
+
+def test_astral_characters_count_as_two_units():
+    # 每个 emoji 占两个 UTF-16 代码单元，按字符数计算会超出限制
+    values = {**VALUES, "overview": "😀" * 600}
+    caption = TemplateEngine().render("library.new", values, CAPTION_LIMIT)
+    assert telegram_length(caption) <= CAPTION_LIMIT
+    assert len(caption) < CAPTION_LIMIT
+
+
+def test_caption_just_under_limit_is_not_truncated():
+    template = CompiledTemplate("<b>{name}</b>")
+    text = "字" * CAPTION_LIMIT
+    assert template.render({"name": text}) == f"<b>{text}</b>"
+    assert ELLIPSIS in template.render({"name": text + "字"})
+
+
+@pytest.mark.parametrize("limit", [10, 50, 200])
+def test_whole_caption_is_cut_and_open_tags_are_closed(limit):
+    template = CompiledTemplate('<b>{name}</b> <a href="https://x">{url}</a><i>{overview}</i>')
+    values = {"name": "名" * 100, "url": "链接" * 50, "overview": ""}
+    caption = template.render(values, limit)
+    assert telegram_length(caption) <= limit
+    assert ELLIPSIS in caption
+    assert_balanced(caption)
+
+
+def test_truncation_after_overview_cut_still_closes_tags():
+    template = CompiledTemplate("<b>{name}</b>[[<i>{overview}</i>]]")
+    caption = template.render({"name": "n" * 80, "overview": "o" * 80}, 40)
+    assert telegram_length(caption) <= 40
+    assert_balanced(caption)
+
+
+def test_digest_truncates_the_title_list():
+    titles = "\n".join(f"• S01E{n:02d} 第 {n} 集" for n in range(1, 400))
+    caption = TemplateEngine().render("digest", {
+        "title": "剧集", "library": "电视剧", "counts": "399 集", "size": "1 TB", "runtime": "300:00:00",
+        "titles": titles,
+    }, MESSAGE_LIMIT)
+    assert telegram_length(caption) <= MESSAGE_LIMIT
+    assert "🔢 <b>数  量:</b> 399 集" in caption
+    assert caption.endswith(ELLIPSIS)
+
+
+def test_template_dir_overrides_defaults(tmp_path):
+    (tmp_path / "library.new.html").write_text("<b>{name}</b> @ {library}", encoding="utf-8")
+    engine = TemplateEngine(str(tmp_path))
+    assert engine.render("library.new", VALUES) == "<b>Tom &amp; Jerry &lt;1080p&gt;</b> @ 电影"
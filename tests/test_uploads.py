@@ -0,0 +1,77 @@
+import asyncio
+
+from benchmarks.fakes import FakeTelegramServer
+from handlers.webhook_handler import WebhookHandler
+from utils.http_client import HttpClientPool
+from utils.images import Photo
+
+DESTINATIONS = ["-1001", "-1002", "-1003", "-1004", "-1005"]
+
+
+def notification(key: str, caption: str = "caption") -> dict:
+    return {"photo": Photo(key, f"http://emby.test/{key}", data=b"x" * 4096), "caption": caption}
+
+
+async def send_everywhere(notifications, latency=0.05):
+    """并发发往所有目标，notifications 为可调用对象时每个目标各自构建通知"""
+    telegram = FakeTelegramServer(latency=latency)
+    http = HttpClientPool()
+    try:
+        handler = WebhookHandler(http)
+        handler.telegram_api_url = f"{await telegram.start()}/bottest"
+        results = await asyncio.gather(*(
+            handler.send_notifications(notifications() if callable(notifications) else notifications, chat_id)
+            for chat_id in DESTINATIONS
+        ))
+        return telegram, handler, results
+    finally:
+        await http.close()
+        await telegram.stop()
+
+
+def test_single_photo_is_uploaded_once_for_all_destinations():
+    telegram, handler, results = asyncio.run(send_everywhere([notification("s:1:tag")]))
+    assert results == [[]] * len(DESTINATIONS)
+    assert telegram.uploads == 1
+    assert telegram.calls["sendPhoto"] == len(DESTINATIONS)
+    assert set(telegram.chat_deliveries) == set(DESTINATIONS)
+    assert handler.images.stats["uploads"] == 1
+
+
+def test_media_group_uploads_each_image_once():
+    notifications = [notification(f"s:{n}:tag", f"caption {n}") for n in range(3)]
+    telegram, handler, results = asyncio.run(send_everywhere(notifications))
+    assert results == [[]] * len(DESTINATIONS)
+    assert telegram.uploads == len(notifications)
+    assert telegram.chat_deliveries == {chat_id: len(notifications) for chat_id in DESTINATIONS}
+
+
+def test_separate_photo_objects_share_the_upload():
+    # 同一图片在不同通知中是不同的 Photo 对象
+    telegram, _, _ = asyncio.run(send_everywhere(lambda: [notification("s:1:tag")]))
+    assert telegram.uploads == 1
+
+
+def test_failed_upload_is_retried_by_the_next_destination():
+    async def run():
+        telegram = FakeTelegramServer(latency=0.05, missing_chats=[DESTINATIONS[0]])
+        http = HttpClientPool()
+        try:
+            handler = WebhookHandler(http)
+            handler.telegram_api_url = f"{await telegram.start()}/bottest"
+            shared = [notification("s:1:tag")]
+            first = asyncio.create_task(handler.send_notifications(shared, DESTINATIONS[0]))
+            await asyncio.sleep(0)
+            rest = await asyncio.gather(*(
+                handler.send_notifications(shared, chat_id) for chat_id in DESTINATIONS[1:]
+            ))
+            return telegram, await first, rest, handler
+        finally:
+            await http.close()
+            await telegram.stop()
+
+    telegram, first, rest, handler = asyncio.run(run())
+    assert len(first) == 1 and first[0][1].status == 400
+    assert rest == [[]] * (len(DESTINATIONS) - 1)
+    assert telegram.uploads == 2
+    assert not handler._uploads
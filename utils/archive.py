@@ -0,0 +1,330 @@
+import gzip
+import heapq
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+
+class NotificationArchive:
+    """
+    通知归档写入器
+
+    webhook 只把原始请求体放入有界缓冲区，由后台线程批量写入按大小/时间滚动的 JSONL 分段文件
+    (可选 gzip 压缩)。缓冲区满时丢弃新记录并计数，请求处理永远不会等待磁盘 I/O。
+
+    每行格式: {"received_at": "...", "event": "...", "payload": <原始 JSON>}
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        compress: bool = True,
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        segment_max_age: float = 3600,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        segment_prefix: str = "notifications"
+    ):
+        self.directory = directory
+        self.compress = compress
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.flush_interval = flush_interval
+        # 多个进程写入同一目录时使用不同的前缀，避免分段文件重名
+        self.segment_prefix = segment_prefix
+        self.stats = {'written': 0, 'dropped': 0, 'segments': 0, 'flushes': 0}
+
+        self._pending: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._file = None
+        self._segment_bytes = 0
+        self._segment_opened_at = 0.0
+        self._last_drop_warning = 0.0
+
+    def start(self) -> None:
+        """启动后台写入线程"""
+        if self._thread:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._writer_loop, name="notification-archive", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """写入剩余记录并关闭当前分段"""
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, event_type: str, payload: bytes) -> bool:
+        """提交一条待归档的通知，缓冲区已满时返回 False"""
+        try:
+            self._pending.put_nowait((time.time(), event_type, payload))
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            now = time.monotonic()
+            if now - self._last_drop_warning > 10:
+                self._last_drop_warning = now
+                logger.warning(f"通知归档缓冲区已满，已丢弃 {self.stats['dropped']} 条记录")
+            return False
+
+    @property
+    def pending(self) -> int:
+        return self._pending.qsize()
+
+    def _writer_loop(self):
+        """后台线程：每个 flush_interval 最多写入并刷新一次"""
+        while True:
+            try:
+                first = self._pending.get(timeout=self.flush_interval)
+            except queue.Empty:
+                first = None
+
+            batch = []
+            if first:
+                # 等待一个刷新间隔，将这段时间内到达的记录合并为一次写入
+                self._stopping.wait(self.flush_interval)
+                batch.append(first)
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError as e:
+                    logger.error(f"写入通知归档失败: {str(e)}")
+            elif self._file and time.monotonic() - self._segment_opened_at >= self.segment_max_age:
+                self._close_segment()
+
+            if self._stopping.is_set() and self._pending.empty():
+                self._close_segment()
+                return
+
+    def _write_batch(self, batch):
+        lines = []
+        for received_at, event_type, payload in batch:
+            # JSON 字符串内不会出现原始换行符，直接替换为空格即可压成一行，无需重新解析
+            compact = payload.replace(b'\r', b' ').replace(b'\n', b' ')
+            received = datetime.fromtimestamp(received_at).isoformat()
+            lines.append(
+                b'{"received_at": "' + received.encode() + b'", "event": ' +
+                json.dumps(event_type).encode() + b', "payload": ' + compact + b'}\n'
+            )
+        data = b''.join(lines)
+
+        if self._file and (
+            self._segment_bytes >= self.segment_max_bytes
+            or time.monotonic() - self._segment_opened_at >= self.segment_max_age
+        ):
+            self._close_segment()
+        if not self._file:
+            self._open_segment()
+
+        self._file.write(data)
+        self._file.flush()
+        self._segment_bytes += len(data)
+        self.stats['written'] += len(batch)
+        self.stats['flushes'] += 1
+
+    def _open_segment(self):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        path = os.path.join(self.directory, f"{self.segment_prefix}_{timestamp}{suffix}")
+        self._file = gzip.open(path, 'ab') if self.compress else open(path, 'ab')
+        self._segment_bytes = 0
+        self._segment_opened_at = time.monotonic()
+        self.stats['segments'] += 1
+
+    def _close_segment(self):
+        if self._file:
+            try:
+                self._file.close()
+            except OSError as e:
+                logger.error(f"关闭通知归档文件失败: {str(e)}")
+            self._file = None
+
+
+class ArchiveRecord(NamedTuple):
+    """归档中的一条通知"""
+    received_at: float
+    event: str
+    payload: bytes
+    source: str
+
+
+# 分段中一行的固定前缀，按位置切出 payload，不需要解析整条记录
+_LINE_HEAD = b'{"received_at": "'
+_PAYLOAD_KEY = b', "payload": '
+
+
+def _parse_line(line: bytes) -> Tuple[float, str, bytes]:
+    """解析分段中的一行，返回 (接收时间戳, 事件类型, 原始 payload)"""
+    line = line.rstrip()
+    if line.startswith(_LINE_HEAD) and line.endswith(b'}'):
+        end = line.find(b'"', len(_LINE_HEAD))
+        split = line.find(_PAYLOAD_KEY, end)
+        if end > 0 and split > 0:
+            received = datetime.fromisoformat(line[len(_LINE_HEAD):end].decode()).timestamp()
+            event = json.loads(line[line.index(b':', end) + 1:split])
+            return received, event, line[split + len(_PAYLOAD_KEY):-1]
+    # 手工编辑过的行等非标准格式按普通 JSON 解析
+    record = json.loads(line)
+    payload = json.dumps(record['payload'], ensure_ascii=False).encode('utf-8')
+    return datetime.fromisoformat(record['received_at']).timestamp(), record.get('event', ''), payload
+
+
+class _Source:
+    """一个归档文件: JSONL 分段(可能压缩)，或旧版本每个事件一个的 JSON 文件"""
+
+    __slots__ = ('started_at', 'path', 'event', 'legacy')
+
+    def __init__(self, started_at: float, path: str, event: str = '', legacy: bool = False):
+        self.started_at = started_at
+        self.path = path
+        self.event = event
+        self.legacy = legacy
+
+
+class ArchiveReader:
+    """
+    通知归档读取器，按接收时间顺序流式读取 NotificationArchive 写入的分段，
+    以及旧版本 save_notification 写入的 {事件}_{YYYYmmdd_HHMMSS}.json 文件
+
+    每个分段内部已按时间排序，多个进程(或多次重启)的分段按多路归并输出。
+    分段按文件名中的创建时间排序，只有归并进度接近其创建时间时才打开，
+    同时打开的文件数只取决于时间上重叠的分段数，不随归档总量增长。
+    写入线程批量写入，分段中的记录最多早于文件名时间 slack 秒，超出的记录会稍晚输出。
+    """
+
+    def __init__(self, directory: str, events: Optional[Iterable[str]] = None,
+                 since: Optional[float] = None, until: Optional[float] = None, slack: float = 60):
+        self.directory = directory
+        self.events = frozenset(events) if events else None
+        self.since = since
+        self.until = until
+        self.slack = slack
+        self.stats = {'files': 0, 'records': 0, 'skipped': 0, 'errors': 0}
+
+    def sources(self) -> List[_Source]:
+        """归档目录中的文件，按创建时间排序"""
+        sources = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                source = self._source(entry.name)
+                if source is None:
+                    continue
+                if self.until is not None and source.started_at - self.slack > self.until:
+                    continue
+                if source.legacy and not self._wanted(source.started_at, source.event):
+                    continue
+                sources.append(source)
+        sources.sort(key=lambda source: (source.started_at, source.path))
+        return sources
+
+    def _source(self, name: str) -> Optional[_Source]:
+        path = os.path.join(self.directory, name)
+        try:
+            if name.endswith(('.jsonl', '.jsonl.gz')):
+                stem = name[:name.index('.jsonl')]
+                _, date, clock, micro = stem.rsplit('_', 3)
+                started = datetime.strptime(f"{date}_{clock}_{micro}", "%Y%m%d_%H%M%S_%f")
+                return _Source(started.timestamp(), path)
+            if name.endswith('.json'):
+                event, date, clock = name[:-len('.json')].rsplit('_', 2)
+                started = datetime.strptime(f"{date}_{clock}", "%Y%m%d_%H%M%S")
+                return _Source(started.timestamp(), path, event, legacy=True)
+        except ValueError:
+            pass
+        return None
+
+    def _wanted(self, received_at: float, event: str) -> bool:
+        if self.events is not None and event not in self.events:
+            return False
+        if self.since is not None and received_at < self.since:
+            return False
+        return self.until is None or received_at <= self.until
+
+    def _records(self, source: _Source) -> Iterator[ArchiveRecord]:
+        """读取一个文件中符合条件的记录，损坏或写入中被截断的部分记录错误后跳过"""
+        self.stats['files'] += 1
+        if source.legacy:
+            try:
+                with open(source.path, 'rb') as f:
+                    payload = f.read()
+            except OSError as e:
+                self.stats['errors'] += 1
+                logger.error(f"读取归档文件 {source.path} 失败: {str(e)}")
+                return
+            self.stats['records'] += 1
+            yield ArchiveRecord(source.started_at, source.event, payload, source.path)
+            return
+
+        opener = gzip.open if source.path.endswith('.gz') else open
+        try:
+            with opener(source.path, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        received_at, event, payload = _parse_line(line)
+                    except (ValueError, KeyError, TypeError) as e:
+                        self.stats['errors'] += 1
+                        logger.warning(f"跳过归档文件 {source.path} 中无法解析的记录: {str(e)}")
+                        continue
+                    if not self._wanted(received_at, event):
+                        self.stats['skipped'] += 1
+                        continue
+                    self.stats['records'] += 1
+                    yield ArchiveRecord(received_at, event, payload, source.path)
+        except (OSError, EOFError, zlib.error) as e:
+            # 服务仍在写入的分段末尾可能不完整
+            self.stats['errors'] += 1
+            logger.warning(f"归档文件 {source.path} 读取中断: {str(e)}")
+
+    def __iter__(self) -> Iterator[ArchiveRecord]:
+        pending = self.sources()
+        pending.reverse()
+        # (接收时间, 打开顺序, 记录, 迭代器)，打开顺序保证时间相同时按文件顺序输出
+        heap = []
+        opened = 0
+
+        def open_next():
+            nonlocal opened
+            records = self._records(pending.pop())
+            record = next(records, None)
+            if record is not None:
+                heapq.heappush(heap, (record.received_at, opened, record, records))
+            opened += 1
+
+        while heap or pending:
+            if not heap:
+                open_next()
+                continue
+            # 创建时间接近当前最早记录的分段可能包含更早的记录，先打开再输出
+            while pending and pending[-1].started_at - self.slack <= heap[0][0]:
+                open_next()
+            _, order, record, records = heap[0]
+            following = next(records, None)
+            if following is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (following.received_at, order, following, records))
+            yield record
@@ -0,0 +1,117 @@
+"""
+死信存储
+
+重试耗尽或永久失败的消息连同原始 webhook 内容保存在 SQLite 中，
+可以通过管理接口查看，并在问题修复后批量重新投递(redrive)。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+
+class DeadLetterStore:
+    """死信存储，所有方法都是阻塞调用，在事件循环中应通过 asyncio.to_thread 调用"""
+
+    def __init__(self, db_file: Optional[str]):
+        self.db_file = db_file
+        self.size = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        if not self.db_file or self._conn:
+            return
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "destination TEXT NOT NULL, "
+            "kind TEXT NOT NULL, "
+            "error TEXT, "
+            "attempts INTEGER NOT NULL, "
+            "failed_at REAL NOT NULL, "
+            "meta TEXT NOT NULL, "
+            "payload BLOB)"
+        )
+        self.size = self._conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        if self.size:
+            logger.warning(f"死信存储中有 {self.size} 条未处理的消息")
+
+    def add(self, destination: str, kind: str, error: str, attempts: int,
+            meta: Dict[Any, Any], payload: Optional[bytes]) -> None:
+        with self._lock:
+            if not self._conn:
+                logger.error(f"死信存储未启用，丢弃发往 {destination} 的消息: {error}")
+                return
+            try:
+                self._conn.execute(
+                    "INSERT INTO dead_letters (destination, kind, error, attempts, failed_at, meta, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (str(destination), kind, error, attempts, time.time(),
+                     json.dumps(meta, ensure_ascii=False), payload)
+                )
+                self._conn.commit()
+                self.size += 1
+            except sqlite3.Error as e:
+                logger.error(f"写入死信存储失败: {str(e)}")
+
+    def list(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """按失败时间列出死信(不含 payload)"""
+        with self._lock:
+            if not self._conn:
+                return []
+            rows = self._conn.execute(
+                "SELECT id, destination, kind, error, attempts, failed_at, meta FROM dead_letters "
+                "ORDER BY id LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [
+            {"id": row[0], "destination": row[1], "kind": row[2], "error": row[3],
+             "attempts": row[4], "failed_at": row[5], "meta": json.loads(row[6])}
+            for row in rows
+        ]
+
+    def take(self, ids: Optional[Sequence[int]] = None,
+             limit: Optional[int] = None) -> List[Tuple[str, Dict[Any, Any], Optional[bytes]]]:
+        """
+        取出并删除死信，返回 [(destination, meta, payload)]
+
+        ids 为 None 时按顺序取出全部(或前 limit 条)；指定 ids 时只取出其中的死信，同样最多 limit 条，空列表不取出任何死信
+        """
+        with self._lock:
+            if not self._conn:
+                return []
+            if ids is not None:
+                ids = list(ids)
+                if not ids:
+                    return []
+                rows = self._conn.execute(
+                    f"SELECT id, destination, meta, payload FROM dead_letters "
+                    f"WHERE id IN ({','.join('?' * len(ids))}) ORDER BY id LIMIT ?",
+                    ids + [-1 if limit is None else limit]
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT id, destination, meta, payload FROM dead_letters ORDER BY id LIMIT ?",
+                    (-1 if limit is None else limit,)
+                ).fetchall()
+            self._conn.executemany("DELETE FROM dead_letters WHERE id = ?", [(row[0],) for row in rows])
+            self._conn.commit()
+            self.size -= len(rows)
+        return [(destination, json.loads(meta), payload) for _, destination, meta, payload in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
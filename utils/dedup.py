@@ -0,0 +1,180 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+# 文件名末尾的版本后缀，例如 MOND-158-C、ABC-123_UC、ABC-123-cd1、ABC-123.2160p
+_VARIANT_SUFFIX = re.compile(
+    r'[-_. ](c|uc|u|ch|leak|hack|4k|uhd|hd|cd\d+|part\d+|disc\d+|\d{3,4}p)$',
+    re.IGNORECASE
+)
+# 番号式的作品编号(ABC-123、FC2-PPV-1234567)，只有这种主干后面的后缀才是版本标记，
+# "Plan C"、"Movie 4K" 中的后缀是标题的一部分
+_CODE_STEM = re.compile(r'^(?:[A-Za-z0-9]+-)*[A-Za-z]{2,}[-_]?\d{2,}$')
+_EXTENSION = re.compile(r'\.[A-Za-z0-9]{2,4}$')
+_SEPARATORS = re.compile(r'[\s._]+')
+
+
+def title_stem(name: Optional[str]) -> str:
+    """去掉扩展名，以及番号后面的版本后缀"""
+    if not name:
+        return ""
+    title = _EXTENSION.sub('', name.strip())
+    while True:
+        match = _VARIANT_SUFFIX.search(title)
+        if not match or not _CODE_STEM.match(title[:match.start()]):
+            return title
+        title = title[:match.start()]
+
+
+def normalize_title(name: Optional[str]) -> str:
+    """将文件名或标题规范化，使同一作品的不同版本得到相同结果"""
+    return _SEPARATORS.sub(' ', title_stem(name)).strip().lower()
+
+
+class DuplicateFilter:
+    """
+    重复事件抑制索引
+
+    按配置的策略为每个事件生成若干个键(item_id / title / path: 所在文件夹 + 规范化文件名)，任一键在时间窗口内出现过即视为重复。
+    键保存在有界 LRU 中，并定期批量写入 SQLite，重启后继续生效。
+    """
+
+    STRATEGIES = ('item_id', 'title', 'path')
+
+    def __init__(self, db_file: Optional[str], window: float = 86400, max_entries: int = 100000,
+                 strategies: Iterable[str] = ('item_id', 'title')):
+        self.db_file = db_file
+        self.window = window
+        self.max_entries = max_entries
+        self.strategies = [s for s in strategies if s in self.STRATEGIES]
+        self.suppressed = 0
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._pending: List[Tuple[str, float]] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def keys_for(self, webhook) -> List[str]:
+        """根据策略生成事件的去重键"""
+        item = webhook.Item
+        if item is None:
+            return []
+        server_id = webhook.Server.Id if webhook.Server else item.ServerId
+        keys = []
+        for strategy in self.strategies:
+            if strategy == 'item_id' and item.Id:
+                keys.append(f"item:{server_id}:{item.Id}")
+            elif strategy == 'title':
+                stem = title_stem(item.FileName) or title_stem(item.Name)
+                title = normalize_title(stem)
+                if title:
+                    keys.append(f"title:{server_id}:{item.Type}:{self._title_scope(item, stem)}:{title}")
+            elif strategy == 'path' and item.Path:
+                # 同一文件夹中同一文件(或其版本)重复入库时视为重复，同一季的其他剧集、合集中的其他影片不受影响
+                directory, _, basename = item.Path.replace('\\', '/').rpartition('/')
+                name = normalize_title(basename)
+                if name:
+                    keys.append(f"path:{server_id}:{directory}:{name}")
+        return keys
+
+    @staticmethod
+    def _title_scope(item, stem: str) -> str:
+        """
+        标题键的作用范围: 番号在整个服务器内唯一，不同文件夹中的版本也视为重复；
+        其他标题(如剧集的 01.mkv)只在同一父文件夹内比较
+        """
+        if item.Type != 'Episode' and _CODE_STEM.match(stem):
+            return ''
+        return item.ParentId or item.SeriesId or ''
+
+    def check(self, webhook) -> Optional[str]:
+        """
+        检查事件是否重复，返回命中的键；未命中时记录该事件的所有键并返回 None
+        """
+        keys = self.keys_for(webhook)
+        if not keys:
+            return None
+        now = time.time()
+        for key in keys:
+            seen_at = self._seen.get(key)
+            if seen_at is not None and now - seen_at < self.window:
+                self.suppressed += 1
+                return key
+
+        for key in keys:
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            self._pending.append((key, now))
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return None
+
+    async def start(self, flush_interval: float = 1.0) -> None:
+        """加载持久化的键并启动定期写入任务"""
+        await asyncio.to_thread(self.load)
+        if self._conn and not self._flush_task:
+            self._flush_task = asyncio.create_task(self._flush_loop(flush_interval))
+
+    async def stop(self) -> None:
+        """停止定期写入并保存剩余的键"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await asyncio.to_thread(self.close)
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            if self._pending:
+                await asyncio.to_thread(self.flush)
+
+    def load(self) -> None:
+        """打开持久化存储并加载时间窗口内的键"""
+        if not self.db_file:
+            return
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS dedup (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        cutoff = time.time() - self.window
+        self._conn.execute("DELETE FROM dedup WHERE seen_at < ?", (cutoff,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT key, seen_at FROM dedup ORDER BY seen_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, seen_at in reversed(rows):
+            self._seen[key] = seen_at
+        logger.info(f"去重索引已加载 {len(rows)} 个键")
+
+    def flush(self) -> None:
+        """将新增的键批量写入持久化存储(可在线程中调用)"""
+        if not self._conn or not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with self._lock:
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO dedup (key, seen_at) VALUES (?, ?)", pending)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"写入去重索引失败: {str(e)}")
+
+    def close(self) -> None:
+        self.flush()
+        if self._conn:
+            self._conn.close()
+            self._conn = None
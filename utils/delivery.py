@@ -0,0 +1,67 @@
+"""
+Telegram 发送失败分类
+
+- permanent: 重试也不会成功，例如 HTML 标记无效、聊天不存在、机器人被移出或被封禁
+- transient: 临时故障，例如 5xx、网络错误、超时，稍后重试
+- throttled: 触发速率限制(429)，在 retry_after 之后重试
+"""
+from typing import Optional
+
+PERMANENT = 'permanent'
+TRANSIENT = 'transient'
+THROTTLED = 'throttled'
+
+# 4xx 中可以通过重试恢复的错误(描述为小写片段)
+_RECOVERABLE_4XX = (
+    'wrong file identifier',         # file_id 失效，重试时改为上传或使用图片地址
+    'failed to get http url content',
+    'wrong type of the web page content',
+    'message thread not found',
+)
+
+# 与消息内容本身有关的错误，相册中只影响其中一条
+_CONTENT_ERRORS = (
+    "can't parse entities",
+    'caption is too long',
+    'message is too long',
+    'wrong file identifier',
+    'failed to get http url content',
+    'wrong type of the web page content',
+)
+
+
+class DeliveryError(Exception):
+    """发送失败，kind 为 permanent / transient / throttled"""
+
+    def __init__(self, kind: str, description: str, status: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(description)
+        self.kind = kind
+        self.description = description
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def content_related(self) -> bool:
+        """失败是否由消息内容(标记、说明文字、图片)引起，而不是目标聊天或网络"""
+        text = (self.description or '').lower()
+        return any(fragment in text for fragment in _CONTENT_ERRORS)
+
+    def __str__(self) -> str:
+        if self.status:
+            return f"[{self.kind}] {self.status} {self.description}"
+        return f"[{self.kind}] {self.description}"
+
+
+def classify_failure(status: int, description: str = '') -> str:
+    """根据 HTTP 状态码和 Telegram 返回的错误描述对失败分类"""
+    if status == 429:
+        return THROTTLED
+    if status >= 500 or status in (408, 409):
+        return TRANSIENT
+    if 400 <= status < 500:
+        text = (description or '').lower()
+        if any(fragment in text for fragment in _RECOVERABLE_4XX):
+            return TRANSIENT
+        return PERMANENT
+    return TRANSIENT
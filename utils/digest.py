@@ -0,0 +1,129 @@
+"""
+批量入库汇总(digest)
+
+整季剧集或一个合集一次入库时会在短时间内产生几百条 library.new 事件，逐条发送要持续几个小时。
+汇总模式下，目标队列的 worker 在 window 内收集消息，按 剧集 / 父文件夹 / 媒体库 分组，
+达到 min_items 条的组合并为一条汇总消息(数量、总大小、总时长和标题列表)，其余消息照常逐条发送。
+
+mode 为 auto 时按到达速率自动切换: 最近 rate_window 秒内的到达速率超过 threshold(条/分钟)时开启，
+速率降到一半以下且队列积压低于 threshold 条后关闭。
+"""
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+MODE_AUTO = 'auto'
+MODE_ON = 'on'
+MODE_OFF = 'off'
+
+GROUP_AUTO = 'auto'        # 剧集按所属剧集，其余按媒体库
+GROUP_PARENT = 'parent'    # 剧集按所属剧集，其余按父文件夹
+GROUP_LIBRARY = 'library'  # 全部按媒体库
+
+
+def _item(message_data: Dict[Any, Any]):
+    """构建通知时补全过的条目，没有时使用 webhook 中的条目"""
+    return message_data['notification'].get('item') or message_data['webhook'].Item
+
+
+class ArrivalRate:
+    """最近 window 秒内的到达次数，按秒分桶计数"""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._buckets: deque = deque()
+        self._count = 0
+
+    def record(self, now: Optional[float] = None) -> None:
+        second = int(time.monotonic() if now is None else now)
+        if self._buckets and self._buckets[-1][0] == second:
+            self._buckets[-1][1] += 1
+        else:
+            self._buckets.append([second, 1])
+        self._count += 1
+
+    def per_minute(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._count -= self._buckets.popleft()[1]
+        return self._count * 60 / self.window
+
+
+class DigestPolicy:
+    """汇总模式的开关和分组规则"""
+
+    def __init__(self, mode: str = MODE_AUTO, threshold: float = 30, window: float = 60,
+                 min_items: int = 3, max_items: int = 500, group_by: str = GROUP_AUTO,
+                 rate_window: float = 60):
+        self.mode = mode if mode in (MODE_AUTO, MODE_ON, MODE_OFF) else MODE_AUTO
+        self.threshold = threshold
+        self.window = window
+        self.min_items = max(2, min_items)
+        self.max_items = max(self.min_items, max_items)
+        self.group_by = group_by if group_by in (GROUP_AUTO, GROUP_PARENT, GROUP_LIBRARY) else GROUP_AUTO
+        self.rate = ArrivalRate(rate_window)
+        self.stats = {'digests': 0, 'digested': 0, 'activations': 0}
+        self._active = self.mode == MODE_ON
+
+    def record_arrival(self) -> None:
+        if self.mode == MODE_AUTO:
+            self.rate.record()
+
+    def active(self, backlog: int = 0) -> bool:
+        """是否处于汇总模式(带滞回)，backlog 为当前队列积压"""
+        if self.mode != MODE_AUTO:
+            return self.mode == MODE_ON
+        rate = self.rate.per_minute()
+        if not self._active and rate >= self.threshold:
+            self._active = True
+            self.stats['activations'] += 1
+            logger.warning(f"新媒体到达速率 {rate:.0f} 条/分钟，超过 {self.threshold:.0f}，开启汇总模式")
+        elif self._active and rate < self.threshold / 2 and backlog < self.threshold:
+            self._active = False
+            logger.info(f"新媒体到达速率降到 {rate:.0f} 条/分钟，关闭汇总模式")
+        return self._active
+
+    def group_key(self, message_data: Dict[Any, Any]) -> Hashable:
+        """消息所属的汇总分组"""
+        webhook = message_data['webhook']
+        item = _item(message_data)
+        server_id = webhook.Server.Id if webhook.Server else item.ServerId
+        if item.SeriesId and self.group_by != GROUP_LIBRARY:
+            return server_id, 'series', item.SeriesId
+        if self.group_by == GROUP_PARENT and item.ParentId:
+            return server_id, 'parent', item.ParentId
+        return server_id, 'library', message_data['notification']['library']
+
+    def group(self, batch: List[Dict[Any, Any]]) -> List[Tuple[Optional[str], List[Dict[Any, Any]]]]:
+        """
+        将一批消息分组，返回按首条消息顺序排列的 [(汇总标题, 消息列表)]，
+        不足 min_items 条的组拆成单条消息，标题为 None
+        """
+        groups: Dict[Hashable, List[Dict[Any, Any]]] = {}
+        for message_data in batch:
+            groups.setdefault(self.group_key(message_data), []).append(message_data)
+        units = []
+        for key, members in groups.items():
+            if len(members) >= self.min_items:
+                units.append((self._title(key, members), members))
+            else:
+                units.extend((None, [message_data]) for message_data in members)
+        # 汇总消息排在组内第一条消息原来的位置
+        position = {id(message_data): index for index, message_data in enumerate(batch)}
+        units.sort(key=lambda unit: position[id(unit[1][0])])
+        return units
+
+    @staticmethod
+    def _title(key: Hashable, members: List[Dict[Any, Any]]) -> str:
+        item = _item(members[0])
+        kind = key[1]
+        if kind == 'series':
+            return item.SeriesName or item.Name
+        if kind == 'parent':
+            return os.path.basename(os.path.dirname(item.Path)) or members[0]['notification']['library']
+        return members[0]['notification']['library']
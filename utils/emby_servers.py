@@ -0,0 +1,131 @@
+"""
+Emby 服务器注册表
+
+按 webhook 中的 Server.Id 区分事件来源，每台服务器拥有独立的连接池、媒体库缓存和请求速率限制。
+
+EMBY_SERVERS 中带 id 的条目登记为服务器，例如:
+    [{"id": "4efd01cd...", "name": "主服务器", "url": "https://emby.example.com", "api_key": "xxx"}]
+可选字段 rate / burst (每秒请求数和突发量)、pool_limit (最大连接数)；api_key 缺省时使用 EMBY_API_KEY。
+没有 id 的条目(例如只用于展示的线路地址)会被忽略。
+EMBY_URL / EMBY_API_KEY 作为默认服务器，处理未登记的服务器ID。
+"""
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Union
+
+import aiohttp
+
+from utils.cache import SingleFlight, TTLCache
+from utils.http_client import HttpClientPool
+from utils.logger import Logger
+from utils.rate_limiter import TokenBucket
+
+logger = Logger().get_logger()
+
+
+class EmbyServer:
+    """单台 Emby 服务器的连接、缓存和速率限制"""
+
+    def __init__(self, http: HttpClientPool, server_id: str, url: str, api_key: Optional[str],
+                 name: Optional[str] = None, rate: float = 50, burst: float = 20, pool_limit: int = 20,
+                 cache_size: int = 10000, cache_ttl: float = 3600):
+        self.http = http
+        self.id = server_id
+        self.url = (url or '').rstrip('/')
+        self.api_key = api_key
+        self.name = name or server_id or 'default'
+        self.pool_limit = pool_limit
+        self.session_name = f"emby:{self.name}"
+        self.bucket = TokenBucket(rate, burst)
+        # 媒体库名称缓存: 任意祖先ID -> 媒体库名称
+        self.library_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.library_flight = SingleFlight()
+        self.library_locations = []
+        self.library_prewarmed_until = 0.0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.url and self.api_key)
+
+    def session(self) -> aiohttp.ClientSession:
+        return self.http.session(self.session_name, limit=self.pool_limit)
+
+    def api_url(self, path: str) -> str:
+        """拼接带 api_key 的接口地址，path 为 /emby/ 之后的部分"""
+        separator = '&' if '?' in path else '?'
+        return f"{self.url}/emby/{path}{separator}api_key={self.api_key}"
+
+    def item_link(self, item_id: str, server_id: str) -> str:
+        """条目在 Emby 网页端的地址"""
+        return f"{self.url}/web/index.html#!/item?id={item_id}&serverId={server_id}"
+
+    async def acquire(self) -> None:
+        """按令牌桶限制对该服务器的请求速率"""
+        while True:
+            now = time.monotonic()
+            delay = self.bucket.delay(now)
+            if delay <= 0:
+                self.bucket.consume(now)
+                return
+            await asyncio.sleep(delay)
+
+
+class EmbyServerRegistry:
+    """按服务器ID查找 Emby 服务器"""
+
+    def __init__(self, default: EmbyServer, servers: Optional[List[EmbyServer]] = None):
+        self.default = default
+        self._servers: Dict[str, EmbyServer] = {}
+        if default.id:
+            self._servers[default.id] = default
+        for server in servers or []:
+            self._servers[server.id] = server
+
+    @classmethod
+    def from_config(cls, http: HttpClientPool, emby_url: str, api_key: Optional[str],
+                    servers_config: Union[str, list, None], default_id: str = '', **defaults) -> "EmbyServerRegistry":
+        """根据 EMBY_URL / EMBY_API_KEY / EMBY_SERVERS 配置创建注册表"""
+        default = EmbyServer(http, default_id, emby_url, api_key, **defaults)
+        if isinstance(servers_config, str):
+            try:
+                servers_config = json.loads(servers_config) if servers_config.strip() else []
+            except json.JSONDecodeError as e:
+                logger.error(f"EMBY_SERVERS 不是有效的 JSON: {str(e)}")
+                servers_config = []
+
+        servers = []
+        for entry in servers_config or []:
+            if not isinstance(entry, dict) or not entry.get("id"):
+                continue
+            if not entry.get("url"):
+                logger.warning(f"Emby 服务器 {entry['id']} 缺少 url，已忽略")
+                continue
+            options = dict(defaults)
+            for key in ("rate", "burst", "pool_limit"):
+                if key in entry:
+                    options[key] = entry[key]
+            servers.append(EmbyServer(
+                http, str(entry["id"]), entry["url"], entry.get("api_key") or api_key,
+                name=entry.get("name"), **options
+            ))
+        registry = cls(default, servers)
+        logger.info(f"已登记 {len(registry)} 台 Emby 服务器: {', '.join(s.name for s in registry)}")
+        return registry
+
+    def get(self, server_id: Optional[str]) -> EmbyServer:
+        """返回事件来源服务器，未登记的服务器ID使用默认服务器"""
+        if server_id:
+            server = self._servers.get(server_id)
+            if server is not None:
+                return server
+        return self.default
+
+    def __iter__(self):
+        servers = list(self._servers.values())
+        if not self.default.id and self.default.configured:
+            servers.insert(0, self.default)
+        return iter(servers)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
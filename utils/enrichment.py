@@ -0,0 +1,143 @@
+"""
+Emby 条目批量查询
+
+webhook 中缺少的展示字段(分辨率、时长、剧集信息等)和查找媒体库时的父级链都需要向 Emby 查询条目。
+逐条请求时每条消息都要单独往返一次；这里把 window 秒内、同一台服务器上请求的条目ID合并为一次
+/Items?Ids=a,b,c&Fields=... 请求(最多 max_batch 个ID)，经该服务器共享的连接池和速率限制发出，
+结果按 服务器 + 条目ID 缓存。同一ID的并发查询共享同一个结果。
+"""
+import asyncio
+import dataclasses
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from utils.cache import TTLCache
+from utils.emby_servers import EmbyServer
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+# 请求的附加字段(Emby 默认不返回)
+ITEM_QUERY_FIELDS = (
+    "ParentId,Path,MediaSources,Width,Height,Overview,Genres,Studios,TagItems,"
+    "PremiereDate,DateCreated,ProductionYear"
+)
+
+# 只有剧集才有的字段，其他类型的条目缺少时不需要查询
+EPISODE_FIELDS = frozenset(("SeriesId", "SeriesName", "ParentIndexNumber", "IndexNumber"))
+
+
+class EmbyItemBatcher:
+    """按服务器合并条目查询，get() 返回 Emby 的条目 JSON，不存在或请求失败时返回 None"""
+
+    def __init__(self, fetch_json: Callable[..., Awaitable[Any]], window: float = 0.02, max_batch: int = 50,
+                 cache_size: int = 10000, cache_ttl: float = 600, fields: str = ITEM_QUERY_FIELDS):
+        # fetch_json(server, url, endpoint) 请求 Emby 接口并返回 JSON，失败时返回 None
+        self._fetch_json = fetch_json
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.fields = fields
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.stats = {'lookups': 0, 'cache_hits': 0, 'requests': 0, 'requested_ids': 0, 'missing': 0}
+        # 服务器 -> 等待下一次请求的 {条目ID: future}
+        self._pending: Dict[EmbyServer, Dict[str, asyncio.Future]] = {}
+        self._timers: Dict[EmbyServer, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def get(self, server: EmbyServer, item_id: str) -> Optional[Dict[str, Any]]:
+        self.stats['lookups'] += 1
+        cached = self.cache.get((server.session_name, item_id))
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+
+        pending = self._pending.setdefault(server, {})
+        future = pending.get(item_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = pending[item_id] = loop.create_future()
+            if len(pending) >= self.max_batch:
+                self._flush(server)
+            elif server not in self._timers:
+                self._timers[server] = loop.call_later(self.window, self._flush, server)
+        return await asyncio.shield(future)
+
+    def _flush(self, server: EmbyServer) -> None:
+        """发出该服务器当前收集到的所有ID"""
+        timer = self._timers.pop(server, None)
+        if timer:
+            timer.cancel()
+        pending = self._pending.pop(server, None)
+        if pending:
+            task = asyncio.create_task(self._resolve(server, pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, server: EmbyServer, pending: Dict[str, asyncio.Future]) -> None:
+        ids = list(pending)
+        self.stats['requests'] += 1
+        self.stats['requested_ids'] += len(ids)
+        found = {}
+        try:
+            data = await self._fetch_json(
+                server, server.api_url(f"Items?Ids={','.join(ids)}&Fields={self.fields}"), "items_batch"
+            )
+            for item in (data or {}).get("Items") or []:
+                if item.get("Id"):
+                    found[str(item["Id"])] = item
+        except Exception as e:
+            logger.error(f"批量查询 Emby 条目时发生错误: {server.name} {str(e)}")
+        for item_id, future in pending.items():
+            item = found.get(item_id)
+            if item is None:
+                self.stats['missing'] += 1
+            else:
+                self.cache.set((server.session_name, item_id), item)
+            if not future.done():
+                future.set_result(item)
+
+
+def _missing(value: Any) -> bool:
+    return value is None or value == () or value == ''
+
+
+def _media_source_values(data: Dict[str, Any]) -> Dict[str, Any]:
+    """从第一个媒体源及其视频流补充顶层没有返回的字段"""
+    sources = data.get("MediaSources") or []
+    if not sources:
+        return {}
+    source = sources[0]
+    values = {"Size": source.get("Size"), "Container": source.get("Container"),
+              "RunTimeTicks": source.get("RunTimeTicks")}
+    for stream in source.get("MediaStreams") or []:
+        if stream.get("Type") == "Video":
+            values["Width"] = stream.get("Width")
+            values["Height"] = stream.get("Height")
+            break
+    return values
+
+
+def missing_fields(item, fields: Iterable[str]) -> Tuple[str, ...]:
+    """item 中为空、需要补全的字段；剧集信息只对 Episode 检查"""
+    return tuple(
+        field for field in fields
+        if _missing(getattr(item, field, None)) and (field not in EPISODE_FIELDS or item.Type == "Episode")
+    )
+
+
+def enrich(item, data: Dict[str, Any], fields: Iterable[str]):
+    """用 Emby 返回的条目 JSON 补全 item 中缺少的字段，返回新的不可变实例"""
+    fallback = _media_source_values(data)
+    updates = {}
+    for field in fields:
+        value = data.get(field)
+        if _missing(value):
+            value = fallback.get(field)
+        if not _missing(value):
+            updates[field] = value
+    if not updates:
+        return item
+    try:
+        return dataclasses.replace(item, **updates)
+    except Exception as e:
+        logger.warning(f"补全条目 {item.Id} 的字段失败: {str(e)}")
+        return item
@@ -1,18 +1,29 @@
 import re
 from datetime import timezone, datetime, timedelta
+from functools import lru_cache
 from typing import Optional
 
 from utils.logger import Logger
 
 logger = Logger().get_logger()
 
+TZ_UTC8 = timezone(timedelta(hours=8))
 
+# Markdown V2 需要转义的字符及其转义结果
+_MARKDOWN_V2_ESCAPES = tuple((char, f'\\{char}') for char in '_*[]()~`>#+-=|{}.!')
+
+# format_telegram_hashtag 使用的预编译正则
+_HASHTAG_COLON = re.compile(r'\s*:\s*')
+_HASHTAG_SPACES = re.compile(r'\s+')
+_HASHTAG_INVALID = re.compile(r'[^\w\u4e00-\u9fff_]')
+_HASHTAG_UNDERSCORES = re.compile(r'_+')
+
+
+@lru_cache(maxsize=4096)
 def parse_emby_date(date_str: Optional[str]) -> str:
     """Parse Emby date format to datetime object and convert to UTC+8"""
     if not date_str:
         return "未知"
-        
-    tz_utc8 = timezone(timedelta(hours=8))
 
     try:
         # 移除多余的小数位数，只保留6位微秒
@@ -31,7 +42,7 @@ def parse_emby_date(date_str: Optional[str]) -> str:
         utc_time = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
 
         # 转换为UTC+8
-        return utc_time.astimezone(tz_utc8).strftime('%Y-%m-%d %H:%M:%S')
+        return utc_time.astimezone(TZ_UTC8).strftime('%Y-%m-%d %H:%M:%S')
     except Exception as e:
         logger.error(f"Error parsing date {date_str}: {e}")
         return "未知"
@@ -39,9 +50,10 @@ def parse_emby_date(date_str: Optional[str]) -> str:
 
 def escape_markdown_v2(text: str) -> str:
     """Escape special characters for Markdown V2 format"""
-    need_escape = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in need_escape:
-        text = text.replace(char, f'\\{char}')
+    # 跳过文本中不存在的字符，大多数文本只需要 1~2 次 replace
+    for char, escaped in _MARKDOWN_V2_ESCAPES:
+        if char in text:
+            text = text.replace(char, escaped)
     return text
 
 
@@ -67,8 +79,9 @@ def format_size(size_bytes: Optional[int]) -> str:
     return f"{mb:.2f} MB"
 
 
+@lru_cache(maxsize=2048)
 def format_telegram_hashtag(label: Optional[str]) -> str:
-    """将标签名称转换为 Telegram 可用的 Hashtag"""
+    """将标签名称转换为 Telegram 可用的 Hashtag，制作公司和标签名称重复率很高，结果会被缓存"""
     if not label:
         return ""
 
@@ -77,9 +90,9 @@ def format_telegram_hashtag(label: Optional[str]) -> str:
         return ""
 
     sanitized = sanitized.replace('：', ':')
-    sanitized = re.sub(r'\s*:\s*', '_', sanitized)
-    sanitized = re.sub(r'\s+', '_', sanitized)
-    sanitized = re.sub(r'[^\w\u4e00-\u9fff_]', '', sanitized)
-    sanitized = re.sub(r'_+', '_', sanitized).strip('_')
+    sanitized = _HASHTAG_COLON.sub('_', sanitized)
+    sanitized = _HASHTAG_SPACES.sub('_', sanitized)
+    sanitized = _HASHTAG_INVALID.sub('', sanitized)
+    sanitized = _HASHTAG_UNDERSCORES.sub('_', sanitized).strip('_')
 
     return sanitized
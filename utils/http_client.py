@@ -0,0 +1,122 @@
+from collections import defaultdict
+from typing import Dict, Optional
+
+import aiohttp
+
+from config.settings import (
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_TOTAL_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT
+)
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+
+class HttpClientPool:
+    """
+    按上游服务(Telegram API、Emby 服务器)维护长连接 aiohttp 会话
+
+    每个上游一个 ClientSession，复用 TCP/TLS 连接和 DNS 缓存，
+    并通过 TraceConfig 统计请求数、新建连接数和复用连接数。
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: int = 300,
+        total_timeout: float = 30,
+        connect_timeout: float = 10
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def _trace_config(self, name: str) -> aiohttp.TraceConfig:
+        stats = self._stats[name]
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            stats['requests'] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            stats['connections_created'] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            stats['connections_reused'] += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            stats['dns_cache_hits'] += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            stats['dns_cache_misses'] += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    def session(self, name: str, limit: Optional[int] = None) -> aiohttp.ClientSession:
+        """
+        获取指定上游的共享会话，不存在时创建（必须在事件循环中调用）
+
+        :param limit: 该会话的最大连接数，默认使用连接池的 limit
+        """
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=limit or self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                trace_configs=[self._trace_config(name)]
+            )
+            self._sessions[name] = session
+        return session
+
+    async def start(self, *names: str) -> None:
+        """启动时预先创建会话"""
+        for name in names:
+            self.session(name)
+        logger.info(f"HTTP 连接池已启动: {', '.join(names)}")
+
+    async def close(self) -> None:
+        """关闭所有会话"""
+        for name, session in list(self._sessions.items()):
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+        for name, stats in self.stats().items():
+            logger.info(f"HTTP 连接池 {name} 统计: {stats}")
+
+    def stats(self, name: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """返回连接复用统计"""
+        names = [name] if name else list(self._stats.keys())
+        return {n: dict(self._stats[n]) for n in names}
+
+
+# 进程内共享的连接池
+http_pool = HttpClientPool(
+    limit=HTTP_POOL_LIMIT,
+    limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    dns_cache_ttl=HTTP_DNS_CACHE_TTL,
+    total_timeout=HTTP_TOTAL_TIMEOUT,
+    connect_timeout=HTTP_CONNECT_TIMEOUT
+)
@@ -0,0 +1,203 @@
+"""
+通知图片处理
+
+由本服务经事件来源服务器的连接池从 Emby 下载图片(请求时带上 maxWidth/quality 让 Emby 先缩放)，
+安装了 Pillow 时再按需缩小并重新压缩，然后以 multipart 方式上传给 Telegram。
+Telegram 返回的 file_id 按 服务器ID + 条目ID + 图片标签 缓存并持久化，
+同一张图片再次发送时直接使用 file_id，不再传输图片数据。
+"""
+import asyncio
+import functools
+import importlib.util
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Optional, Tuple
+
+from utils.cache import SingleFlight, TTLCache
+from utils.emby_servers import EmbyServer
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+# Pillow 是可选依赖，未安装时直接上传 Emby 返回的图片；导入较慢，推迟到第一次缩图时
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+
+@functools.lru_cache(maxsize=None)
+def _pil_image():
+    from PIL import Image
+    return Image
+
+
+class Photo:
+    """一张待发送的图片，按 file_id > 图片数据 > 图片URL 的优先级发送"""
+
+    __slots__ = ('key', 'url', 'file_id', 'data')
+
+    def __init__(self, key: str, url: str, file_id: Optional[str] = None, data: Optional[bytes] = None):
+        self.key = key
+        self.url = url
+        self.file_id = file_id
+        self.data = data
+
+    @property
+    def filename(self) -> str:
+        return f"{self.key.replace(':', '_')}.jpg"
+
+
+class ImagePipeline:
+    """通知图片的下载、压缩和 file_id 缓存"""
+
+    def __init__(self, enabled: bool = True, max_dimension: int = 1280, quality: int = 85,
+                 max_bytes: int = 5 * 1024 * 1024, cache_size: int = 50000, db_file: Optional[str] = None):
+        self.enabled = enabled
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.db_file = db_file
+        # file_id 不会过期，只按 LRU 淘汰
+        self.file_ids = TTLCache(maxsize=cache_size, ttl=float('inf'))
+        self.stats = defaultdict(int)
+        self._flight = SingleFlight()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # 让 Emby 在服务端先缩放图片，Telegram 拉取地址时同样受益
+        self._resize_query = f"&maxWidth={max_dimension}&maxHeight={max_dimension}&quality={quality}" \
+            if max_dimension else ""
+
+    @staticmethod
+    def select(item) -> Optional[Tuple[str, str]]:
+        """选择通知使用的图片，优先背景图，其次主封面图，返回 (Emby 图片路径, 图片标签)"""
+        if item.BackdropImageTags:
+            return "Backdrop/0", item.BackdropImageTags[0]
+        if item.ImageTags and item.ImageTags.Primary:
+            return "Primary", item.ImageTags.Primary
+        return None
+
+    async def prepare(self, item, server: EmbyServer) -> Optional[Photo]:
+        """准备通知图片，从事件来源服务器获取，条目没有图片时返回 None"""
+        selected = self.select(item)
+        if not selected or not server.configured:
+            return None
+        image_path, tag = selected
+        url = server.api_url(f"Items/{item.Id}/Images/{image_path}") + self._resize_query
+        photo = Photo(f"{item.ServerId}:{item.Id}:{tag}", url)
+        if not self.enabled:
+            return photo
+
+        photo.file_id = self.file_ids.get(photo.key)
+        if photo.file_id:
+            self.stats['file_id_hits'] += 1
+            return photo
+
+        # 同一张图片的并发请求只下载一次
+        photo.data = await self._flight.do(photo.key, self._download, server, url)
+        if photo.data is None:
+            # 下载失败时退回由 Telegram 拉取图片地址
+            self.stats['url_fallbacks'] += 1
+        return photo
+
+    async def _download(self, server: EmbyServer, url: str) -> Optional[bytes]:
+        await server.acquire()
+        try:
+            async with server.session().get(url) as response:
+                if not response.ok:
+                    logger.warning(f"下载通知图片失败: {response.status}")
+                    return None
+                data = await response.read()
+        except Exception as e:
+            logger.warning(f"下载通知图片时发生错误: {str(e)}")
+            return None
+        self.stats['downloads'] += 1
+        self.stats['download_bytes'] += len(data)
+        if PILLOW_AVAILABLE and self.max_dimension:
+            data = await asyncio.to_thread(self._shrink, data)
+        return data
+
+    def _shrink(self, data: bytes) -> bytes:
+        """图片超过尺寸或大小限制时缩小并重新压缩为 JPEG，无法处理时原样返回"""
+        try:
+            with _pil_image().open(io.BytesIO(data)) as image:
+                if max(image.size) <= self.max_dimension and len(data) <= self.max_bytes:
+                    return data
+                image.thumbnail((self.max_dimension, self.max_dimension))
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                output = io.BytesIO()
+                image.save(output, format="JPEG", quality=self.quality, optimize=True)
+        except Exception as e:
+            logger.debug(f"图片无法重新压缩，使用原图: {str(e)}")
+            return data
+        self.stats['recompressed'] += 1
+        return output.getvalue()
+
+    def remember(self, photo: Photo, file_id: Optional[str]) -> None:
+        """记录 Telegram 返回的 file_id"""
+        if not self.enabled or not file_id or photo.file_id == file_id:
+            return
+        if photo.data is not None:
+            self.stats['uploads'] += 1
+            self.stats['upload_bytes'] += len(photo.data)
+        # 同一通知发送到其他目标时直接使用 file_id
+        photo.file_id = file_id
+        photo.data = None
+        self.file_ids.set(photo.key, file_id)
+        if self._conn:
+            asyncio.get_running_loop().run_in_executor(None, self._store, photo.key, file_id)
+
+    def forget(self, photo: Photo) -> None:
+        """file_id 失效时移除缓存，下次重新上传"""
+        photo.file_id = None
+        self.file_ids.pop(photo.key)
+        if self._conn:
+            asyncio.get_running_loop().run_in_executor(None, self._store, photo.key, None)
+
+    async def start(self) -> None:
+        """打开持久化存储并加载缓存的 file_id"""
+        if self.enabled and self.db_file:
+            await asyncio.to_thread(self._load)
+
+    async def stop(self) -> None:
+        await asyncio.to_thread(self._close)
+
+    def _load(self) -> None:
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids (key TEXT PRIMARY KEY, file_id TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        rows = self._conn.execute(
+            "SELECT key, file_id FROM file_ids ORDER BY updated_at DESC LIMIT ?", (self.file_ids.maxsize,)
+        ).fetchall()
+        for key, file_id in reversed(rows):
+            self.file_ids.set(key, file_id)
+        logger.info(f"图片 file_id 缓存已加载 {len(rows)} 条")
+
+    def _store(self, key: str, file_id: Optional[str]) -> None:
+        with self._lock:
+            if not self._conn:
+                return
+            try:
+                if file_id:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO file_ids (key, file_id, updated_at) VALUES (?, ?, ?)",
+                        (key, file_id, time.time())
+                    )
+                else:
+                    self._conn.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"写入 file_id 缓存失败: {str(e)}")
+
+    def _close(self) -> None:
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
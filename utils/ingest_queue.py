@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+
+class IngestQueue:
+    """
+    多进程共享的 SQLite 收件箱
+
+    split 部署模式下，多个 ingest 进程只负责接收和校验 webhook，把原始请求体追加到收件箱；
+    唯一的分发进程按顺序读取、交给消息队列，并在消息队列日志落盘后删除。
+    - append 只写入内存缓冲区，由后台线程批量提交，多个进程的写入由 SQLite 的写锁串行化
+    - fetch/ack 供分发进程使用，未确认的记录在分发进程重启后继续处理
+    - 提交失败时放回缓冲区重试；关闭时连续失败 close_retries 次则丢弃剩余事件并记录错误，保证进程能退出
+    """
+
+    def __init__(self, path: str, group_commit_interval: float = 0.002, synchronous: str = "FULL",
+                 busy_timeout: float = 10.0, close_retries: int = 3):
+        self.path = path
+        self.group_commit_interval = group_commit_interval
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self.close_retries = max(1, close_retries)
+        self.stats = {'appended': 0, 'committed': 0, 'fetched': 0, 'acked': 0, 'dropped': 0}
+
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[float, str, bytes]] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+
+    def open(self, writer: bool = False) -> None:
+        """打开收件箱，writer 为 True 时启动后台提交线程(ingest 进程)"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS inbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "received_at REAL NOT NULL, "
+            "event_type TEXT NOT NULL, "
+            "payload BLOB NOT NULL)"
+        )
+        self._conn = conn
+        self._closing = False
+        if writer:
+            self._thread = threading.Thread(target=self._writer_loop, name="ingest-writer", daemon=True)
+            self._thread.start()
+
+    def append(self, event_type: str, payload: bytes) -> None:
+        """追加一条事件，立即返回，不等待落盘"""
+        with self._cond:
+            self._pending.append((time.time(), event_type, payload))
+            self.stats['appended'] += 1
+            self._cond.notify()
+
+    def fetch(self, limit: int) -> List[Tuple[int, str, bytes]]:
+        """按接收顺序读取最多 limit 条未确认的事件 [(id, event_type, payload)] (阻塞调用)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, event_type, payload FROM inbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        self.stats['fetched'] += len(rows)
+        return rows
+
+    def ack(self, ids: List[int]) -> None:
+        """删除已交给消息队列的事件 (阻塞调用)"""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM inbox WHERE id = ?", [(i,) for i in ids])
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.stats['acked'] += len(ids)
+
+    def backlog(self) -> int:
+        """收件箱中未处理的事件数 (阻塞调用)"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM inbox").fetchone()[0]
+
+    def close(self) -> None:
+        """提交剩余缓冲区并关闭"""
+        if self._thread:
+            with self._cond:
+                self._closing = True
+                self._cond.notify_all()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def _writer_loop(self):
+        """后台提交线程"""
+        failures = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closing)
+                closing = self._closing
+                if not closing and self.group_commit_interval > 0:
+                    # 短暂等待，让同一批突发写入合并到一次提交中
+                    self._cond.wait(self.group_commit_interval)
+                batch, self._pending = self._pending, []
+
+            if batch:
+                try:
+                    self._commit(batch)
+                    failures = 0
+                except sqlite3.Error as e:
+                    failures += 1
+                    if closing and failures >= self.close_retries:
+                        # 关闭时仍无法写入(例如磁盘已满)，丢弃剩余事件，不能让进程一直无法退出
+                        logger.error(f"关闭时写入收件箱失败 {failures} 次，丢弃 {len(batch)} 条事件: {str(e)}")
+                        self.stats['dropped'] += len(batch)
+                    else:
+                        # 写锁竞争超时等错误，放回缓冲区稍后重试，不丢弃事件
+                        logger.error(f"写入收件箱失败，稍后重试: {str(e)}")
+                        with self._cond:
+                            self._pending[:0] = batch
+                        time.sleep(0.1)
+                        continue
+
+            if closing:
+                with self._cond:
+                    if not self._pending:
+                        return
+
+    def _commit(self, batch):
+        with self._lock:
+            conn = self._conn
+            # 立即获取写锁，避免多个进程在事务中途升级锁时死锁
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO inbox (received_at, event_type, payload) VALUES (?, ?, ?)", batch
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        self.stats['committed'] += len(batch)
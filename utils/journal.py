@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+
+class MessageJournal:
+    """
+    基于 SQLite WAL 的消息预写日志
+
+    - append/ack 只写入内存缓冲区，由后台线程批量提交（组提交），多条消息共享一次 fsync
+    - 启动时通过 open() 返回所有未确认的消息用于重放
+    - 已确认的消息在提交时删除，并定期 checkpoint/vacuum 回收空间
+    - load() 按序号读回消息，用于队列溢出到磁盘后重新加载
+    - 提交失败时整批放回缓冲区按退避重试，wait_durable() 只在该序号及之前的消息全部提交后返回 True；
+      关闭时连续失败 close_retries 次则放弃，未提交的消息留在缓冲区中并记录错误
+    """
+
+    def __init__(self, path: str, group_commit_interval: float = 0.002, compact_every: int = 1000,
+                 synchronous: str = "FULL", close_retries: int = 3):
+        self.path = path
+        self.group_commit_interval = group_commit_interval
+        self.compact_every = compact_every
+        self.synchronous = synchronous
+        self.close_retries = max(1, close_retries)
+
+        self._cond = threading.Condition()
+        self._pending_appends: List[Tuple[int, Dict[Any, Any], Optional[bytes]]] = []
+        self._pending_acks: List[int] = []
+        self._committed_seq = 0
+        self._next_seq = 1
+        self._acked_since_compact = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._reader: Optional[sqlite3.Connection] = None
+        self._reader_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+        # 写入线程已退出，不会再有新的提交
+        self._stopped = False
+
+    def open(self, preload: Optional[int] = None) -> List[Tuple[int, Dict[Any, Any], Optional[bytes]]]:
+        """
+        打开日志并返回未确认的消息 [(seq, meta, payload)]
+
+        :param preload: 只读取前 preload 条消息的 payload，其余为 None，需要时通过 load() 读取
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "seq INTEGER PRIMARY KEY, "
+            "meta TEXT NOT NULL, "
+            "payload BLOB)"
+        )
+
+        if preload is None:
+            rows = conn.execute("SELECT seq, meta, payload FROM journal ORDER BY seq").fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT seq, meta, CASE WHEN rank <= ? THEN payload END FROM "
+                "(SELECT seq, meta, payload, ROW_NUMBER() OVER (ORDER BY seq) AS rank FROM journal) ORDER BY seq",
+                (preload,)
+            ).fetchall()
+        max_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM journal").fetchone()[0]
+        self._conn = conn
+        self._reader = sqlite3.connect(self.path, check_same_thread=False)
+        self._next_seq = max_seq + 1
+        self._committed_seq = max_seq
+        self._closing = False
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._writer_loop, name="journal-writer", daemon=True)
+        self._thread.start()
+
+        pending = []
+        for seq, meta, payload in rows:
+            try:
+                pending.append((seq, json.loads(meta), payload))
+            except ValueError as e:
+                logger.error(f"消息日志中存在无法解析的记录 {seq}: {str(e)}")
+                self.ack(seq)
+        if pending:
+            logger.info(f"从消息日志中恢复了 {len(pending)} 条未处理的消息")
+        return pending
+
+    def append(self, meta: Dict[Any, Any], payload: Optional[bytes] = None) -> int:
+        """
+        追加一条消息，立即返回序号，不等待落盘
+
+        :param meta: 可 JSON 序列化的消息元数据
+        :param payload: 原始消息体(例如 webhook 请求的原始字节)，原样保存
+        """
+        with self._cond:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending_appends.append((seq, meta, payload))
+            self._cond.notify()
+        return seq
+
+    def ack(self, seq: int) -> None:
+        """确认消息已处理完成"""
+        with self._cond:
+            self._pending_acks.append(seq)
+            self._cond.notify()
+
+    def load(self, seqs: List[int], timeout: float = 10.0) -> List[Tuple[int, Dict[Any, Any], Optional[bytes]]]:
+        """
+        按序号读取消息，返回顺序与 seqs 一致(阻塞调用，应在线程中执行)
+
+        仍在缓冲区中的消息最多等待 timeout 秒提交；写入线程停止或卡住时不再等待，
+        尚未提交的消息直接从缓冲区读取
+        """
+        if not seqs:
+            return []
+        found = {}
+        if not self.wait_durable(max(seqs), timeout):
+            logger.error(f"等待消息日志提交超时({timeout:.0f} 秒)，写入线程可能已停止，从缓冲区读取未提交的消息")
+            wanted = set(seqs)
+            with self._cond:
+                for seq, meta, payload in self._pending_appends:
+                    if seq in wanted:
+                        found[seq] = (seq, meta, payload)
+        with self._reader_lock:
+            rows = self._reader.execute(
+                f"SELECT seq, meta, payload FROM journal WHERE seq IN ({','.join('?' * len(seqs))})", seqs
+            ).fetchall()
+        for seq, meta, payload in rows:
+            try:
+                found[seq] = (seq, json.loads(meta), payload)
+            except ValueError as e:
+                logger.error(f"消息日志中存在无法解析的记录 {seq}: {str(e)}")
+        return [found[seq] for seq in seqs if seq in found]
+
+    @property
+    def last_seq(self) -> int:
+        """最后一条已追加消息的序号"""
+        return self._next_seq - 1
+
+    def wait_durable(self, seq: int, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞直到指定序号及之前的消息都已落盘（供需要强持久化的调用方使用）
+
+        超时或写入线程已退出而消息仍未提交时返回 False
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._committed_seq >= seq or self._stopped, timeout)
+            return self._committed_seq >= seq
+
+    def close(self) -> None:
+        """提交剩余缓冲区并关闭日志"""
+        if not self._thread:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        self._conn.close()
+        self._conn = None
+        with self._reader_lock:
+            self._reader.close()
+            self._reader = None
+
+    def _writer_loop(self):
+        """后台提交线程"""
+        try:
+            self._run_writer()
+        finally:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+
+    def _run_writer(self):
+        failures = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._pending_appends or self._pending_acks or self._closing
+                )
+                closing = self._closing
+                if not closing and self.group_commit_interval > 0:
+                    # 短暂等待，让同一批突发写入合并到一次提交中
+                    self._cond.wait(self.group_commit_interval)
+                appends, self._pending_appends = self._pending_appends, []
+                acks, self._pending_acks = self._pending_acks, []
+
+            if appends or acks:
+                try:
+                    self._commit(appends, acks)
+                    failures = 0
+                except Exception as e:
+                    # 放回缓冲区头部稍后重试，保持序号顺序，不能丢弃尚未落盘的消息
+                    failures += 1
+                    with self._cond:
+                        self._pending_appends[:0] = appends
+                        self._pending_acks[:0] = acks
+                    if closing and failures >= self.close_retries:
+                        logger.error(f"关闭时写入消息日志失败 {failures} 次，放弃提交 {len(appends)} 条消息，"
+                                     f"{len(acks)} 条确认: {str(e)}")
+                        return
+                    delay = min(5.0, 0.1 * 2 ** (failures - 1))
+                    logger.error(f"写入消息日志失败(连续 {failures} 次)，{delay:.1f} 秒后重试: {str(e)}")
+                    time.sleep(delay)
+                    continue
+
+            if closing:
+                with self._cond:
+                    if not self._pending_appends and not self._pending_acks:
+                        return
+
+    def _commit(self, appends, acks):
+        """在单个事务中写入新消息并删除已确认的消息"""
+        rows = [(seq, self._dumps(seq, meta), payload) for seq, meta, payload in appends]
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            if rows:
+                conn.executemany("INSERT OR REPLACE INTO journal (seq, meta, payload) VALUES (?, ?, ?)", rows)
+            if acks:
+                conn.executemany("DELETE FROM journal WHERE seq = ?", [(seq,) for seq in acks])
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+        with self._cond:
+            # 缓冲区按序号排列，失败的批次会放回头部，最早的未提交消息之前的序号都已落盘
+            self._committed_seq = self._pending_appends[0][0] - 1 if self._pending_appends else self._next_seq - 1
+            self._cond.notify_all()
+
+        self._acked_since_compact += len(acks)
+        if self._acked_since_compact >= self.compact_every:
+            self._compact()
+
+    @staticmethod
+    def _dumps(seq: int, meta: Dict[Any, Any]) -> str:
+        try:
+            return json.dumps(meta, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            # 元数据中混入了无法序列化的对象，转为字符串保存，避免整批提交反复失败
+            logger.error(f"消息 {seq} 的元数据无法序列化，已转为字符串保存: {str(e)}")
+            return json.dumps(meta, ensure_ascii=False, default=str)
+
+    def _compact(self):
+        """回收已确认消息占用的空间"""
+        self._acked_since_compact = 0
+        try:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("PRAGMA incremental_vacuum")
+        except sqlite3.Error as e:
+            logger.warning(f"压缩消息日志失败: {str(e)}")
@@ -1,13 +1,118 @@
+import atexit
 import functools
 import logging
 import os
+import queue
+import random
 import sys
 import time
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from typing import Callable, Optional
 
-from config.settings import LOG_DIR, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT, LOG_FORMAT, LOG_LEVEL
+from config.settings import (
+    LOG_DIR,
+    LOG_FILE_MAX_BYTES,
+    LOG_FILE_BACKUP_COUNT,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_ASYNC,
+    LOG_MAX_MESSAGE_CHARS,
+    LOG_PAYLOAD_SAMPLE_RATE,
+    LOG_PAYLOAD_MAX_CHARS
+)
+
+
+class DailyRotatingFileHandler(RotatingFileHandler):
+    """按日期切换日志文件(emby_bot_YYYY-MM-DD.log)，同一天内按大小滚动"""
+
+    def __init__(self, directory: str, prefix: str = "emby_bot", **kwargs):
+        self.directory = directory
+        self.prefix = prefix
+        self.current_date = datetime.now().strftime("%Y-%m-%d")
+        super().__init__(self._filename(self.current_date), **kwargs)
+
+    def _filename(self, date: str) -> str:
+        return os.path.abspath(os.path.join(self.directory, f"{self.prefix}_{date}.log"))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        date = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d")
+        if date != self.current_date:
+            # 跨天后切换到新日期的日志文件
+            self.current_date = date
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = self._filename(date)
+        super().emit(record)
+
+
+class TruncatingFilter(logging.Filter):
+    """截断过长的日志消息"""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.max_chars > 0:
+            message = record.getMessage()
+            if len(message) > self.max_chars:
+                record.msg = f"{message[:self.max_chars]}...(已截断，共 {len(message)} 字符)"
+                record.args = None
+        return True
+
+
+class LazyPayload:
+    """延迟解码和截断的请求体，只有在日志真正输出时才会转换为字符串"""
+    __slots__ = ('data', 'limit')
+
+    def __init__(self, data: bytes, limit: int = LOG_PAYLOAD_MAX_CHARS):
+        self.data = data
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = self.data[:self.limit * 4].decode('utf-8', errors='replace')
+        if len(text) > self.limit or len(self.data) > self.limit * 4:
+            return f"{text[:self.limit]}...(共 {len(self.data)} 字节)"
+        return text
+
+
+# 仅用于在调用线程中把异常信息格式化为文本
+_exception_formatter = logging.Formatter()
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    将日志记录放入队列，消息格式化尽量推迟到监听线程中进行
+
+    标准 QueueHandler 会在调用线程中格式化消息，这里只在参数全部为不可变标量
+    (str/int/float/bool/None/bytes 及 LazyPayload)时跳过该步骤以降低热路径开销；
+    其他参数(dict、list、对象等)可能在入队后被修改，因此仍在调用线程中格式化。
+    异常信息同样在调用线程中格式化为 exc_text，并清除 exc_info，避免队列中的记录
+    持有 traceback 及其引用的栈帧。
+    """
+
+    IMMUTABLE_ARG_TYPES = (str, int, float, bool, type(None), bytes, LazyPayload)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple)
+                         and all(isinstance(arg, self.IMMUTABLE_ARG_TYPES) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def should_log_payload(logger: logging.Logger) -> bool:
+    """DEBUG 级别下记录全部请求体，否则按 LOG_PAYLOAD_SAMPLE_RATE 抽样记录"""
+    if logger.isEnabledFor(logging.DEBUG):
+        return True
+    return LOG_PAYLOAD_SAMPLE_RATE > 0 and random.random() < LOG_PAYLOAD_SAMPLE_RATE
 
 
 class Logger:
@@ -21,29 +126,27 @@ class Logger:
     def __init__(self):
         if not hasattr(self, 'initialized'):
             self.initialized = True
+            self.listener = None
             self.setup_logger()
 
-    def setup_logger(self, log_level: int = getattr(logging, LOG_LEVEL)):
+    def setup_logger(self, log_level: int = getattr(logging, LOG_LEVEL), use_queue: bool = LOG_ASYNC):
         """设置日志配置"""
         # 创建logs目录
         if not os.path.exists(LOG_DIR):
             os.makedirs(LOG_DIR)
 
-        # 生成日志文件名
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        log_file = os.path.join(LOG_DIR, f"emby_bot_{current_date}.log")
-
         # 创建logger
         self.logger = logging.getLogger('EmbyBot')
         self.logger.setLevel(log_level)
 
         # 清除现有的处理器
+        self.stop()
         if self.logger.handlers:
             self.logger.handlers.clear()
 
-        # 创建文件处理器
-        file_handler = RotatingFileHandler(
-            log_file,
+        # 创建文件处理器，文件名随日期切换
+        file_handler = DailyRotatingFileHandler(
+            LOG_DIR,
             maxBytes=LOG_FILE_MAX_BYTES,
             backupCount=LOG_FILE_BACKUP_COUNT,
             encoding='utf-8'
@@ -56,18 +159,41 @@ class Logger:
 
         # 设置日志格式
         formatter = logging.Formatter(LOG_FORMAT)
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-
-        # 添加处理器
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        truncating_filter = TruncatingFilter(LOG_MAX_MESSAGE_CHARS)
+        for handler in (file_handler, console_handler):
+            handler.setFormatter(formatter)
+            handler.addFilter(truncating_filter)
+
+        if use_queue:
+            # 所有格式化和 I/O 都在监听线程中完成，调用方只做一次入队
+            log_queue = queue.SimpleQueue()
+            self.listener = QueueListener(
+                log_queue, file_handler, console_handler, respect_handler_level=True
+            )
+            self.listener.start()
+            self.logger.addHandler(LazyQueueHandler(log_queue))
+        else:
+            # 添加处理器
+            self.logger.addHandler(file_handler)
+            self.logger.addHandler(console_handler)
+
+    def stop(self):
+        """停止日志监听线程并写入剩余日志"""
+        if self.listener:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
 
     def get_logger(self) -> logging.Logger:
         """获取logger实例"""
         return self.logger
 
 
+# 进程退出时写入队列中剩余的日志
+atexit.register(lambda: Logger._instance and Logger._instance.stop())
+
+
 # 创建装饰器
 def log_decorator(level: str = 'info', message: Optional[str] = None):
     """
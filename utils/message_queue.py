@@ -1,92 +1,715 @@
 import asyncio
 import json
-import random
-from collections import deque
-from typing import Dict, Any
+from collections import defaultdict, deque
+from typing import Dict, Any, Hashable, List, Optional
 from datetime import datetime
 
+from config.settings import (
+    QUEUE_JOURNAL_ENABLED,
+    QUEUE_JOURNAL_FILE,
+    QUEUE_GROUP_COMMIT_MS,
+    QUEUE_COMPACT_EVERY,
+    QUEUE_RENDER_CONCURRENCY,
+    QUEUE_BATCH_WINDOW_MS,
+    QUEUE_BATCH_SIZE,
+    QUEUE_MEMORY_LIMIT,
+    QUEUE_LANE_LIMIT,
+    QUEUE_IMAGE_BYTES_LIMIT,
+    QUEUE_SPILL_FILE,
+    QUEUE_HIGH_WATERMARK,
+    QUEUE_LOW_WATERMARK,
+    QUEUE_PRIORITY_TYPES,
+    QUEUE_RETRY_MAX_ATTEMPTS,
+    QUEUE_RETRY_BASE_DELAY,
+    QUEUE_RETRY_MAX_DELAY,
+    DEAD_LETTER_DB_FILE,
+    DIGEST_MODE,
+    DIGEST_RATE_THRESHOLD,
+    DIGEST_WINDOW,
+    DIGEST_MIN_ITEMS,
+    DIGEST_MAX_ITEMS,
+    DIGEST_GROUP_BY,
+    NOTIFICATION_ROUTES,
+    WEBHOOK_CHANNEL_ID
+)
+from utils.dead_letters import DeadLetterStore
+from utils.delivery import DeliveryError, PERMANENT, THROTTLED, TRANSIENT
+from utils.digest import DigestPolicy
+from utils.journal import MessageJournal
 from utils.logger import Logger
+from utils.routing import NotificationRouter
 
 logger = Logger().get_logger()
 
+# 优先级，数值越小越先处理
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_RETRY = 3
+PRIORITIES = {'high': PRIORITY_HIGH, 'normal': PRIORITY_NORMAL, 'low': PRIORITY_LOW, 'retry': PRIORITY_RETRY}
+
+
+class _DestinationLane:
+    """单个目标的待发送消息和 worker"""
+
+    __slots__ = ('messages', 'parked', 'cond', 'task', 'inflight')
 
-class MessageQueue:
-    """消息队列系统，用于解耦 webhook 接收和 Telegram 消息发送"""
-    
     def __init__(self):
-        self.queue = deque()
-        self._lock = asyncio.Lock()
-        self._worker_task = None
+        self.messages: deque = deque()
+        # 目标队列已满时暂存的后续消息，worker 取走消息后按顺序补入 messages
+        self.parked: deque = deque()
+        # 正在发送的一批消息
+        self.inflight: list = []
+        self.cond = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class MessageQueue:
+    """
+    消息队列系统，用于解耦 webhook 接收和 Telegram 消息发送
+
+    事件先进入接收队列，由分发任务构建一次通知(媒体库查询、图片、说明文字)，
+    再按路由表放入各个目标的队列，多个目标共享同一份通知。
+    每个目标有独立的 worker 按顺序发送，并使用该聊天自己的速率限制，一个目标变慢或被限速不影响其他目标。
+    worker 取到消息后会在 batch_window 内继续收集同一目标的消息，合并为一批发送(最多 batch_size 条)。
+    事件在所有目标都处理完成后才在持久化日志中确认。
+
+    接收队列按优先级(high/normal/low/retry)分开排队，分发时先处理高优先级的事件。
+    内存中最多保留 memory_limit 个待处理事件，超出部分只在内存中保留序号，
+    内容留在持久化日志(未启用日志时写入溢出文件)中，轮到时再读回。
+    目标队列达到 lane_limit 后，该目标的后续消息暂存在内存中，其他目标照常分发；
+    所有目标暂存的消息达到 memory_limit 时才暂停分发。已构建的通知在图片上传前持有下载的图片数据，
+    已分发、尚未发送完的消息持有的图片数据达到 image_bytes_limit 时同样暂停分发。
+    积压超过高水位后 accepting() 返回 False，
+    降到低水位以下才恢复，由 /webhook 决定是否返回 503。
+
+    发送失败按类型处理: 永久失败直接进入死信存储；临时故障和限速在后台定时重试，不阻塞目标的 worker，
+    到期后以 retry 优先级重新入队，只发送到失败的目标，超过 retry_max_attempts 次后进入死信存储。
+
+    汇总模式(见 utils.digest)开启时，worker 改为在 digest.window 内收集最多 digest.max_items 条消息，
+    同一剧集/文件夹/媒体库的多条通知合并为一条汇总消息发送，组内每条消息仍按自己的结果确认或重试。
+    """
+
+    def __init__(self, webhook_handler=None, journal: Optional[MessageJournal] = None,
+                 router: Optional[NotificationRouter] = None,
+                 render_concurrency: int = QUEUE_RENDER_CONCURRENCY,
+                 batch_window: float = QUEUE_BATCH_WINDOW_MS / 1000, batch_size: int = QUEUE_BATCH_SIZE,
+                 memory_limit: int = QUEUE_MEMORY_LIMIT, lane_limit: int = QUEUE_LANE_LIMIT,
+                 image_bytes_limit: int = QUEUE_IMAGE_BYTES_LIMIT,
+                 high_watermark: int = QUEUE_HIGH_WATERMARK, low_watermark: int = QUEUE_LOW_WATERMARK,
+                 spill_file: Optional[str] = QUEUE_SPILL_FILE,
+                 retry_max_attempts: int = QUEUE_RETRY_MAX_ATTEMPTS,
+                 retry_base_delay: float = QUEUE_RETRY_BASE_DELAY, retry_max_delay: float = QUEUE_RETRY_MAX_DELAY,
+                 dead_letters: Optional[DeadLetterStore] = None, digest: Optional[DigestPolicy] = None):
+        self.webhook_handler = webhook_handler
+        self.render_concurrency = max(1, render_concurrency)
+        self.batch_window = batch_window
+        self.batch_size = max(1, batch_size)
+        self.memory_limit = max(1, memory_limit)
+        self.lane_limit = max(1, lane_limit)
+        self.image_bytes_limit = max(1, image_bytes_limit)
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.spill_file = spill_file
+        self.retry_max_attempts = max(1, retry_max_attempts)
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.dead_letters = dead_letters or DeadLetterStore(DEAD_LETTER_DB_FILE)
+        self.digest = digest or DigestPolicy(
+            DIGEST_MODE, threshold=DIGEST_RATE_THRESHOLD, window=DIGEST_WINDOW, min_items=DIGEST_MIN_ITEMS,
+            max_items=DIGEST_MAX_ITEMS, group_by=DIGEST_GROUP_BY
+        )
+        # 失败类型 -> 次数，以及进入后台重试和死信存储的消息数
+        self.failure_stats = defaultdict(int)
+        # 等待中的后台重试: 定时器 -> 重试消息
+        self._retry_timers: Dict[asyncio.TimerHandle, Dict[Any, Any]] = {}
+        self._retry_tasks = set()
+        self.router = router or NotificationRouter.from_config(NOTIFICATION_ROUTES, WEBHOOK_CHANNEL_ID)
+        # 合并统计
+        self.batch_stats = {'batches': 0, 'messages': 0, 'max_batch_size': 0}
+        # 等待构建通知的事件，每个优先级一个队列，元素为消息或溢出到磁盘的消息序号
+        self._incoming: List[deque] = [deque() for _ in PRIORITIES]
+        self._in_memory = 0
+        self._spilled = 0
+        self.spill_stats = {'spilled': 0, 'loaded': 0}
+        self._accepting = True
+        # 目标 -> 该目标的待发送消息和 worker
+        self._lanes: Dict[Hashable, _DestinationLane] = {}
+        # 接收队列和各目标队列中的消息总数
+        self._size = 0
+        self._cond = asyncio.Condition()
+        self._dispatch_task: Optional[asyncio.Task] = None
+        self._lane_space = asyncio.Event()
+        # 各目标暂存(超出 lane_limit)的消息总数
+        self._parked = 0
+        # 已分发、尚未在所有目标上处理完的消息持有的图片数据字节数
+        self._image_bytes = 0
+        # 分发任务已从接收队列取出、尚未放入目标队列的事件
+        self._dispatching: deque = deque()
         self._running = False
-        
+        # 停止前排空队列时不再等待合并窗口
+        self._flushing = False
+
+        # 持久化日志，进程重启或崩溃后可以恢复未发送的消息
+        if journal is None and QUEUE_JOURNAL_ENABLED:
+            journal = MessageJournal(
+                QUEUE_JOURNAL_FILE,
+                group_commit_interval=QUEUE_GROUP_COMMIT_MS / 1000,
+                compact_every=QUEUE_COMPACT_EVERY
+            )
+        self.journal = journal
+        # 未启用日志时用于溢出的临时存储，在 start_processing 中打开
+        self._spill: Optional[MessageJournal] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def image_bytes(self) -> int:
+        """已分发、尚未发送完的消息持有的图片数据字节数"""
+        return self._image_bytes
+
+    def spilled(self) -> int:
+        """溢出到磁盘、等待读回的事件数"""
+        return self._spilled
+
+    def accepting(self) -> bool:
+        """积压是否低于水位线(带滞回，超过高水位后要降到低水位以下才恢复)"""
+        if self._accepting and self._size >= self.high_watermark:
+            self._accepting = False
+            logger.warning(f"消息队列积压 {self._size} 条，超过高水位 {self.high_watermark}，暂停接收新事件")
+        elif not self._accepting and self._size <= self.low_watermark:
+            self._accepting = True
+            logger.info(f"消息队列积压降到 {self._size} 条，恢复接收新事件")
+        return self._accepting
+
+    @staticmethod
+    def priority_for(message_data: Dict[Any, Any]) -> int:
+        """重试的消息排在最后，其余按条目类型决定优先级"""
+        if message_data.get('retry'):
+            return PRIORITY_RETRY
+        webhook = message_data.get('webhook')
+        item_type = webhook.Item.Type if webhook is not None and webhook.Item else None
+        return PRIORITIES.get(QUEUE_PRIORITY_TYPES.get(item_type, 'normal'), PRIORITY_NORMAL)
+
+    def depths(self) -> Dict[str, int]:
+        """各目标队列中待发送的消息数"""
+        return {str(destination): len(lane.messages) + len(lane.parked)
+                for destination, lane in list(self._lanes.items())}
+
+    def oldest_age(self) -> float:
+        """队列中最早一条待发送消息已等待的秒数"""
+        oldest = None
+        queues = self._incoming + [lane.messages for lane in list(self._lanes.values())]
+        for queue in queues:
+            # 已溢出的消息只有序号，按仍在内存中的消息估算
+            if queue and isinstance(queue[0], dict) and 'queued_at' in queue[0]:
+                queued_at = queue[0]['queued_at']
+                if oldest is None or queued_at < oldest:
+                    oldest = queued_at
+        if oldest is None:
+            return 0.0
+        return max(0.0, (datetime.now() - datetime.fromisoformat(oldest)).total_seconds())
+
     async def add_message(self, message_data: Dict[Any, Any]) -> None:
-        """添加消息到队列"""
-        async with self._lock:
+        """
+        添加消息到队列
+
+        消息中指定 destination 时只发送到该目标，否则按路由表分发
+        """
+        async with self._cond:
             # 添加时间戳
             message_data['queued_at'] = datetime.now().isoformat()
-            self.queue.append(message_data)
-            logger.info(f"消息已添加到队列，当前队列长度: {len(self.queue)}")
-            
+            priority = message_data['priority'] = self.priority_for(message_data)
+            if 'retry' not in message_data and 'destination' not in message_data:
+                # 只统计新到达的事件，重试和重新投递的死信不计入
+                self.digest.record_arrival()
+            # 内存中的事件数达到上限时溢出到磁盘
+            spill = self._in_memory >= self.memory_limit and (self.journal or self._spill)
+            # 写入日志和溢出文件的是解析时保留的原始请求体
+            raw = message_data['webhook'].raw
+            if self.journal and 'journal_id' not in message_data:
+                # 只写入内存缓冲区，由后台线程组提交，不阻塞 webhook 请求；到期的重试在安排时已写入
+                message_data['journal_id'] = self.journal.append(self._journal_meta(message_data), raw)
+            if spill:
+                # 日志中已有完整内容，内存中只保留序号
+                seq = message_data['journal_id'] if self.journal else \
+                    self._spill.append(self._journal_meta(message_data), raw)
+                self._incoming[priority].append(seq)
+                self._spilled += 1
+                self.spill_stats['spilled'] += 1
+            else:
+                self._incoming[priority].append(message_data)
+                self._in_memory += 1
+            self._size += 1
+            self._cond.notify()
+            logger.info("消息已添加到队列，当前队列长度: %d", self._size)
+
     async def start_processing(self):
         """启动后台处理任务"""
         if not self._running:
+            if self.webhook_handler is None:
+                from handlers.webhook_handler import WebhookHandler
+                self.webhook_handler = WebhookHandler()
+            if self.journal:
+                # 重放上次未处理完的消息，超过内存上限的部分只读取序号
+                for seq, meta, payload in self.journal.open(preload=self.memory_limit):
+                    priority = meta.get('priority', PRIORITY_NORMAL)
+                    if payload is None:
+                        self._incoming[priority].append(seq)
+                        self._spilled += 1
+                    else:
+                        message_data = self._restore_message(seq, meta, payload)
+                        if not message_data:
+                            continue
+                        self._incoming[priority].append(message_data)
+                        self._in_memory += 1
+                    self._size += 1
+            elif self.spill_file and self._spill is None:
+                self._spill = MessageJournal(
+                    self.spill_file,
+                    group_commit_interval=QUEUE_GROUP_COMMIT_MS / 1000,
+                    compact_every=QUEUE_COMPACT_EVERY,
+                    synchronous="OFF"
+                )
+                # 上次停止时保存的消息和尚未读回的溢出消息继续发送
+                for seq, meta, _ in self._spill.open(preload=0):
+                    self._incoming[meta.get('priority', PRIORITY_NORMAL)].append(seq)
+                    self._spilled += 1
+                    self._size += 1
+            self.dead_letters.open()
             self._running = True
-            self._worker_task = asyncio.create_task(self._process_queue())
-            logger.info("消息队列处理器已启动")
-            
+            self._flushing = False
+            self._dispatch_task = asyncio.create_task(self._dispatch(), name="message-queue-dispatcher")
+            logger.info(f"消息队列处理器已启动，路由目标: {', '.join(r.chat_id for r in self.router.routes)}")
+
+    @property
+    def pending_retries(self) -> int:
+        """等待中的后台重试数"""
+        return len(self._retry_timers) + len(self._retry_tasks)
+
+    def idle(self) -> bool:
+        """接收队列、分发中和各目标队列都没有待发送的消息(不含等待中的后台重试)"""
+        return not self._size and not self._dispatching and not any(lane.inflight for lane in self._lanes.values())
+
+    async def drain(self, timeout: float, force: Optional[asyncio.Event] = None) -> bool:
+        """
+        停止前等待队列中的消息发送完毕，超时或 force 被设置时返回 False
+
+        剩余的消息在 stop_processing 中保留: 启用日志时留在日志中，否则写入溢出文件，下次启动时继续发送
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self._flushing = True
+        # 唤醒正在合并窗口内等待的 worker，立即发送已收集的消息
+        for lane in list(self._lanes.values()):
+            async with lane.cond:
+                lane.cond.notify_all()
+        if not self.idle():
+            logger.info(f"等待消息队列发送剩余的 {self._size} 条消息，最多 {timeout:.0f} 秒")
+        while not self.idle():
+            if loop.time() >= deadline or (force is not None and force.is_set()):
+                logger.warning(f"消息队列未能在截止时间内排空，剩余 {self._size} 条消息将在下次启动时继续发送")
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
     async def stop_processing(self):
         """停止后台处理任务"""
         self._running = False
-        if self._worker_task:
-            self._worker_task.cancel()
-            try:
-                await self._worker_task
-            except asyncio.CancelledError:
-                pass
+        # 等待中的重试在安排时已按目标写入日志(未启用日志时写入溢出文件)，下次启动时只发往失败的目标
+        for timer in self._retry_timers:
+            timer.cancel()
+        for task in self._retry_tasks:
+            task.cancel()
+        tasks = [lane.task for lane in self._lanes.values() if lane.task]
+        if self._dispatch_task:
+            tasks.append(self._dispatch_task)
+            self._dispatch_task = None
+        if tasks:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for lane in self._lanes.values():
+                lane.task = None
             logger.info("消息队列处理器已停止")
-            
-    async def _process_queue(self):
-        """后台处理队列中的消息"""
-        from handlers.webhook_handler import WebhookHandler
-        
-        webhook_handler = WebhookHandler()
-        
+        if self._spill:
+            self._persist_remaining()
+        self._retry_timers.clear()
+        if self.journal:
+            self._split_remaining()
+            # 未处理的消息保留在日志中，下次启动时重放
+            self.journal.close()
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+        self.dead_letters.close()
+
+    def _persist_remaining(self) -> None:
+        """未启用日志时，把尚未发送的消息写入溢出文件(已溢出的消息本来就在文件中)"""
+        remaining = [(entry, None) for queue in self._incoming for entry in queue if isinstance(entry, dict)]
+        remaining.extend((message_data, None) for message_data in self._dispatching)
+        for destination, lane in self._lanes.items():
+            # 只保存该目标尚未发送的部分，其他目标已发送的不再重复
+            remaining.extend((message_data, destination) for message_data in lane.inflight)
+            remaining.extend((message_data, destination) for message_data in lane.messages)
+            remaining.extend((message_data, destination) for message_data in lane.parked)
+        remaining.extend((retry, retry['destination']) for retry in self._retry_timers.values())
+        for message_data, destination in remaining:
+            meta = self._journal_meta(message_data)
+            if destination is not None:
+                meta['destination'] = destination
+            self._spill.append(meta, message_data['webhook'].raw)
+        if remaining:
+            logger.info(f"已将 {len(remaining)} 条未发送的消息保存到溢出文件，下次启动时继续发送")
+        for queue in self._incoming:
+            queue.clear()
+        self._dispatching.clear()
+        for lane in self._lanes.values():
+            lane.inflight = []
+            lane.messages.clear()
+            lane.parked.clear()
+        self._size = self._in_memory = self._spilled = self._parked = self._image_bytes = 0
+
+    def _split_remaining(self) -> None:
+        """
+        启用日志时，已分发但尚未发送完的消息按目标重新写入日志，再确认原消息
+
+        原消息在日志中没有目标，重放时会发往所有目标，已发送过的聊天会收到重复消息
+        """
+        originals = {}
+        count = 0
+        for destination, lane in self._lanes.items():
+            for message_data in (*lane.inflight, *lane.messages, *lane.parked):
+                if 'journal_id' not in message_data or message_data.get('destination'):
+                    # 只发往单个目标的消息(重试、重新投递)本来就记录了目标
+                    continue
+                meta = self._journal_meta(message_data)
+                meta['destination'] = destination
+                self.journal.append(meta, message_data['webhook'].raw)
+                originals[id(message_data)] = message_data
+                count += 1
+        for message_data in originals.values():
+            self._ack(message_data)
+        if count:
+            logger.info(f"已将 {count} 条未发送的消息按目标保存到日志，下次启动时继续发送")
+
+    async def _dispatch(self):
+        """构建通知并按路由分发到各目标队列"""
         while self._running:
-            try:
-                # 检查队列是否有消息
-                async with self._lock:
-                    if self.queue:
-                        message_data = self.queue.popleft()
-                    else:
-                        message_data = None
-                        
-                if message_data:
-                    logger.info(f"处理队列中的消息，剩余队列长度: {len(self.queue)}")
-                    # 处理消息
-                    await self._process_message(webhook_handler, message_data)
-                    
-                    # 添加随机3-20秒延迟
-                    delay = random.uniform(3, 20)
-                    logger.info(f"消息发送完成，等待 {delay:.2f} 秒后继续处理下一条消息")
-                    await asyncio.sleep(delay)
+            # 目标队列已满只暂存该目标的消息；暂存的消息过多或持有的图片数据过多时暂停分发，
+            # 新事件留在接收队列(必要时溢出到磁盘)。一轮最多构建 render_concurrency 个事件，超出量以此为界
+            while self._parked >= self.memory_limit or self._image_bytes >= self.image_bytes_limit:
+                self._lane_space.clear()
+                await self._lane_space.wait()
+
+            # 等待直到有新事件，期间不占用 CPU；按优先级取出一轮事件
+            async with self._cond:
+                await self._cond.wait_for(lambda: any(self._incoming))
+                entries = []
+                for queue in self._incoming:
+                    while queue and len(entries) < self.render_concurrency:
+                        entries.append(queue.popleft())
+                self._size -= len(entries)
+                # 计入分发中的事件，排空队列时等待它们(溢出的序号在读回前仍保存在磁盘上)
+                self._dispatching = deque(entries)
+            events = await self._load_spilled(entries)
+            self._dispatching = deque(events)
+
+            # 同一轮的事件并发构建(媒体库查询、图片下载)，再按到达顺序分发，保证各目标内的顺序
+            results = await asyncio.gather(*map(self._build, events), return_exceptions=True)
+            for message_data, notification in zip(events, results):
+                try:
+                    await self._route(message_data, notification)
+                except Exception as e:
+                    # 一条事件出错不能让分发任务退出，否则所有目标都停止发送
+                    logger.exception(f"分发消息时发生错误: {str(e)}")
+                    if 'pending' not in message_data:
+                        await self._dead_letter_event(message_data, e)
+                self._dispatching.popleft()
+
+    async def _route(self, message_data: Dict[Any, Any], notification) -> None:
+        """按路由表把构建好的通知放入各目标队列"""
+        if isinstance(notification, Exception):
+            logger.error(f"构建通知时发生错误: {str(notification)}")
+            await self._dead_letter_event(message_data, notification)
+            return
+        if notification is None:
+            self._ack(message_data)
+            return
+
+        if message_data.get('destination'):
+            destinations = [message_data['destination']]
+        else:
+            # 按补全后的条目路由
+            item = notification.get('item') or message_data['webhook'].Item
+            destinations = self.router.destinations(item, notification['library'])
+        if not destinations:
+            logger.debug("事件没有匹配的路由，已跳过")
+            self._ack(message_data)
+            return
+
+        message_data['notification'] = notification
+        message_data['pending'] = len(destinations)
+        # 图片数据在上传后才释放，按消息计入一次(多个目标共享同一份通知)
+        photo = notification.get('photo')
+        if photo is not None and photo.data is not None:
+            message_data['image_bytes'] = len(photo.data)
+            self._image_bytes += message_data['image_bytes']
+        for destination in destinations:
+            await self._push(destination, message_data)
+
+    async def _dead_letter_event(self, message_data: Dict[Any, Any], error: Exception) -> None:
+        """无法构建或路由的事件写入死信存储后确认，修复后可通过 redrive 重新投递"""
+        self.failure_stats['dead_lettered'] += 1
+        meta = self._journal_meta(message_data)
+        meta.pop('retry', None)
+        # 没有指定目标时留空，重新投递时按路由表分发
+        destination = message_data.get('destination') or ''
+        await asyncio.to_thread(
+            self.dead_letters.add, destination, PERMANENT, str(error) or type(error).__name__,
+            message_data.get('retry', 0) + 1, meta, message_data['webhook'].raw
+        )
+        self._ack(message_data)
+
+    async def _build(self, message_data: Dict[Any, Any]):
+        """构建通知，重试的消息直接使用之前构建好的通知"""
+        if message_data.get('notification'):
+            return message_data['notification']
+        return await self.webhook_handler.build_notification(message_data['webhook'])
+
+    async def _load_spilled(self, entries: list) -> list:
+        """从磁盘读回已溢出的消息，保持原有顺序"""
+        seqs = [entry for entry in entries if not isinstance(entry, dict)]
+        self._in_memory -= len(entries) - len(seqs)
+        if not seqs:
+            return entries
+        self._spilled -= len(seqs)
+        store = self.journal or self._spill
+        restored = {}
+        try:
+            rows = await asyncio.to_thread(store.load, seqs)
+        except Exception as e:
+            logger.error(f"读取溢出的消息失败: {str(e)}")
+            rows = []
+        for seq, meta, payload in rows:
+            message_data = self._restore_message(seq, meta, payload, store)
+            if message_data:
+                restored[seq] = message_data
+        if store is self._spill:
+            # 溢出文件只是临时存储，读回后即可删除
+            for seq in seqs:
+                store.ack(seq)
+        if len(restored) < len(seqs):
+            logger.error(f"有 {len(seqs) - len(restored)} 条溢出的消息无法读回，已跳过")
+        self.spill_stats['loaded'] += len(restored)
+        return [entry if isinstance(entry, dict) else restored[entry]
+                for entry in entries if isinstance(entry, dict) or entry in restored]
+
+    async def _push(self, destination: Hashable, message_data: Dict[Any, Any]) -> None:
+        """将消息放入目标队列，目标第一次出现时启动它的 worker"""
+        lane = self._lanes.get(destination)
+        if lane is None:
+            lane = self._lanes[destination] = _DestinationLane()
+        if lane.task is None and self._running:
+            lane.task = asyncio.create_task(
+                self._process_lane(destination, lane), name=f"message-queue-{destination}"
+            )
+        async with lane.cond:
+            if lane.parked or len(lane.messages) >= self.lane_limit:
+                # 目标队列已满，暂存消息，不阻塞其他目标的分发
+                lane.parked.append(message_data)
+                self._parked += 1
+            else:
+                lane.messages.append(message_data)
+            self._size += 1
+            lane.cond.notify()
+
+    async def _process_lane(self, destination: Hashable, lane: _DestinationLane):
+        """按顺序发送单个目标的消息"""
+        while self._running:
+            async with lane.cond:
+                await lane.cond.wait_for(lambda: lane.messages)
+                digest = self.digest.active(self._size)
+                if digest:
+                    batch = await self._collect_batch(lane, self.digest.window, self.digest.max_items)
                 else:
-                    # 如果队列为空，短暂休眠
-                    await asyncio.sleep(0.1)
-                    
+                    batch = await self._collect_batch(lane, self.batch_window, self.batch_size)
+            # [(要发送的通知, 对应的消息)]，汇总消息对应组内的所有消息
+            units = self._compose_digests(batch) if digest else \
+                [(message_data['notification'], [message_data]) for message_data in batch]
+            try:
+                logger.info("向 %s 发送 %d 条消息(%d 个事件)，剩余队列长度: %d",
+                            destination, len(units), len(batch), self._size)
+                # 发送节奏由 WebhookHandler 中该聊天的速率调度器控制，无需固定延迟；
+                # 临时故障不在这里退避，由队列在后台重试
+                failures = await self.webhook_handler.send_notifications(
+                    [notification for notification, _ in units], destination, retry_transient=False
+                )
+                failed = {id(notification): error for notification, error in failures}
             except Exception as e:
                 logger.error(f"处理队列消息时发生错误: {str(e)}")
-                await asyncio.sleep(1)  # 发生错误时短暂休眠
-                
-    async def _process_message(self, webhook_handler, message_data):
-        """处理单个消息"""
+                error = DeliveryError(TRANSIENT, str(e))
+                failed = {id(notification): error for notification, _ in units}
+            for notification, members in units:
+                error = failed.get(id(notification))
+                for message_data in members:
+                    if error is None:
+                        self._delivered(message_data)
+                    else:
+                        await self._failed(message_data, destination, error)
+            lane.inflight = []
+
+    def _compose_digests(self, batch: list) -> list:
+        """按汇总分组合并一批消息，不足 min_items 的组仍逐条发送"""
+        units = []
+        for title, members in self.digest.group(batch):
+            if title is None:
+                units.append((members[0]['notification'], members))
+                continue
+            notification = self.webhook_handler.build_digest(
+                title, [(message_data['webhook'], message_data['notification']) for message_data in members]
+            )
+            units.append((notification, members))
+            self.digest.stats['digests'] += 1
+            self.digest.stats['digested'] += len(members)
+        return units
+
+    async def _failed(self, message_data: Dict[Any, Any], destination: Hashable, error: DeliveryError) -> None:
+        """发送失败: 永久失败或重试次数耗尽时写入死信存储，否则在后台定时重试"""
+        self.failure_stats[error.kind] += 1
+        attempts = message_data.get('retry', 0) + 1
+        if error.kind == PERMANENT or attempts >= self.retry_max_attempts:
+            logger.error(f"发往 {destination} 的消息失败 {attempts} 次，已移入死信存储: {error}")
+            self.failure_stats['dead_lettered'] += 1
+            meta = self._journal_meta(message_data)
+            meta.pop('retry', None)
+            meta['destination'] = destination
+            payload = message_data['webhook'].raw
+            await asyncio.to_thread(
+                self.dead_letters.add, destination, error.kind, str(error), attempts, meta, payload
+            )
+            self._delivered(message_data)
+            return
+
+        if error.kind == THROTTLED and error.retry_after:
+            delay = error.retry_after
+        else:
+            delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1))
+        logger.warning(f"发往 {destination} 的消息第 {attempts} 次发送失败，{delay:.0f} 秒后重试: {error}")
+        self.failure_stats['retried'] += 1
+        retry = {
+            'webhook': message_data['webhook'],
+            'event_type': message_data.get('event_type'),
+            'destination': destination,
+            'retry': attempts,
+            'last_error': str(error),
+            'notification': message_data['notification'],
+            'priority': PRIORITY_RETRY,
+        }
+        if self.journal:
+            # 重试只发往失败的目标，先按目标写入日志，停止或崩溃后重放时不会再发往其他目标
+            retry['journal_id'] = self.journal.append(self._journal_meta(retry), retry['webhook'].raw)
+        # 原消息在该目标上的处理转交给重试
+        self._delivered(message_data)
+        loop = asyncio.get_running_loop()
+
+        def fire():
+            self._retry_timers.pop(timer, None)
+            task = loop.create_task(self.add_message(retry))
+            self._retry_tasks.add(task)
+            task.add_done_callback(self._retry_tasks.discard)
+
+        timer = loop.call_later(delay, fire)
+        self._retry_timers[timer] = retry
+
+    async def redrive(self, ids: Optional[List[int]] = None, limit: Optional[int] = None) -> int:
+        """将死信重新放入队列(重试次数清零)，返回重新投递的条数"""
+        from models.projection import WebhookView
+
+        count = 0
+        for destination, meta, payload in await asyncio.to_thread(self.dead_letters.take, ids, limit):
+            try:
+                webhook = WebhookView.parse(payload)
+            except Exception as e:
+                logger.error(f"死信中的消息无法解析，已丢弃: {str(e)}")
+                continue
+            message_data = {k: v for k, v in meta.items() if k not in ('priority', 'queued_at', 'last_error')}
+            message_data['webhook'] = webhook
+            message_data['destination'] = destination
+            await self.add_message(message_data)
+            count += 1
+        if count:
+            logger.info(f"已重新投递 {count} 条死信")
+        return count
+
+    async def _collect_batch(self, lane: _DestinationLane, window: float, size: int) -> list:
+        """在 window 秒内收集同一目标的后续消息，最多 size 条(调用方持有 lane.cond)"""
+        # 收集中的消息同样计入正在发送，排空和保存队列时不会遗漏
+        batch = lane.inflight = [lane.messages.popleft()]
+        self._size -= 1
+        self._unpark(lane)
+        if size > 1:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + window
+            while True:
+                while lane.messages and len(batch) < size:
+                    batch.append(lane.messages.popleft())
+                    self._size -= 1
+                    self._unpark(lane)
+                remaining = deadline - loop.time()
+                if len(batch) >= size or remaining <= 0 or self._flushing:
+                    break
+                try:
+                    await asyncio.wait_for(lane.cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+        self.batch_stats['batches'] += 1
+        self.batch_stats['messages'] += len(batch)
+        self.batch_stats['max_batch_size'] = max(self.batch_stats['max_batch_size'], len(batch))
+        return batch
+
+    def _unpark(self, lane: _DestinationLane) -> None:
+        """目标队列有空位时按顺序补入暂存的消息"""
+        while lane.parked and len(lane.messages) < self.lane_limit:
+            lane.messages.append(lane.parked.popleft())
+            self._parked -= 1
+            self._lane_space.set()
+
+    def _delivered(self, message_data: Dict[Any, Any]) -> None:
+        """一个目标处理完成，所有目标都完成后确认消息"""
+        message_data['pending'] -= 1
+        if message_data['pending'] <= 0:
+            message_data.pop('notification', None)
+            if message_data.get('image_bytes'):
+                self._image_bytes -= message_data.pop('image_bytes')
+                self._lane_space.set()
+            self._ack(message_data)
+
+    @staticmethod
+    def _journal_meta(message_data: Dict[Any, Any]) -> Dict[Any, Any]:
+        """消息中需要写入日志的元数据(不含已解析的对象)"""
+        return {k: v for k, v in message_data.items()
+                if k not in ('webhook', 'journal_id', 'notification', 'pending', 'image_bytes')}
+
+    def _restore_message(self, seq: int, meta: Dict[Any, Any], payload: Optional[bytes],
+                         store: Optional[MessageJournal] = None):
+        """从日志(或溢出文件)记录恢复消息"""
+        from models.projection import WebhookView
+
+        store = store or self.journal
         try:
-            # 从消息数据重建 EmbyWebhook 对象
-            from models.webhook import EmbyWebhook
-            webhook = EmbyWebhook.model_validate(message_data['webhook_data'])
-            
-            # 发送通知
-            await webhook_handler.send_new_media_notification(webhook)
-            
+            message_data = dict(meta)
+            message_data['webhook'] = WebhookView.parse(payload)
+            if store is self.journal:
+                message_data['journal_id'] = seq
+            return message_data
         except Exception as e:
-            logger.error(f"处理消息时发生错误: {str(e)}")
-            # 可以在这里实现重试逻辑或死信队列
\ No newline at end of file
+            logger.error(f"恢复日志中的消息 {seq} 失败: {str(e)}")
+            store.ack(seq)
+            return None
+
+    def _ack(self, message_data):
+        """在日志中确认消息已处理"""
+        if self.journal and 'journal_id' in message_data:
+            self.journal.ack(message_data['journal_id'])
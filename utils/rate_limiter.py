@@ -0,0 +1,127 @@
+import asyncio
+import time
+from typing import Dict, Optional, Union
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为允许的突发量"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """距离下一个令牌可用还需等待的秒数，0 表示立即可用"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        """在 seconds 秒内禁止发送，并清空令牌避免恢复后立即突发"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+        self.updated = self.blocked_until
+
+
+class TelegramRateLimiter:
+    """
+    Telegram Bot API 速率调度器
+
+    同时满足全局限制(每个 bot 约 30 条/秒)和单聊天限制(私聊约 1 条/秒，群组/频道约 20 条/分钟)。
+    收到 429 时按 retry_after 暂停对应聊天，并降低该聊天的速率；之后每次成功发送逐步恢复。
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        global_burst: float = 30,
+        private_rate: float = 1,
+        private_burst: float = 1,
+        group_rate: float = 20 / 60,
+        group_burst: float = 3,
+        min_rate_factor: float = 0.1,
+        recovery_factor: float = 1.05
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.min_rate_factor = min_rate_factor
+        self.recovery_factor = recovery_factor
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, chat_id: Union[int, str, None]) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._chat_buckets.get(key)
+        if bucket is None:
+            # 负数 ID 为群组或频道，限制更严格
+            if key.startswith('-'):
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            self._chat_buckets[key] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: Union[int, str, None]) -> float:
+        """等待直到可以向 chat_id 发送一条消息，返回实际等待的秒数"""
+        bucket = self._bucket(chat_id)
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            delay = max(self.global_bucket.delay(now), bucket.delay(now))
+            if delay <= 0:
+                self.global_bucket.consume(now)
+                bucket.consume(now)
+                return waited
+            # 精确休眠到下一个令牌可用，不做空转轮询
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def on_success(self, chat_id: Union[int, str, None]) -> None:
+        """发送成功后逐步恢复被降低的速率"""
+        bucket = self._bucket(chat_id)
+        if bucket.rate < bucket.base_rate:
+            bucket.rate = min(bucket.base_rate, bucket.rate * self.recovery_factor)
+
+    def on_retry_after(self, chat_id: Union[int, str, None], retry_after: float,
+                       global_scope: bool = False) -> None:
+        """根据 Telegram 返回的 retry_after 调整速率"""
+        now = time.monotonic()
+        bucket = self._bucket(chat_id)
+        bucket.block(now, retry_after)
+        bucket.rate = max(bucket.base_rate * self.min_rate_factor, bucket.rate / 2)
+        if global_scope:
+            self.global_bucket.block(now, retry_after)
+        logger.warning(
+            f"聊天 {chat_id} 触发速率限制，暂停 {retry_after} 秒，速率调整为 {bucket.rate * 60:.1f} 条/分钟"
+        )
+
+    def next_available_in(self, chat_id: Optional[Union[int, str]] = None) -> float:
+        """距离下一次可发送的秒数"""
+        now = time.monotonic()
+        delay = self.global_bucket.delay(now)
+        if chat_id is not None:
+            delay = max(delay, self._bucket(chat_id).delay(now))
+        return delay
@@ -0,0 +1,94 @@
+"""
+通知路由
+
+按媒体库、类型(Genre)、标签或条目类型把事件分发到多个频道/群组。
+NOTIFICATION_ROUTES 为 JSON 列表，每条路由的条件之间为"且"，同一条件内的多个值为"或"，
+没有任何条件的路由接收所有事件，例如:
+    [
+        {"chat_id": "-1001111111111"},
+        {"chat_id": "-1002222222222", "libraries": ["电影"], "genres": ["动作", "科幻"]},
+        {"chat_id": "-1003333333333", "tags": ["4K"], "types": ["Movie"]}
+    ]
+未配置路由时所有事件发送到 WEBHOOK_CHANNEL_ID。
+"""
+import json
+from typing import Iterable, List, Optional, Union
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+
+def _normalize(values: Optional[Iterable[str]]) -> frozenset:
+    return frozenset(str(v).casefold() for v in values or ())
+
+
+class Route:
+    """一条路由规则"""
+
+    __slots__ = ('chat_id', 'libraries', 'genres', 'tags', 'types')
+
+    def __init__(self, chat_id: Union[int, str], libraries: Iterable[str] = (), genres: Iterable[str] = (),
+                 tags: Iterable[str] = (), types: Iterable[str] = ()):
+        self.chat_id = str(chat_id)
+        self.libraries = _normalize(libraries)
+        self.genres = _normalize(genres)
+        self.tags = _normalize(tags)
+        self.types = _normalize(types)
+
+    def matches(self, item, library: str) -> bool:
+        if self.libraries and (library or '').casefold() not in self.libraries:
+            return False
+        if self.types and (item.Type or '').casefold() not in self.types:
+            return False
+        if self.genres and self.genres.isdisjoint(g.casefold() for g in item.Genres):
+            return False
+        if self.tags and self.tags.isdisjoint(t.Name.casefold() for t in item.TagItems):
+            return False
+        return True
+
+
+class NotificationRouter:
+    """根据路由表计算事件的目标聊天"""
+
+    def __init__(self, routes: List[Route]):
+        self.routes = routes
+
+    @classmethod
+    def from_config(cls, config: Union[str, list, None], default_chat_id: Optional[str]) -> "NotificationRouter":
+        if isinstance(config, str):
+            try:
+                config = json.loads(config) if config.strip() else []
+            except json.JSONDecodeError as e:
+                logger.error(f"NOTIFICATION_ROUTES 不是有效的 JSON: {str(e)}")
+                config = []
+
+        routes = []
+        for entry in config or []:
+            if not isinstance(entry, dict) or not entry.get("chat_id"):
+                logger.warning(f"忽略缺少 chat_id 的路由: {entry}")
+                continue
+            routes.append(Route(
+                entry["chat_id"],
+                libraries=entry.get("libraries"),
+                genres=entry.get("genres"),
+                tags=entry.get("tags"),
+                types=entry.get("types")
+            ))
+        if not routes and default_chat_id:
+            routes.append(Route(default_chat_id))
+        if routes:
+            logger.info(f"通知路由共 {len(routes)} 条，目标: {', '.join(r.chat_id for r in routes)}")
+        else:
+            logger.warning("未配置 NOTIFICATION_ROUTES 或 WEBHOOK_CHANNEL_ID，通知不会被发送")
+        return cls(routes)
+
+    def destinations(self, item, library: str) -> List[str]:
+        """返回事件需要发送到的聊天ID(去重并保持路由表顺序)"""
+        if item is None:
+            return []
+        result = []
+        for route in self.routes:
+            if route.chat_id not in result and route.matches(item, library):
+                result.append(route.chat_id)
+        return result
@@ -0,0 +1,78 @@
+"""
+生产环境运行方式
+
+- 安装了 uvloop / httptools 时自动使用(均为可选依赖)，不启用文件监视和自动重载
+- 进程信号由这里统一处理: 收到 SIGTERM/SIGINT 后停止接收新请求，由调用方在截止时间内排空或保存队列，
+  而不是由 uvicorn 在停止后重新触发信号直接结束进程
+"""
+import asyncio
+import contextlib
+import importlib.util
+import signal
+from typing import Awaitable, Callable
+
+import uvicorn
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def run(main: Callable[[], Awaitable]) -> None:
+    """运行主协程，安装了 uvloop 时使用 uvloop 事件循环"""
+    if _available("uvloop"):
+        import uvloop
+
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(main())
+    else:
+        asyncio.run(main())
+
+
+def server_config(app, host: str, port: int, **kwargs) -> uvicorn.Config:
+    """生产环境的 uvicorn 配置: 不自动重载，安装了 httptools 时使用它解析 HTTP"""
+    kwargs.setdefault("http", "httptools" if _available("httptools") else "h11")
+    kwargs.setdefault("access_log", False)
+    return uvicorn.Config(app, host=host, port=port, reload=False, **kwargs)
+
+
+class Server(uvicorn.Server):
+    """不接管进程信号的 uvicorn Server，停止时机由 install_shutdown_handlers 控制"""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+    def install_signal_handlers(self) -> None:
+        # uvicorn < 0.29 使用该方法安装信号处理
+        pass
+
+
+def install_shutdown_handlers(server: uvicorn.Server) -> asyncio.Event:
+    """
+    收到 SIGTERM/SIGINT 时让 server 停止接收请求(serve() 随后返回，调用方继续排空队列)，
+    再次收到信号时强制退出，返回的事件在强制退出时被设置
+    """
+    loop = asyncio.get_running_loop()
+    force = asyncio.Event()
+
+    def handle(sig: signal.Signals):
+        if server.should_exit:
+            logger.warning(f"再次收到 {sig.name}，强制退出")
+            server.force_exit = True
+            force.set()
+            return
+        logger.info(f"收到 {sig.name}，停止接收新请求并排空消息队列")
+        server.should_exit = True
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, handle, sig)
+        except (NotImplementedError, RuntimeError):
+            # Windows 或非主线程不支持，保持默认行为
+            pass
+    return force
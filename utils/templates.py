@@ -0,0 +1,294 @@
+"""
+通知说明文字模板
+
+模板语法:
+- {field}      插入字段值，按 HTML 转义
+- [[ ... ]]    可选块，块内所有字段都为空时整个块被省略
+- 其余文本原样输出，可以包含 Telegram 支持的 HTML 标签(<b>、<i>、<a href="..."> 等)
+
+模板在启动时编译为格式串，字面文本预先转义，渲染时所有字段值拼接后一次转义，再一次格式化输出。
+渲染结果超过 Telegram 长度限制时，优先截断指定字段(默认 overview)，
+仍然超长则按可见文本截断，并补全未闭合的标签，保证 HTML 有效。
+"""
+import os
+import re
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import Logger
+
+logger = Logger().get_logger()
+
+# Telegram 限制: 图片说明 1024 字符，文本消息 4096 字符
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+
+_TAG = re.compile(r'<(/?)([a-zA-Z-]+)[^>]*>')
+_BLOCK = re.compile(r'\[\[(.*?)\]\]', re.DOTALL)
+
+# 片段类型
+_TEXT = 0      # 字面文本
+_MARKUP = 1    # HTML 标签
+_FIELD = 2     # 字段
+
+ELLIPSIS = '…'
+
+# 渲染时拼接字段值的分隔符，不会出现在正常文本中
+_FIELD_SEPARATOR = '\x00'
+
+DEFAULT_TEMPLATES = {
+    'library.new': (
+        "🎬 <b>新片入库</b>\n\n"
+        "📝 <b>标题:</b> {name}\n"
+        "📚 <b>媒体库:</b> {library}\n"
+        "🗓️ <b>发行日期:</b> {premiere_date}\n"
+        "⏱ <b>入库时间:</b> {date_created}\n"
+        "💎 <b>分辨率:</b> {resolution}\n"
+        "⏳ <b>时  长:</b> {runtime}\n"
+        "📦 <b>大  小:</b> {size}\n"
+        "🎞️ <b>类  型:</b> {container}"
+        "[[\n\n📖 <b>简介:</b>\n{overview}\n]]"
+        "[[\n🏢 <b>制作公司:</b> {studios}]]"
+        "[[\n🏷 <b>标签:</b> {tags}]]"
+    ),
+    # 批量入库汇总，由 WebhookHandler.build_digest 渲染，超长时截断标题列表
+    'digest': (
+        "📦 <b>批量入库</b>\n\n"
+        "📝 <b>{title}</b>\n"
+        "📚 <b>媒体库:</b> {library}\n"
+        "🔢 <b>数  量:</b> {counts}\n"
+        "📦 <b>总大小:</b> {size}\n"
+        "⏳ <b>总时长:</b> {runtime}"
+        "[[\n\n{titles}]]"
+    ),
+    'default': (
+        "🔔 <b>{event}</b>\n\n"
+        "📝 <b>标题:</b> {name}"
+        "[[\n\n{overview}]]"
+    ),
+}
+
+
+# 超长时优先截断的字段，未列出的模板截断 overview
+TRUNCATE_FIELDS = {'digest': 'titles'}
+
+
+def escape_html(text: str) -> str:
+    """转义 Telegram HTML 模式下的特殊字符(连续 replace 比 str.translate 快一个数量级)"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def visible_length(text: str) -> int:
+    """Telegram 按 UTF-16 代码单元计算长度"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _cut_visible(text: str, budget: int) -> str:
+    """按 UTF-16 长度截取前缀"""
+    length = visible_length(text)
+    if length <= budget:
+        return text
+    if length == len(text):
+        # 没有 BMP 以外的字符，UTF-16 长度等于字符数
+        return text[:budget]
+    result = []
+    used = 0
+    for ch in text:
+        width = 2 if ord(ch) > 0xFFFF else 1
+        if used + width > budget:
+            break
+        result.append(ch)
+        used += width
+    return ''.join(result)
+
+
+def _compile_segments(source: str) -> List[Tuple[int, str]]:
+    segments = []
+    for literal, field, _, _ in Formatter().parse(source):
+        if literal:
+            pos = 0
+            for match in _TAG.finditer(literal):
+                if match.start() > pos:
+                    segments.append((_TEXT, literal[pos:match.start()]))
+                segments.append((_MARKUP, match.group(0)))
+                pos = match.end()
+            if pos < len(literal):
+                segments.append((_TEXT, literal[pos:]))
+        if field is not None:
+            segments.append((_FIELD, field))
+    return segments
+
+
+def _compile_format(segments: List[Tuple[int, str]]) -> Tuple[str, List[str], int]:
+    """
+    返回 (str.format 格式串, 按出现顺序的字段名, 字面文本可见长度)
+
+    字面文本预先转义，字段位置为 {}，多个块的格式串可以直接拼接
+    """
+    pattern = []
+    names = []
+    static_length = 0
+    for kind, value in segments:
+        if kind == _FIELD:
+            pattern.append('{}')
+            names.append(value)
+        else:
+            text = value if kind == _MARKUP else escape_html(value)
+            pattern.append(text.replace('{', '{{').replace('}', '}}'))
+            if kind == _TEXT:
+                static_length += visible_length(value)
+    return ''.join(pattern), names, static_length
+
+
+class CompiledTemplate:
+    """编译后的模板"""
+
+    def __init__(self, source: str, truncate_field: str = 'overview'):
+        self.source = source
+        self.truncate_field = truncate_field
+        # [(可选块字段列表或 None, 片段列表)]
+        self.blocks: List[Tuple[Optional[List[str]], List[Tuple[int, str]]]] = []
+        pos = 0
+        for match in _BLOCK.finditer(source):
+            if match.start() > pos:
+                self.blocks.append((None, _compile_segments(source[pos:match.start()])))
+            segments = _compile_segments(match.group(1))
+            self.blocks.append(([value for kind, value in segments if kind == _FIELD], segments))
+            pos = match.end()
+        if pos < len(source):
+            self.blocks.append((None, _compile_segments(source[pos:])))
+        # 快速路径: 每个块预先编译为格式串并计算字面文本的可见长度，渲染时只处理字段
+        self._fast_blocks = [(fields, *_compile_format(segments)) for fields, segments in self.blocks]
+        # 出现的块组合 -> 拼接后的格式串
+        self._formats: Dict[Tuple[bool, ...], str] = {}
+
+    def _tokens(self, values: Dict[str, object]) -> List[Tuple[int, Optional[str], str]]:
+        """展开可选块，返回 (类型, 字段名, 未转义文本) 列表"""
+        tokens = []
+        for fields, segments in self.blocks:
+            if fields is not None and not any(values.get(f) for f in fields):
+                continue
+            for kind, value in segments:
+                if kind == _FIELD:
+                    field_value = values.get(value)
+                    tokens.append((_FIELD, value, '' if field_value is None else str(field_value)))
+                else:
+                    tokens.append((kind, None, value))
+        return tokens
+
+    def render(self, values: Dict[str, object], limit: int = CAPTION_LIMIT) -> str:
+        """渲染模板，保证可见长度不超过 limit"""
+        texts = []
+        active = []
+        static_length = 0
+        for fields, _, names, block_static_length in self._fast_blocks:
+            if fields is not None:
+                for field in fields:
+                    if values.get(field):
+                        break
+                else:
+                    active.append(False)
+                    continue
+            active.append(True)
+            static_length += block_static_length
+            for name in names:
+                value = values.get(name)
+                texts.append('' if value is None else value if type(value) is str else str(value))
+
+        # 每个字符最多占两个 UTF-16 代码单元，上界不超过 limit 时(绝大多数消息)无需计算准确的可见长度
+        if static_length + 2 * sum(map(len, texts)) > limit:
+            total = static_length + sum(map(visible_length, texts))
+            if total > limit:
+                return self._render_limited(values, active, texts, total, limit)
+        return self._format(active, texts)
+
+    def _format(self, active: List[bool], texts: List[str]) -> str:
+        """所有字段值拼接后一次转义，再填入这组块对应的格式串"""
+        if texts:
+            escaped = escape_html(_FIELD_SEPARATOR.join(texts)).split(_FIELD_SEPARATOR)
+            if len(escaped) != len(texts):
+                # 字段值中含有分隔符
+                escaped = [escape_html(text) for text in texts]
+        else:
+            escaped = texts
+        key = tuple(active)
+        pattern = self._formats.get(key)
+        if pattern is None:
+            pattern = self._formats[key] = ''.join(
+                block[1] for block, is_active in zip(self._fast_blocks, active) if is_active
+            )
+        return pattern.format(*escaped)
+
+    def _render_limited(self, values: Dict[str, object], active: List[bool], texts: List[str],
+                        total: int, limit: int) -> str:
+        """超长时的慢路径: 先缩短指定字段，仍然超长再按可见文本整体截断"""
+        names = [name for block, is_active in zip(self._fast_blocks, active) if is_active for name in block[2]]
+        if self.truncate_field in names:
+            index = names.index(self.truncate_field)
+            text = texts[index]
+            if text:
+                length = visible_length(text)
+                keep = max(0, length - (total - limit) - len(ELLIPSIS))
+                texts[index] = (_cut_visible(text, keep).rstrip() + ELLIPSIS) if keep else ''
+                total -= length - visible_length(texts[index])
+                if total <= limit:
+                    return self._format(active, texts)
+                values = {**values, self.truncate_field: texts[index]}
+        return self._render_truncated(self._tokens(values), limit)
+
+    @staticmethod
+    def _render_truncated(tokens, limit: int) -> str:
+        """按可见文本截断并闭合未结束的标签"""
+        parts = []
+        open_tags = []
+        budget = limit - len(ELLIPSIS)
+        for kind, _, text in tokens:
+            if kind == _MARKUP:
+                match = _TAG.match(text)
+                if match:
+                    if match.group(1):
+                        if open_tags and open_tags[-1] == match.group(2).lower():
+                            open_tags.pop()
+                    else:
+                        open_tags.append(match.group(2).lower())
+                parts.append(text)
+                continue
+            length = visible_length(text)
+            if length <= budget:
+                parts.append(escape_html(text))
+                budget -= length
+                continue
+            parts.append(escape_html(_cut_visible(text, budget)) + ELLIPSIS)
+            break
+        # 截断点之后的结束标签不会再输出，在这里补齐
+        parts.extend(f"</{tag}>" for tag in reversed(open_tags))
+        return ''.join(parts)
+
+
+class TemplateEngine:
+    """
+    按事件类型管理编译后的模板
+
+    可以通过 template_dir 中的 <事件类型>.html 文件覆盖默认模板，例如 library.new.html。
+    """
+
+    def __init__(self, template_dir: Optional[str] = None, templates: Optional[Dict[str, str]] = None):
+        sources = dict(DEFAULT_TEMPLATES)
+        if templates:
+            sources.update(templates)
+        if template_dir and os.path.isdir(template_dir):
+            for filename in sorted(os.listdir(template_dir)):
+                if filename.endswith('.html'):
+                    with open(os.path.join(template_dir, filename), encoding='utf-8') as f:
+                        sources[filename[:-len('.html')]] = f.read()
+                    logger.info(f"已加载通知模板: {filename}")
+        self.templates = {
+            event: CompiledTemplate(source, TRUNCATE_FIELDS.get(event, 'overview'))
+            for event, source in sources.items()
+        }
+
+    def render(self, event_type: str, values: Dict[str, object], limit: int = CAPTION_LIMIT) -> str:
+        template = self.templates.get(event_type) or self.templates['default']
+        return template.render(values, limit)